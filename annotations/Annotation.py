@@ -18,18 +18,76 @@ a match.
 
 import re
 import ast # abstract syntext tree for prasing the span's as tuple
+import sys
+import time
 from datetime import datetime
 #from xml.etree.ElementTree import Element, SubElement
-from lxml.etree import Element, SubElement
 from hai_exceptions.exceptions import MalformedeHostExcelRow, MalformedSpanValue
 
+_creation_date = [None, None] # [second, formatted date]
+
+def get_creation_date():
+    """
+    Returns the current time formatted for the creationDate of an eHOST annotation.
+    The date is only formatted once per second and is shared by every annotation created in that second.
+    """
+    now = int(time.time())
+    if _creation_date[0] != now:
+        _creation_date[0] = now
+        _creation_date[1] = sys.intern(datetime.fromtimestamp(now).strftime('%m%d%Y %H:%M:%S'))
+    return _creation_date[1]
+
+
+def _intern(value):
+    "Interns strings so that annotations with the same values share them"
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+class _Span(object):
+    """
+    A (start, end) span that is stored as two int slots instead of a tuple.
+    Values that aren't a pair, like None or the '--' of a null annotation, are stored as is.
+    """
+    def __init__(self, start_slot, end_slot):
+        self.start_slot = start_slot
+        self.end_slot = end_slot
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        end = getattr(obj, self.end_slot)
+        if end is None:
+            return getattr(obj, self.start_slot)
+        return getattr(obj, self.start_slot), end
+
+    def __set__(self, obj, value):
+        if isinstance(value, (tuple, list)) and len(value) == 2:
+            setattr(obj, self.start_slot, int(value[0]))
+            setattr(obj, self.end_slot, int(value[1]))
+        else:
+            setattr(obj, self.start_slot, value)
+            setattr(obj, self.end_slot, None)
+
+
 class Annotation(object):
     """
     This class represents an annotation of a medical concept from text.
     It can be initialized either from an eHOST knowtator.xml annotation
     or from a pyConText markup.
+    Corpus-wide evaluations keep millions of annotations in memory,
+    so instances use __slots__, spans are stored as ints
+    and annotations created from a document share the document's text instead of copying their sentence.
     """
 
+    __slots__ = ('rpt_id', 'id', 'sentence_num', 'annotation_type', 'attributes', 'modifier_categories',
+                 'markup_category', 'annotator', 'datetime', '_classification', '_text', '_document_text',
+                 '_start', '_end', '_sentence_start', '_sentence_end', 'lexicon_version')
+
+    span_in_document = _Span('_start', '_end')
+    span_in_sentence = _Span('_sentence_start', '_sentence_end')
+
     # Dictionary mapping pyConText target types to eHOST class names
     # pyConText target => Annotation.annotation_type
     _annotation_schema = {'organ-space surgical site infection': 'Evidence of SSI',
@@ -64,11 +122,11 @@ class Annotation(object):
     }
 
     def __init__(self):
-        self.sentence = None
-        self.datetime = datetime.now().strftime('%m%d%Y %H:%M:%S') # TODO: Change this to match eHOST
+        self.datetime = get_creation_date() # TODO: Change this to match eHOST
         self.rpt_id = ''
         self.id = ''  # TODO: Change this
-        self.text = None
+        self._text = None
+        self._document_text = None # The text of the document that `text` is a sentence in
         self.sentence_num = None
         self.span_in_sentence = None
         self.span_in_document = None
@@ -80,14 +138,35 @@ class Annotation(object):
 
 
         # These attributes will only be populated if this annotation is instantiated from a markup
-        self.modifier_categories = []
+        self.modifier_categories = ()
         self.markup_category = None
         # Will eventually be 'Positive Evidence of SSI', 'Negated Evidence of Pneumonia', ...
         self._classification = None
         self.annotator = None
+        # The `lexicon_version` of the model that created this annotation
+        self.lexicon_version = None
 
 
 
+    @property
+    def text(self):
+        """
+        The text of the annotation.
+        If the annotation references its document's text, the sentence is only rebuilt when it's needed.
+        """
+        if self._text is None and self._document_text is not None:
+            start, end = self.span_in_document
+            return ' '.join(self._document_text[start:end].lower().split())
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+        self._document_text = None
+
+    # The whole sentence is the text of the annotation
+    sentence = text
+
     @property
     def classification(self):
         return self._classification
@@ -97,7 +176,22 @@ class Annotation(object):
 
 
     def from_ehost(self, xml_tag):
-        pass
+        """
+        Sets the id, annotator, span, text and creation date from an `<annotation>` element of a knowtator xml file.
+        The class and attributes are in `<classMention>` and `<stringSlotMention>` elements
+        that refer to the annotation by its mention id. They're set by `KnowtatorReader.read_knowtator()`.
+        """
+        mention = xml_tag.find('mention')
+        self.id = mention.get('id') if mention is not None else ''
+        self.annotator = _intern(xml_tag.findtext('annotator'))
+        # An annotation can have several spans, so it covers all of them
+        spans = [(int(span.get('start')), int(span.get('end'))) for span in xml_tag.iterfind('span')]
+        if spans:
+            self.span_in_document = (min(start for start, end in spans), max(end for start, end in spans))
+        self.text = xml_tag.findtext('spannedText')
+        creation_date = xml_tag.findtext('creationDate')
+        if creation_date is not None:
+            self.datetime = _intern(creation_date)
 
     def from_ehost_xlsx(self, row):
         ''' frst check and make sure the row is wellformed'''
@@ -110,10 +204,9 @@ class Annotation(object):
         self.rpt_id = row[0].value
 
 
-        self.sentence = row[2].value
         self.text = row[2].value
         self.annotator = "Gold Standard" # TODO: find a better way to set annotator
-        self.annotation_type = row[4].value
+        self.annotation_type = _intern(row[4].value)
         my_tuple = None
         # print(row[3].value)
         try:
@@ -135,19 +228,20 @@ class Annotation(object):
             cell = row[i]
             if (cell.value is not None):
                 if (i % 2 == 1 and i < col_size-1):
-                    self.attributes[cell.value] = row[i+1].value
+                    self.attributes[_intern(cell.value)] = _intern(row[i+1].value)
         self.classify()
         pass
 
 
 
 
-    def from_markup(self, tag_object, markup, sentence, sentence_span, rpt_id):
+    def from_markup(self, tag_object, markup, sentence, sentence_span, rpt_id, document_text=None):
         """
         Takes a markup and a tag_object, a target node from that markup.
         Sentence is the raw text.
         Sentence_span is the span of the sentence in the document
         and is used to update the span for the markup, which is at a sentence level.
+        If `document_text` is given, the annotation references the sentence in it instead of storing `sentence`.
         Returns a single annotation object.
 
         The tag_object can be obtained by iterating through the list
@@ -159,10 +253,10 @@ class Annotation(object):
         self.rpt_id = rpt_id
 
         # Get category of target
-        self.markup_category = tag_object.getCategory()[0]
+        self.markup_category = sys.intern(tag_object.getCategory()[0])
 
         # Find all modifier categories
-        self.modifier_categories.extend([mod.getCategory()[0] for mod in markup.getModifiers(tag_object)])
+        self.modifier_categories = tuple(sys.intern(mod.getCategory()[0]) for mod in markup.getModifiers(tag_object))
 
         # Make sure this is an annotation class that we recognize
         #if self.markup_category not in self._annotation_schema:
@@ -194,10 +288,15 @@ class Annotation(object):
         self.span_in_document = sentence_span
 
         # Add the text for the whole sentence
-        self.sentence = sentence
         # And for the annotation itself
         #self.text = sentence[self.span_in_sentence[0]:self.span_in_sentence[1]]
         self.text = sentence
+        if document_text is not None:
+            # Reference the sentence in the document instead of keeping a copy
+            self._document_text = document_text
+            self._text = None
+            if self.text != sentence:
+                self.text = sentence
 
 
         # Update attributes
@@ -379,8 +478,8 @@ class Annotation(object):
         # Exclude any annotations of a surgical site infection that doesn't have anatomy
         # TODO: Implement coreference resolution in `from_markup()`
 
-        self._classification = classification
-        return classification
+        self._classification = sys.intern(classification)
+        return self._classification
 
 
 
@@ -434,6 +533,8 @@ class Annotation(object):
         It returns two etree elements, annotation_body and class_mention.
         eHOST uses both of these to display an annotation.
         """
+        # lxml is only needed to build trees, so it isn't imported by every process that creates annotations
+        from lxml.etree import Element, SubElement
         elements_to_rtn = []  #  A list of elements that will be returned
                               #  and then appended to the body
         annotation_body = Element('annotation')
@@ -0,0 +1,164 @@
+"""
+This module defines `AnnotationExporter`, which saves annotations as rows of a table
+in JSON Lines or Parquet files so that they can be analyzed without parsing knowtator xml.
+Each annotation is one row with the columns in `COLUMNS`.
+
+Like `KnowtatorArchive`, every exporter writes its own part file to a directory,
+so several processes can export to the same directory.
+Rows are buffered and written in batches of `batch_size`. A part file is only moved into place when it's closed.
+Writing Parquet requires pyarrow 7.0 or later, which added `RecordBatch.from_pylist`.
+
+Example:
+    with AnnotationExporter('export', export_format='parquet') as exporter:
+        for document in documents:
+            exporter.add(document)
+    # Then, for example: pyarrow.dataset.dataset('export', format='parquet')
+"""
+import os
+import json
+
+from annotations.KnowtatorArchive import get_part_name
+
+
+EXPORT_FORMATS = ('jsonl', 'parquet')
+MIN_PYARROW_VERSION = (7, 0)
+
+COLUMNS = ['rpt_id', 'annotator', 'id', 'sentence_num', 'span_start', 'span_end', 'annotation_type',
+           'assertion', 'temporality', 'ssi_class', 'classification', 'modifier_categories',
+           'lexicon_version']
+
+
+def get_parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('rpt_id', pa.string()),
+        ('annotator', pa.string()),
+        ('id', pa.string()),
+        ('sentence_num', pa.int64()),
+        ('span_start', pa.int64()),
+        ('span_end', pa.int64()),
+        ('annotation_type', pa.string()),
+        ('assertion', pa.string()),
+        ('temporality', pa.string()),
+        ('ssi_class', pa.string()),
+        ('classification', pa.string()),
+        ('modifier_categories', pa.list_(pa.string())),
+        ('lexicon_version', pa.string()),
+    ])
+
+
+def get_record(annotation):
+    """
+    Returns a dictionary with a value for each column in `COLUMNS`.
+    """
+    span = annotation.span_in_document
+    # Annotations without a match have a span of '--'
+    start, end = span if isinstance(span, (tuple, list)) and len(span) == 2 else (None, None)
+    return {
+        'rpt_id': annotation.rpt_id,
+        'annotator': annotation.annotator,
+        'id': annotation.id,
+        'sentence_num': annotation.sentence_num,
+        'span_start': start,
+        'span_end': end,
+        'annotation_type': annotation.annotation_type,
+        'assertion': annotation.attributes.get('assertion'),
+        'temporality': annotation.attributes.get('temporality'),
+        'ssi_class': annotation.attributes.get('ssi_class'),
+        'classification': annotation.classification,
+        'modifier_categories': list(annotation.modifier_categories),
+        'lexicon_version': annotation.lexicon_version,
+    }
+
+
+class AnnotationExporter(object):
+    """
+    Writes a row for every annotation to a new part file in `outdir`.
+    `export_format` is either 'jsonl' or 'parquet'.
+    If `annotators` is given, only the annotations of those annotators are exported.
+    `close()` must be called to save the file.
+    """
+
+    def __init__(self, outdir, export_format='jsonl', batch_size=10000, annotators=None):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError("export_format must be one of {}, not {}".format(EXPORT_FORMATS, export_format))
+        if not os.path.isdir(outdir):
+            raise FileNotFoundError("{} is not a directory".format(outdir))
+        self.export_format = export_format
+        self.batch_size = batch_size
+        self.annotators = annotators
+        self.filepath = os.path.join(outdir, get_part_name() + '.' + export_format)
+        self.num_rows = 0
+        self.batch = []
+        if export_format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Exporting to Parquet requires pyarrow")
+            if tuple(int(part) for part in pyarrow.__version__.split('.')[:2]) < MIN_PYARROW_VERSION:
+                raise ImportError("Exporting to Parquet requires pyarrow {}.{} or later, not {}".format(
+                    *MIN_PYARROW_VERSION, pyarrow.__version__))
+            self.schema = get_parquet_schema()
+            self.f = pq.ParquetWriter(self.filepath + '.tmp', self.schema)
+        else:
+            self.f = open(self.filepath + '.tmp', 'w', encoding='utf-8')
+
+
+    def add(self, document):
+        """
+        Adds the annotations of every annotator of the ClinicalTextDocument `document`.
+        """
+        for annotator, annotations in document.annotations.items():
+            if self.annotators is None or annotator in self.annotators:
+                self.add_annotations(annotations)
+
+
+    def add_annotations(self, annotations):
+        for annotation in annotations:
+            self.batch.append(get_record(annotation))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Writes the buffered rows.
+        """
+        if not self.batch:
+            return
+        if self.export_format == 'parquet':
+            import pyarrow as pa
+            self.f.write_batch(pa.RecordBatch.from_pylist(self.batch, schema=self.schema))
+        else:
+            self.f.write(''.join(json.dumps(record) + '\n' for record in self.batch))
+        self.num_rows += len(self.batch)
+        self.batch = []
+
+
+    def close(self):
+        if self.f is None:
+            return
+        self.flush()
+        self.f.close()
+        self.f = None
+        os.replace(self.filepath + '.tmp', self.filepath)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_jsonl(outdir):
+    """
+    Yields every row exported to JSON Lines files in `outdir`.
+    """
+    for filename in sorted(os.listdir(outdir)):
+        if filename.startswith('part-') and filename.endswith('.jsonl'):
+            with open(os.path.join(outdir, filename), encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
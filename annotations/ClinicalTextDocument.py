@@ -2,19 +2,76 @@
 This module defines classes that are used to represent texts and annotations.
 """
 import os
+import re
+import heapq
 from collections import defaultdict
 
-from nltk.tokenize import WhitespaceTokenizer
-
 #import xml.etree.ElementTree as ElementTree
 #from xml.etree.ElementTree import Element, SubElement
 
-from lxml import etree
-from lxml.etree import Element, SubElement
-
 from utils import helpers
 from annotations.Annotation import Annotation, AnnotationComparison
-from models.mention_level_models import MentionLevelModel
+from annotations.KnowtatorWriter import KnowtatorWriter
+from annotations.SentenceTable import SentenceTable
+from annotations.SentenceSplitter import SentenceSplitter, TERMINATION_POINTS, TERMINATION_WORDS, EXCEPTION_WORDS
+
+# The words of `str.split()`, which `split_sentences` pairs with these spans
+_token = re.compile(r'\S+')
+
+
+def _get_valid_span(annotation):
+    """
+    Returns `span_in_document` as (start, end) or None if it isn't a non-empty span.
+    Annotations without a valid span never overlap with another annotation.
+    """
+    try:
+        start, end = annotation.span_in_document
+        if start < end:
+            return start, end
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def find_overlapping_annotations(annotations, other_annotations):
+    """
+    Finds every pair of annotations of the same annotation type with overlapping spans
+    by sweeping over the start points of both lists.
+    Returns a dictionary mapping id(annotation) to the list of other_annotations
+    whose spans overlap, in the order that they appear in `other_annotations`.
+    These are candidates: `Annotation.isOverlap` still decides whether they overlap by enough.
+    Runs in O((A + B) log (A + B) + number of overlapping pairs).
+    """
+    # (start, end, side, position) sorted by start. side is 0 for `annotations`, 1 for `other_annotations`
+    starts = []
+    for side, annos in enumerate((annotations, other_annotations)):
+        for position, annotation in enumerate(annos):
+            span = _get_valid_span(annotation)
+            if span is not None:
+                starts.append((span[0], span[1], side, position))
+    starts.sort()
+
+    overlaps = defaultdict(set) # position in annotations: {positions in other_annotations}
+    # For each side, {annotation_type: {positions}} of spans that have started but haven't ended yet
+    active = (defaultdict(set), defaultdict(set))
+    ends = [] # Heap of (end, side, position)
+    for start, end, side, position in starts:
+        # Spans that end at or before this start can't overlap with it
+        while ends and ends[0][0] <= start:
+            _, ended_side, ended_position = heapq.heappop(ends)
+            ended_type = (annotations, other_annotations)[ended_side][ended_position].annotation_type
+            active[ended_side][ended_type].discard(ended_position)
+        annotation_type = (annotations, other_annotations)[side][position].annotation_type
+        for other_position in active[1 - side][annotation_type]:
+            if side == 0:
+                overlaps[position].add(other_position)
+            else:
+                overlaps[other_position].add(position)
+        active[side][annotation_type].add(position)
+        heapq.heappush(ends, (end, side, position))
+
+    return {id(annotations[position]): [other_annotations[i] for i in sorted(other_positions)]
+            for position, other_positions in overlaps.items()}
 
 
 class ClinicalTextDocument(object):
@@ -25,19 +82,25 @@ class ClinicalTextDocument(object):
     OR `filepath`, a filepath to a single report.
     In order to preserve the initial document spans,
     this is saved as an attribute `raw_text`.
+    Sentences are found by `sentence_splitter`.
+    If it's None, `split_sentences()` walks through the words of the document instead.
     """
 
+    sentence_splitter = SentenceSplitter()
+
 
     def __init__(self, text=None, rpt_id='', filepath=None):
 
         self.split_text_and_spans = None
-        self.sentences = [] # This will be a list of dictionairies
-                         # where each dict contains {
+        self.sentences = SentenceTable() # Each sentence can be read like a dictionary
+                         # {
                          # 'idx': int, 'text': sentence, 'word_spans': [(start, end), ...], 'span': (start, end)
                          # }
         self.annotations = defaultdict(list) # annotator: [annotations, ...]
         self.rpt_id = os.path.splitext(rpt_id)
         self.sentences_with_annotations = []
+        # Sentences that a SentenceGuard marked up in smaller windows because they were too slow
+        self.degraded_sentences = set()
         self.element_tree = None
         self.filepath = filepath
 
@@ -51,7 +114,6 @@ class ClinicalTextDocument(object):
 
         self.raw_text = text
         self.rpt_id = rpt_id
-        self.original_spans = self.get_text_spans(text)
         self.preprocessed_text = self.preprocess(text)
 
         # self.split_text_and_spans = None
@@ -65,7 +127,18 @@ class ClinicalTextDocument(object):
 
         # Split into sentences
         # While maintaining the original text spans
-        self.sentences = self.split_sentences(self.preprocessed_text, self.original_spans)
+        if self.sentence_splitter is not None and len(self.preprocessed_text) == len(text):
+            # The spans in the preprocessed text are the same as in the original text
+            self.sentences = self.sentence_splitter.split(self.preprocessed_text)
+        else:
+            self.sentences = self.split_sentences(self.preprocessed_text, self.get_text_spans(text))
+
+    @property
+    def original_spans(self):
+        """
+        The (start, end) of every whitespace-separated token in the document.
+        """
+        return self.sentences.get_token_spans()
 
     def cal_diff_score(self, other):
 
@@ -99,8 +172,7 @@ class ClinicalTextDocument(object):
         :param text: [str]
         :return: a list of two-tuples representing individual tokens and their spans
         """
-        span_generator = WhitespaceTokenizer().span_tokenize(text)
-        return list(span_generator)
+        return [match.span() for match in _token.finditer(text)]
 
 
     def preprocess(self, text):
@@ -125,70 +197,37 @@ class ClinicalTextDocument(object):
         Iterates through tokens in text.split().
         At each termination point, a new sentence is started
         unless that token is part of the exception words.
-        :return:
-            `sentences`: a list of lists of words split by whitespace
-                - [['this', 'is', 'a', 'sentence'],
-                  ['and', 'this', 'is', 'another.']]
-            `word_spans`: a list lists of two-tuples representing word start and end points
-                - [[(0, 4), (5, 7), (8, 9), (10, 19)],
-                  [(20, 23), (24, 28), (29, 31), (32, 40)]]
-            `sentence_spans`: a list of start and end point for sentences
-                - [(0, 19), (20, 40)])
-            list of sentences and spans
+        :return: a SentenceTable with the spans of the words in each sentence.
+            Each sentence can be read like a dictionary:
+            {'idx': 0, 'text': 'this is a sentence', 'words': ['this', 'is', 'a', 'sentence'],
+             'span': (0, 19), 'word_spans': [(0, 4), (5, 7), (8, 9), (10, 19)]}
         """
 
-        termination_points = '.!?;'
-        termination_words = ['a/p:'] # Words to terminate at that we didn't catch in preprocessing
-        exception_words = ['dr.', 'm.d', 'mr.', 'ms.', 'mrs.', ]
+        termination_points = TERMINATION_POINTS
+        termination_words = TERMINATION_WORDS # Words to terminate at that we didn't catch in preprocessing
+        exception_words = EXCEPTION_WORDS
         # Find header points before splitting the text
         #headers = helpers.find_headers(text)
         #header_points = [m.span()[0] for m in headers]
 
         words = text.split()
 
-        sentences = [] # List of list of words
-        #word_spans = [] # List of list of start, end points for words
-        #sentence_spans = [] # List of start, end points for sentences
+        # Words are sliced from `text` when they're read
+        # unless preprocessing changed its length and the spans no longer line up
+        raw_text = getattr(self, 'raw_text', None)
+        sentences = SentenceTable(text, words=[] if raw_text is not None and len(raw_text) != len(text) else None)
 
-        idx = 0
-        sentence_dict = {}
-        current_sentence = []
-        current_spans = []
-        for word, span in zip(words, spans):
-            # Populate `current_sentence` with words
-            # and `current_spans` with spans for each word
-            current_sentence.append(word)
-            current_spans.append(span)
+        for word, (start, end) in zip(words, spans):
+            sentences.add_token(start, end, word)
 
             # If you reach a termination point and it's not one of the above exception words,
-            # append this sentence and start a new one
+            # end this sentence and start a new one
             if (word in termination_words) or (word[-1] in termination_points and word not in exception_words):
                     #span[1] in header_points:  # Took this out, instead added a period in preprocessing
-                # Add `current_sentence` and `current_spans` to larger lists
-                sentence_dict['text'] = ' '.join(current_sentence)
-                sentence_dict['words'] = current_sentence
-                sentence_dict['idx'] = idx
-                sentence_dict['span'] = (current_spans[0][0], current_spans[-1][-1])
-                sentence_dict['word_spans'] = current_spans
-                sentences.append(sentence_dict)
-                #if span[1] in header_points:
-                #    print("Split at header")
-                #    print(' '.join(current_sentence))
-
-                # Start a new sentence
-                idx += 1
-                sentence_dict = {}
-                current_sentence = []
-                current_spans = []
+                sentences.end_sentence()
 
         # Take care of any words remaining
-        if len(current_sentence):
-            sentence_dict['text'] = ' '.join(current_sentence)
-            sentence_dict['words'] = current_sentence
-            sentence_dict['idx'] = idx
-            sentence_dict['span'] = (current_spans[0][0], current_spans[-1][-1])
-            sentence_dict['word_spans'] = current_spans
-            sentences.append(sentence_dict)
+        sentences.end_sentence()
 
         return sentences
 
@@ -197,28 +236,75 @@ class ClinicalTextDocument(object):
         This methods takes a MentionLevelModel that identifies targets and modifiers.
         For each sentence in self.sentences, the model identifies all findings using pyConText.
         These markups are then used to create Annotations and are added to `sentence['annotations']`
+        If `model` is a ReloadableModel, every sentence is annotated with the version that was current when this started.
         """
+        model = model.pin()
         self.annotations['hai_detect'] = []
+        self.degraded_sentences = set()
         annotations = self.annotations['hai_detect']
-        to_exclude = ['infection', 'discharge']
         for sentence_num, sentence in enumerate(self.sentences):
-            markup = model.markup_sentence(sentence['text'])
-            targets = markup.getMarkedTargets()
+            for annotation in self.annotate_sentence(model, sentence_num, sentence):
+                self.sentences_with_annotations.append(sentence_num)
+                annotations.append(annotation)
 
-            sentence_annotations = []
-            for target in targets:
+    def annotate_sentence(self, model, sentence_num, sentence=None, markup=None):
+        """
+        Returns the annotations that `model` finds in sentence number `sentence_num`.
+        If `markup` is given, the annotations are created from it instead of marking up the sentence again.
+        If the model has a SentenceGuard, a long sentence is marked up in windows
+        and the annotations of all of its windows are pruned together.
+        Sentences that the guard degraded are added to `degraded_sentences`.
+        """
+        model = model.pin()
+        if sentence is None:
+            sentence = self.sentences[sentence_num]
+        to_exclude = ['infection', 'discharge']
+        degraded = False
+        if markup is None:
+            markups, degraded = model.markup_windows(sentence['text'])
+        else:
+            markups = [(0, markup)]
+        if degraded:
+            self.degraded_sentences.add(sentence_num)
+        else:
+            self.degraded_sentences.discard(sentence_num)
+
+        sentence_annotations = []
+        for offset, markup in markups:
+            for target in markup.getMarkedTargets():
                 annotation = Annotation()
-                annotation.from_markup(target, markup, sentence['text'], sentence['span'], rpt_id=self.rpt_id)
+                annotation.from_markup(target, markup, sentence['text'], sentence['span'], rpt_id=self.rpt_id,
+                                       document_text=self.raw_text)
                 # If classification is None, this markup should be disregarded
                 if not annotation.classification:
                     continue
+                if offset:
+                    start, end = annotation.span_in_sentence
+                    annotation.span_in_sentence = (start + offset, end + offset)
                 annotation.sentence_num = sentence_num
+                annotation.lexicon_version = model.lexicon_version
                 sentence_annotations.append(annotation)
-            sentence_annotations = self.prune_annotations(sentence_annotations)
-            for annotation in sentence_annotations:
-                if annotation.annotation_type not in to_exclude:
-                    self.sentences_with_annotations.append(sentence_num)
-                    annotations.append(annotation)
+        sentence_annotations = self.prune_annotations(sentence_annotations)
+        sentence_annotations = [a for a in sentence_annotations if a.annotation_type not in to_exclude]
+        if model.profile is not None:
+            for offset, markup in markups:
+                model.profile.add_annotations(sentence_annotations, markup)
+        return sentence_annotations
+
+    def reannotate(self, model, sentence_nums):
+        """
+        Replaces the hai_detect annotations of the sentences in `sentence_nums` with the annotations `model` finds.
+        The annotations of every other sentence are kept.
+        """
+        model = model.pin()
+        sentence_nums = set(sentence_nums)
+        annotations = [a for a in self.annotations['hai_detect'] if a.sentence_num not in sentence_nums]
+        for sentence_num in sorted(sentence_nums):
+            annotations.extend(self.annotate_sentence(model, sentence_num))
+        # sorted() is stable, so annotations in the same sentence keep their order
+        annotations.sort(key=lambda annotation: annotation.sentence_num)
+        self.annotations['hai_detect'] = annotations
+        self.sentences_with_annotations = [annotation.sentence_num for annotation in annotations]
 
     def prune_annotations(self, annotations):
         """
@@ -245,6 +331,8 @@ class ClinicalTextDocument(object):
         This method iterates through the dictionary in self.annotations
         where keys are annotator names and values are Annotation objects.
         Finds annotations that overlap.
+        Overlapping pairs are found with a sweep over the spans of each annotation type
+        instead of comparing every gold annotation to every system annotation.
         :param gold: the name of the gold standard annotator
         :param categories: a list of categories to compare
         """
@@ -254,20 +342,25 @@ class ClinicalTextDocument(object):
 
         gold_annotations = self.annotations[gold]
         other_annotations = self.annotations['hai_detect']
-        matched_gold_annotations = []
-        matched_other_annotations = []
+
+        # Find the candidate system annotations for each gold annotation
+        # id(gold annotation): [overlapping system annotation, ...]
+        candidates = find_overlapping_annotations(
+            [a for a in gold_annotations if a.annotation_type in categories], other_annotations)
+
+        matched_other_annotations = set() # ids of system annotations that overlapped a gold annotation
         for gold_annotation in gold_annotations:
             had_overlap = False # This will keep track of whether a gold annotation had at least one match
             annotation_type = gold_annotation.annotation_type
             if annotation_type not in categories:
                 continue
-            for other_annotation in other_annotations:
+            for other_annotation in candidates.get(id(gold_annotation), []):
                 overlaps = gold_annotation.isOverlap(other_annotation)
                 # AnnotationComparison 1: two annotations overlap
                 if overlaps: # If it overlaps, compare the two annotations
                     had_overlap = True
                     # Compare the two annotations, save the comparison
-                    matched_other_annotations.append(other_annotation)
+                    matched_other_annotations.add(id(other_annotation))
                     comparison = gold_annotation.compare(other_annotation)
                     comparisons.append(comparison)
            # AnnotationComparison 2: A gold standard didn't overlap with any annotations
@@ -276,9 +369,12 @@ class ClinicalTextDocument(object):
                 empty_comparison = AnnotationComparison(a=gold_annotation, b=None)
                 comparisons.append(empty_comparison)
 
-        # AnnotationComparison 3: A gold standard didn't overlap with any annotations
+        # AnnotationComparison 3: A system annotation didn't overlap with any gold annotations
         # Now go through all of the system annotations that didn't have a match to compute to create empty comparisons
-        for anno in set(other_annotations).difference(set(matched_other_annotations)):
+        for anno in other_annotations:
+            if id(anno) in matched_other_annotations:
+                continue
+            matched_other_annotations.add(id(anno)) # Only add one comparison for each annotation
             empty_comparison = AnnotationComparison(a=None, b=anno)
             comparisons.append(empty_comparison)
 
@@ -298,6 +394,7 @@ class ClinicalTextDocument(object):
         """
         Creates an eTree XML element
         """
+        from lxml.etree import Element, SubElement
         root = Element('annotations')
         root.set('textSource', self.rpt_id + '.txt')
         # TODO:
@@ -339,22 +436,29 @@ class ClinicalTextDocument(object):
 
 
 
-    def to_knowtator(self, outdir):
+    def to_knowtator(self, outdir, verbose=True):
         """
         This method saves all annotations in an instance of ClinicalTextDocument to a .knowtator.xml file
         to be imported into eHOST.
         outdir is the directory to which the document will be saved.
         The outpath will be '/path/to/outdir/rpt_id.knowtator.xml'
+        If verbose is False, the outpath isn't printed.
         """
         if not os.path.isdir(outdir):
             raise FileNotFoundError("{} is not a directory".format(outdir))
         outpath = os.path.join(outdir, self.rpt_id + '.txt.knowtator.xml')
-        element_tree = self.to_etree()
-        f_out = open(outpath, 'w')
-        f_out.write(etree.tostring(element_tree, pretty_print=True, encoding='unicode'))
-        #element_tree.write(f_out, pretty_print=True, encoding='unicode')
-        print("Saved at {}".format(outpath))
-        f_out.close()
+        # Annotations are written as they're serialized instead of building the whole tree with `to_etree()`.
+        # A document that can't be serialized doesn't leave a partial file.
+        tmp_outpath = outpath + '.tmp'
+        try:
+            with open(tmp_outpath, 'w') as f_out:
+                KnowtatorWriter(f_out).write_document(self)
+        except:
+            os.remove(tmp_outpath)
+            raise
+        os.replace(tmp_outpath, outpath)
+        if verbose:
+            print("Saved at {}".format(outpath))
 
 
 
@@ -377,6 +481,7 @@ def main():
     """
     An example of processing one text document.
     """
+    from models.mention_level_models import MentionLevelModel
 
     # Create a model with modifiers and targets
     targets = os.path.abspath('../lexicon/targets.tsv')
@@ -0,0 +1,226 @@
+"""
+This module defines `KnowtatorArchive`, which saves the knowtator xml of many documents
+in a few sharded zip or tar files instead of one file per document,
+and `extract_documents()`, which writes a subset of the archived documents in the layout eHOST expects.
+
+An archive directory contains:
+    - shards named 'part-<writer>-<number>.zip', '.tar' or '.tar.gz', each with up to `shard_size` members
+      named '<rpt_id>.txt.knowtator.xml'
+    - an index named '<shard>.index.tsv' for each shard, with a line of 'rpt_id<TAB>member' for every member
+A shard and its index are only moved into place once the shard is complete,
+so an interrupted run never leaves a shard that the index refers to but can't be read.
+If a document is archived more than once, the most recently written shard is used.
+
+Example:
+    with KnowtatorArchive('hai_detect', shard_size=5000, compress=True) as archive:
+        for document in documents:
+            archive.add(document)
+    extract_documents('hai_detect', 'review', rpt_ids=['report1', 'report2'], corpus_dir='corpus')
+"""
+import os
+import io
+import glob
+import time
+import shutil
+import tarfile
+import zipfile
+import argparse
+import itertools
+
+from annotations.KnowtatorWriter import KnowtatorWriter
+
+
+ARCHIVE_FORMATS = ('zip', 'tar')
+INDEX_SUFFIX = '.index.tsv'
+
+# Makes the names of writers in the same process unique
+_writer_count = itertools.count()
+
+
+def get_member_name(rpt_id):
+    return rpt_id + '.txt.knowtator.xml'
+
+
+def get_part_name():
+    """
+    Returns a unique name for the files written by one writer.
+    Names sort by the time they were created, so files from older writers come first.
+    """
+    return 'part-{}-{}-{:06d}'.format(time.strftime('%Y%m%d%H%M%S'), os.getpid(), next(_writer_count))
+
+
+class KnowtatorArchive(object):
+    """
+    Appends the knowtator xml of documents to sharded archives in `archive_dir`.
+    `archive_format` is either 'zip' or 'tar'. If `compress` is True, zip members are deflated
+    and tar shards are gzipped.
+    Every KnowtatorArchive writes its own shards, so several processes can archive to the same directory.
+    `close()` must be called to save the last shard.
+    """
+
+    def __init__(self, archive_dir, shard_size=1000, archive_format='zip', compress=False):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError("archive_format must be one of {}, not {}".format(ARCHIVE_FORMATS, archive_format))
+        if not os.path.isdir(archive_dir):
+            raise FileNotFoundError("{} is not a directory".format(archive_dir))
+        self.archive_dir = archive_dir
+        self.shard_size = shard_size
+        self.archive_format = archive_format
+        self.compress = compress
+        self.name = get_part_name()
+        self.num_shards = 0
+        self.shard = None
+        self.shard_path = None
+        self.shard_index = [] # [(rpt_id, member), ...] in the current shard
+
+
+    def get_extension(self):
+        if self.archive_format == 'zip':
+            return '.zip'
+        return '.tar.gz' if self.compress else '.tar'
+
+
+    def _open_shard(self):
+        self.shard_path = os.path.join(self.archive_dir, '{}-{:05d}{}'.format(
+            self.name, self.num_shards, self.get_extension()))
+        self.num_shards += 1
+        self.shard_index = []
+        tmp_path = self.shard_path + '.tmp'
+        if self.archive_format == 'zip':
+            self.shard = zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED if self.compress else zipfile.ZIP_STORED)
+        else:
+            self.shard = tarfile.open(tmp_path, 'w:gz' if self.compress else 'w')
+
+
+    def _close_shard(self):
+        """
+        Closes the current shard and saves its index.
+        """
+        if self.shard is None:
+            return
+        self.shard.close()
+        self.shard = None
+        os.replace(self.shard_path + '.tmp', self.shard_path)
+        index_path = self.shard_path + INDEX_SUFFIX
+        with open(index_path + '.tmp', 'w') as f:
+            for rpt_id, member in self.shard_index:
+                f.write('{}\t{}\n'.format(rpt_id, member))
+        os.replace(index_path + '.tmp', index_path)
+
+
+    def add(self, document):
+        """
+        Adds the knowtator xml of `document` to the current shard.
+        """
+        f = io.StringIO()
+        KnowtatorWriter(f).write_document(document)
+        data = f.getvalue().encode('utf-8')
+        if self.shard is None:
+            self._open_shard()
+        member = get_member_name(document.rpt_id)
+        if self.archive_format == 'zip':
+            self.shard.writestr(member, data)
+        else:
+            info = tarfile.TarInfo(member)
+            info.size = len(data)
+            info.mtime = time.time()
+            self.shard.addfile(info, io.BytesIO(data))
+        self.shard_index.append((document.rpt_id, member))
+        if len(self.shard_index) >= self.shard_size:
+            self._close_shard()
+
+
+    def close(self):
+        self._close_shard()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_index(archive_dir):
+    """
+    Returns a dictionary of {rpt_id: (shard path, member)} for every document in `archive_dir`.
+    """
+    index = {}
+    for index_path in sorted(glob.glob(os.path.join(glob.escape(archive_dir), 'part-*' + INDEX_SUFFIX))):
+        shard_path = index_path[:-len(INDEX_SUFFIX)]
+        with open(index_path) as f:
+            for line in f:
+                rpt_id, member = line.rstrip('\n').split('\t')
+                index[rpt_id] = (shard_path, member)
+    return index
+
+
+def extract_documents(archive_dir, outdir, rpt_ids=None, corpus_dir=None):
+    """
+    Writes the knowtator xml of the documents in `rpt_ids`, or of every archived document,
+    to `outdir`/saved in the layout of an eHOST project.
+    If `corpus_dir` is given, the text of each document is copied from it to `outdir`/corpus.
+    Each shard is only opened once.
+    Returns the number of documents that were written.
+    Raises a KeyError if one of `rpt_ids` isn't in the archive.
+    """
+    index = read_index(archive_dir)
+    if rpt_ids is None:
+        rpt_ids = list(index)
+    members_by_shard = {} # shard path: {member: rpt_id}
+    for rpt_id in rpt_ids:
+        if rpt_id not in index:
+            raise KeyError("{} is not in {}".format(rpt_id, archive_dir))
+        shard_path, member = index[rpt_id]
+        members_by_shard.setdefault(shard_path, {})[member] = rpt_id
+
+    saved_dir = os.path.join(outdir, 'saved')
+    os.makedirs(saved_dir, exist_ok=True)
+    if corpus_dir is not None:
+        os.makedirs(os.path.join(outdir, 'corpus'), exist_ok=True)
+    num_written = 0
+    for shard_path, members in members_by_shard.items():
+        for member, data in _read_members(shard_path, members):
+            with open(os.path.join(saved_dir, member), 'wb') as f:
+                f.write(data)
+            num_written += 1
+            if corpus_dir is not None:
+                filename = members[member] + '.txt'
+                shutil.copyfile(os.path.join(corpus_dir, filename), os.path.join(outdir, 'corpus', filename))
+    return num_written
+
+
+def _read_members(shard_path, members):
+    """
+    Yields (member, data) for each of `members` in a shard.
+    """
+    if shard_path.endswith('.zip'):
+        with zipfile.ZipFile(shard_path) as shard:
+            for member in members:
+                yield member, shard.read(member)
+    else:
+        # Compressed tar files can only be read in order
+        with tarfile.open(shard_path, 'r:*') as shard:
+            for info in shard:
+                if info.name in members:
+                    yield info.name, shard.extractfile(info).read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extracts archived knowtator files into an eHOST project")
+    parser.add_argument('archive_dir', help="the directory containing the archive shards")
+    parser.add_argument('outdir', help="the eHOST project directory to write 'saved' and 'corpus' to")
+    parser.add_argument('--ids', help="a file with one rpt_id per line, every document is extracted by default")
+    parser.add_argument('--corpus', help="a directory of text files to copy the documents' reports from")
+    args = parser.parse_args()
+    rpt_ids = None
+    if args.ids:
+        with open(args.ids) as f:
+            rpt_ids = [line.strip() for line in f if line.strip()]
+    num_written = extract_documents(args.archive_dir, args.outdir, rpt_ids, corpus_dir=args.corpus)
+    print("Extracted {} documents to {}".format(num_written, args.outdir))
+
+
+if __name__ == '__main__':
+    main()
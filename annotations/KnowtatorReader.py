@@ -0,0 +1,82 @@
+"""
+This module reads the annotations saved in knowtator xml files by eHOST or `KnowtatorWriter`.
+Each file is parsed in a single pass with `lxml.etree.iterparse`.
+An annotation is spread over three kinds of elements that refer to each other by id:
+    - `<annotation>` has the mention id, annotator, span and text
+    - `<classMention>` has the mention id, the class and the ids of its slots
+    - `<stringSlotMention>` has a slot id, the name of an attribute and its value
+Elements are resolved with dictionaries keyed by these ids as they are parsed, in whatever order they appear,
+and each element is cleared once it's been read.
+lxml is only imported once a file is read.
+"""
+import os
+
+from annotations.Annotation import Annotation, _intern
+
+
+KNOWTATOR_SUFFIX = '.knowtator.xml'
+
+_tags = ('annotation', 'classMention', 'stringSlotMention')
+
+# eHOST slot names that are saved under a different name in `Annotation.attributes`
+SLOT_ATTRIBUTES = {'classification': 'ssi_class'}
+
+
+def get_rpt_id(filepath):
+    """
+    Returns the rpt_id of the report that a knowtator file such as 'report.txt.knowtator.xml' annotates.
+    """
+    filename = os.path.basename(filepath)
+    if filename.endswith(KNOWTATOR_SUFFIX):
+        filename = filename[:-len(KNOWTATOR_SUFFIX)]
+    return os.path.splitext(filename)[0]
+
+
+def read_knowtator(filepath, rpt_id=None):
+    """
+    Returns a list of the Annotations in a knowtator xml file in the order they appear.
+    `rpt_id` defaults to the rpt_id in the file name.
+    Annotations without a `<classMention>` are skipped.
+    """
+    from lxml import etree
+    if rpt_id is None:
+        rpt_id = get_rpt_id(filepath)
+    annotations = {} # mention id: Annotation
+    classes = {} # mention id: class name
+    slot_mentions = {} # slot id: mention id
+    slots = {} # slot id: (attribute, value)
+
+    for event, element in etree.iterparse(filepath, events=('end',), tag=_tags):
+        tag = element.tag
+        if tag == 'annotation':
+            annotation = Annotation()
+            annotation.from_ehost(element)
+            annotation.rpt_id = rpt_id
+            annotations[annotation.id] = annotation
+        elif tag == 'classMention':
+            mention_id = element.get('id')
+            classes[mention_id] = element.find('mentionClass').get('id')
+            for slot in element.iterfind('hasSlotMention'):
+                slot_mentions[slot.get('id')] = mention_id
+        else:
+            value = element.find('stringSlotMentionValue')
+            slots[element.get('id')] = (element.find('mentionSlot').get('id'),
+                                        value.get('value') if value is not None else None)
+        element.clear()
+        # Drop the elements that have already been read
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+    for slot_id, (attribute, value) in slots.items():
+        mention_id = slot_mentions.get(slot_id)
+        if mention_id in annotations:
+            attribute = SLOT_ATTRIBUTES.get(attribute, attribute)
+            annotations[mention_id].attributes[_intern(attribute)] = _intern(value)
+    loaded = []
+    for mention_id, annotation in annotations.items():
+        if mention_id not in classes:
+            continue
+        annotation.annotation_type = _intern(classes[mention_id])
+        annotation.classify()
+        loaded.append(annotation)
+    return loaded
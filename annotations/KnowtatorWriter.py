@@ -0,0 +1,132 @@
+"""
+This module defines `KnowtatorWriter`, which writes the annotations of a ClinicalTextDocument
+as knowtator xml straight to a file instead of building an lxml tree and serializing it to a string.
+The output is exactly what `etree.tostring(document.to_etree(), pretty_print=True, encoding='unicode')` returns.
+"""
+import re
+
+
+# Characters that lxml refuses to put in a tree
+_invalid_xml = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+ADJUDICATION_STATUS = '''  <eHOST_Adjudication_status version="1.0">
+    <Adjudication_Selected_Annotators version="1.0"/>
+    <Adjudication_Selected_Classes version="1.0"/>
+    <Adjudication_Others>
+      <CHECK_OVERLAPPED_SPANS>false</CHECK_OVERLAPPED_SPANS>
+      <CHECK_ATTRIBUTES>false</CHECK_ATTRIBUTES>
+      <CHECK_RELATIONSHIP>false</CHECK_RELATIONSHIP>
+      <CHECK_CLASS>false</CHECK_CLASS>
+      <CHECK_COMMENT>false</CHECK_COMMENT>
+    </Adjudication_Others>
+  </eHOST_Adjudication_status>
+'''
+
+
+def _check(value):
+    if _invalid_xml.search(value):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    return value
+
+
+def escape_text(value):
+    """
+    Escapes the text of an element the same way as lxml.
+    """
+    _check(value)
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '\r' in value:
+        value = value.replace('\r', '&#13;')
+    return value
+
+
+def escape_attribute(value):
+    """
+    Escapes the value of an attribute the same way as lxml.
+    """
+    value = escape_text(value)
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    if '\t' in value:
+        value = value.replace('\t', '&#9;')
+    return value
+
+
+def text_element(tag, text, attributes=''):
+    """
+    Returns a single element with `text` and no children.
+    `attributes` is the escaped attributes of the element, starting with a space.
+    """
+    if text is None:
+        return '<{}{}/>'.format(tag, attributes)
+    return '<{0}{1}>{2}</{0}>'.format(tag, attributes, escape_text(text))
+
+
+class KnowtatorWriter(object):
+    """
+    Writes knowtator xml to the file object `f`, one annotation at a time.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+
+    def write_document(self, document):
+        """
+        Writes every annotation of `document`, like `ClinicalTextDocument.to_etree()`.
+        """
+        self.start(document.rpt_id)
+        for annotator in document.annotations:
+            for annotation in document.annotations[annotator]:
+                self.write_annotation(annotation)
+        self.end()
+
+
+    def start(self, rpt_id):
+        self.f.write('<annotations textSource="{}">\n'.format(escape_attribute(rpt_id + '.txt')))
+
+
+    def write_annotation(self, annotation):
+        """
+        Writes the elements that `Annotation.to_etree()` returns for `annotation`.
+        """
+        annotation_id = escape_attribute(annotation.id)
+        text = annotation.text
+        start, end = annotation.span_in_document
+        slots = [('assertion', annotation.attributes['assertion']),
+                 ('temporality', annotation.attributes['temporality'])]
+        if annotation.annotation_type == 'Evidence of SSI':
+            slots.append(('classification', annotation.attributes['ssi_class']))
+
+        lines = ['  <annotation>',
+                 '    <mention id="{}"/>'.format(annotation_id),
+                 '    ' + text_element('annotator', annotation.annotator, ' id="eHOST_2010"'),
+                 '    <span start="{}" end="{}"/>'.format(escape_attribute(str(start)), escape_attribute(str(end))),
+                 '    ' + text_element('spannedText', text),
+                 '    ' + text_element('creationDate', annotation.datetime),
+                 '  </annotation>',
+                 '  <classMention id="{}">'.format(annotation_id),
+                 '    ' + text_element('mentionClass', text,
+                                       ' id="{}"'.format(escape_attribute(annotation.annotation_type)))]
+        for i in range(len(slots)):
+            lines.append('    <hasSlotMention id="{}{}"/>'.format(annotation_id, i + 1))
+        lines.append('  </classMention>')
+        for i, (slot, value) in enumerate(slots):
+            lines.append('  <stringSlotMention id="{}{}">'.format(annotation_id, i + 1))
+            lines.append('    <mentionSlot id="{}"/>'.format(slot))
+            lines.append('    <stringSlotMentionValue value="{}"/>'.format(escape_attribute(value)))
+            lines.append('  </stringSlotMention>')
+        lines.append('')
+        self.f.write('\n'.join(lines))
+
+
+    def end(self):
+        self.f.write(ADJUDICATION_STATUS)
+        self.f.write('</annotations>\n')
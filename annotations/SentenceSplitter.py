@@ -0,0 +1,99 @@
+"""
+This module defines `SentenceSplitter`, which splits a document into sentences with a single regular expression.
+It uses the same rules as `ClinicalTextDocument.split_sentences()`:
+a sentence ends at a word that ends with a termination point unless the word is an exception
+or at one of the termination words.
+Instead of walking through every word, one compiled pattern finds the last word of each sentence
+and the sentence spans are saved directly in a SentenceTable.
+"""
+import re
+
+from annotations.SentenceTable import SentenceTable
+from utils import helpers
+
+
+TERMINATION_POINTS = '.!?;'
+TERMINATION_WORDS = ['a/p:'] # Words to terminate at that we didn't catch in preprocessing
+EXCEPTION_WORDS = ['dr.', 'm.d', 'mr.', 'ms.', 'mrs.', ]
+
+_non_space = re.compile(r"\S")
+
+
+def compile_sentence_end(termination_points=TERMINATION_POINTS, termination_words=TERMINATION_WORDS,
+                         exception_words=EXCEPTION_WORDS):
+    """
+    Returns a pattern that matches every whitespace-separated word that ends a sentence.
+    """
+    word_ends = []
+    if termination_words:
+        word_ends.append('|'.join(re.escape(word) for word in termination_words))
+    point_end = r'\S*[{}]'.format(''.join(re.escape(point) for point in termination_points))
+    if exception_words:
+        # The whole word can't be an exception
+        point_end = r'(?!(?:{})(?!\S)){}'.format('|'.join(re.escape(word) for word in exception_words), point_end)
+    word_ends.append(point_end)
+    return re.compile(r'(?<!\S)(?:{})(?!\S)'.format('|'.join('(?:{})'.format(end) for end in word_ends)))
+
+
+class SentenceSplitter(object):
+    """
+    Splits text into sentences.
+    If `split_at_headers` is True, a sentence also ends before every header and list element
+    found by `helpers.find_headers_and_lists`.
+    """
+
+    def __init__(self, split_at_headers=False, termination_points=TERMINATION_POINTS,
+                 termination_words=TERMINATION_WORDS, exception_words=EXCEPTION_WORDS):
+        self.split_at_headers = split_at_headers
+        self.sentence_end = compile_sentence_end(termination_points, termination_words, exception_words)
+
+
+    def get_sentence_spans(self, text):
+        """
+        Yields the (start, end) of every sentence in `text`.
+        Sentences start at their first word and end at their last word.
+        """
+        spans = self._get_sentence_spans(text)
+        if self.split_at_headers:
+            spans = self._split_at_headers(text, spans)
+        return spans
+
+
+    def _get_sentence_spans(self, text):
+        pos = 0
+        for match in self.sentence_end.finditer(text):
+            # The sentence starts at the first word after the previous one
+            yield _non_space.search(text, pos).start(), match.end()
+            pos = match.end()
+        # Take care of any words remaining
+        first_word = _non_space.search(text, pos)
+        if first_word:
+            yield first_word.start(), len(text.rstrip())
+
+
+    def _split_at_headers(self, text, spans):
+        points = []
+        for match in helpers.find_headers_and_lists(text):
+            first_word = _non_space.search(text, match.start(), match.end())
+            if first_word:
+                points.append(first_word.start())
+        points.sort()
+        i = 0
+        for start, end in spans:
+            while i < len(points) and points[i] <= start:
+                i += 1
+            while i < len(points) and points[i] < end:
+                yield start, start + len(text[start:points[i]].rstrip())
+                start = points[i]
+                i += 1
+            yield start, end
+
+
+    def split(self, text):
+        """
+        Returns a SentenceTable with the sentences in `text`.
+        """
+        sentences = SentenceTable(text)
+        for start, end in self.get_sentence_spans(text):
+            sentences.add_sentence(start, end)
+        return sentences
@@ -0,0 +1,181 @@
+"""
+This module defines `SentenceTable`, a columnar store for the tokens and sentences of a ClinicalTextDocument.
+Instead of a dictionary with a list of words and a list of spans for every sentence,
+the start and end of every sentence are stored in two arrays.
+Words and sentence text are sliced from the document's text when they are read
+and token spans are only found if they are needed.
+"""
+import re
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping, Sequence
+
+
+_token = re.compile(r"\S+")
+
+
+class SentenceView(Mapping):
+    """
+    A read-only view of a single sentence in a SentenceTable.
+    It can be used like the dictionaries that were previously in `ClinicalTextDocument.sentences`:
+    {'idx': int, 'text': sentence, 'words': [word, ...], 'span': (start, end), 'word_spans': [(start, end), ...]}
+    """
+    _keys = ('text', 'words', 'idx', 'span', 'word_spans')
+
+    def __init__(self, table, idx):
+        self.table = table
+        self.idx = idx
+        self._text = None
+
+    def __getitem__(self, key):
+        if key == 'text':
+            if self._text is None:
+                self._text = self.table.get_text(self.idx)
+            return self._text
+        elif key == 'words':
+            return self.table.get_words(self.idx)
+        elif key == 'idx':
+            return self.idx
+        elif key == 'span':
+            return self.table.get_span(self.idx)
+        elif key == 'word_spans':
+            return self.table.get_word_spans(self.idx)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return 'SentenceView({})'.format(dict(self))
+
+
+class SentenceTable(Sequence):
+    """
+    The sentences of `text`.
+    `sentence_starts` and `sentence_ends` are arrays of the span of each sentence in the original document.
+    Sentences are either added a token at a time with `add_token()` and `end_sentence()`
+    or all at once with `add_sentence()`.
+    `token_starts` and `token_ends` are arrays of the spans of each token
+    and `token_bounds` has the index of the first token of each sentence, followed by the number of tokens.
+    If sentences were added with `add_sentence()`, the token arrays are only filled when they're first used.
+    Words are sliced from `text`, which must have the same length as the original document.
+    If it doesn't, the words are kept in `words` instead.
+    Indexing or iterating returns a SentenceView for each sentence.
+    """
+
+    def __init__(self, text='', words=None):
+        self.text = text
+        self.words = words
+        self.sentence_starts = array('l')
+        self.sentence_ends = array('l')
+        self.token_starts = array('l')
+        self.token_ends = array('l')
+        self.token_bounds = array('l', [0])
+
+
+    def add_token(self, start, end, word=None):
+        self.token_starts.append(start)
+        self.token_ends.append(end)
+        if self.words is not None:
+            self.words.append(word)
+
+
+    def end_sentence(self):
+        """
+        Ends the current sentence after the last token that was added.
+        Does nothing if the sentence would be empty.
+        """
+        if len(self.token_starts) > self.token_bounds[-1]:
+            self.sentence_starts.append(self.token_starts[self.token_bounds[-1]])
+            self.sentence_ends.append(self.token_ends[-1])
+            self.token_bounds.append(len(self.token_starts))
+
+
+    def add_sentence(self, start, end):
+        """
+        Adds a sentence that starts and ends with a token without finding its tokens.
+        """
+        self.sentence_starts.append(start)
+        self.sentence_ends.append(end)
+        self.token_bounds = None
+
+
+    def _get_tokens(self):
+        """
+        Fills the token arrays if sentences were added with `add_sentence()`.
+        """
+        if self.token_bounds is None:
+            token_starts = array('l')
+            token_ends = array('l')
+            token_bounds = array('l', [0])
+            for start, end in zip(self.sentence_starts, self.sentence_ends):
+                for match in _token.finditer(self.text, start, end):
+                    token_starts.append(match.start())
+                    token_ends.append(match.end())
+                token_bounds.append(len(token_starts))
+            self.token_starts, self.token_ends, self.token_bounds = token_starts, token_ends, token_bounds
+        return self.token_starts, self.token_ends, self.token_bounds
+
+
+    def get_text(self, idx):
+        """
+        Returns the words of sentence `idx` joined by single spaces.
+        """
+        if self.words is not None:
+            return ' '.join(self.get_words(idx))
+        return ' '.join(self.text[self.sentence_starts[idx]:self.sentence_ends[idx]].split())
+
+
+    def get_words(self, idx):
+        if self.words is not None:
+            return self.words[self.token_bounds[idx]:self.token_bounds[idx + 1]]
+        return self.text[self.sentence_starts[idx]:self.sentence_ends[idx]].split()
+
+
+    def get_span(self, idx):
+        """
+        Returns the (start, end) of sentence `idx` in the document.
+        """
+        return self.sentence_starts[idx], self.sentence_ends[idx]
+
+
+    def get_word_spans(self, idx):
+        token_starts, token_ends, token_bounds = self._get_tokens()
+        first, last = token_bounds[idx], token_bounds[idx + 1]
+        return list(zip(token_starts[first:last], token_ends[first:last]))
+
+
+    def get_token_spans(self):
+        """
+        Returns a list of (start, end) for every token in the document.
+        """
+        token_starts, token_ends, token_bounds = self._get_tokens()
+        return list(zip(token_starts, token_ends))
+
+
+    def find_sentence(self, offset):
+        """
+        Returns the index of the sentence whose span contains the character `offset`,
+        or None if `offset` is between sentences.
+        """
+        idx = bisect_right(self.sentence_starts, offset) - 1
+        if idx < 0 or offset >= self.sentence_ends[idx]:
+            return None
+        return idx
+
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('sentence index out of range')
+        return SentenceView(self, idx)
+
+
+    def __len__(self):
+        return len(self.sentence_starts)
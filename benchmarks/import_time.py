@@ -0,0 +1,134 @@
+"""
+This script times how long it takes to import each entry point of the package in a new interpreter
+with `python -X importtime`, which is what every CLI invocation and process-pool worker pays before doing any work.
+Usage: python -m benchmarks.import_time [--repeat N] [--scale S] [--output import_times.json]
+The script exits with status 1 when a module takes longer than its budget in `BUDGETS`
+or when importing it loads one of the heavy dependencies in `DEFERRED`,
+which should only be imported by the functions that use them.
+Budgets are for a typical development machine. Use --scale to allow more time on a slower one.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from collections import OrderedDict
+
+
+# Milliseconds that importing each module may take
+BUDGETS = OrderedDict([
+    ('annotations.ClinicalTextDocument', 100),
+    ('annotations.KnowtatorReader', 100),
+    ('annotations.AnnotationExport', 100),
+    ('pipeline', 100),
+    ('evaluate_annotations', 120),
+    ('models.mention_level_models', 500),
+    ('main', 600),
+    ('service', 600),
+])
+
+# Packages that each module must not import
+_NOT_NEEDED = ['nltk', 'openpyxl', 'pyarrow']
+DEFERRED = {
+    'annotations.ClinicalTextDocument': _NOT_NEEDED + ['lxml', 'pyConTextNLP', 'networkx'],
+    'annotations.KnowtatorReader': _NOT_NEEDED + ['lxml', 'pyConTextNLP'],
+    'annotations.AnnotationExport': _NOT_NEEDED + ['lxml', 'pyConTextNLP'],
+    'pipeline': _NOT_NEEDED + ['lxml', 'pyConTextNLP'],
+    'evaluate_annotations': _NOT_NEEDED + ['lxml', 'pyConTextNLP'],
+    'models.mention_level_models': _NOT_NEEDED + ['lxml'],
+    'main': _NOT_NEEDED + ['lxml'],
+    'service': _NOT_NEEDED + ['lxml'],
+}
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import time:     self [us] | cumulative | imported package
+_line = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)$')
+
+
+def parse_importtime(output):
+    """
+    Returns a dictionary of {module: cumulative microseconds} for every module in the output of -X importtime.
+    """
+    times = {}
+    for line in output.splitlines():
+        match = _line.match(line)
+        if match:
+            times[match.group(3)] = int(match.group(2))
+    return times
+
+
+def time_import(module, python=sys.executable):
+    """
+    Imports `module` in a new interpreter and returns a dictionary of {module: cumulative microseconds}
+    for it and every module it imported.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT_DIR] + [p for p in [env.get('PYTHONPATH')] if p])
+    process = subprocess.run([python, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                             cwd=ROOT_DIR, env=env, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise ImportError("Couldn't import {}:\n{}".format(module, process.stderr))
+    return parse_importtime(process.stderr)
+
+
+def run_import_benchmarks(modules=None, repeat=5):
+    """
+    Imports each module `repeat` times and keeps the fastest time.
+    Returns a dictionary of {module: {'ms', 'budget_ms', 'deferred_imported'}} that can be saved as json.
+    """
+    results = OrderedDict()
+    for module in modules or BUDGETS:
+        best = None
+        imported = set()
+        for _ in range(repeat):
+            times = time_import(module)
+            best = times[module] if best is None else min(best, times[module])
+            imported.update(name.split('.')[0] for name in times)
+        results[module] = {'ms': best / 1000,
+                           'budget_ms': BUDGETS.get(module),
+                           'deferred_imported': sorted(imported.intersection(DEFERRED.get(module, [])))}
+    return results
+
+
+def check_budgets(results, scale=1.0):
+    """
+    Returns a list of messages for every module that is over its budget or imports a deferred package.
+    """
+    failures = []
+    for module, result in results.items():
+        if result['budget_ms'] is not None and result['ms'] > result['budget_ms'] * scale:
+            failures.append("{} took {:.1f}ms, more than its budget of {:.1f}ms".format(
+                module, result['ms'], result['budget_ms'] * scale))
+        if result['deferred_imported']:
+            failures.append("{} imports {}".format(module, ', '.join(result['deferred_imported'])))
+    return failures
+
+
+def main():
+    results = run_import_benchmarks(args.modules, args.repeat)
+    for module, result in results.items():
+        print("{:<36}{:>8.1f}ms  (budget {}ms)".format(module, result['ms'], result['budget_ms']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Saved at {}".format(args.output))
+
+    failures = check_budgets(results, args.scale)
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print("Every module is within its budget")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', help="the modules to time, every module in BUDGETS by default")
+    parser.add_argument('--repeat', type=int, default=5, help="keep the fastest of this many imports")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply every budget by this")
+    parser.add_argument('--output', help="save the results to this json file")
+    args = parser.parse_args()
+    main()
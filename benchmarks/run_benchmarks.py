@@ -0,0 +1,184 @@
+"""
+This script times each stage of annotating a corpus of synthetic notes
+and saves the results as json so that they can be compared between versions.
+Usage: python -m benchmarks.run_benchmarks [--notes N] [--sentences N] [--density D]
+                                           [--output results.json] [--baseline baseline.json]
+Stages are timed separately:
+    split: tokenizing the notes and splitting them into sentences
+    markup: `MentionLevelModel.markup_sentence` for every sentence
+    from_markup: creating an Annotation from every marked target
+    compare: `ClinicalTextDocument.compare_annotations` against a copy of the annotations
+    to_knowtator: saving every document as knowtator xml
+If --baseline is given, the script exits with status 1 when any stage is
+slower than the baseline by more than --tolerance.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+
+from annotations.Annotation import Annotation
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
+from benchmarks.synthetic_notes import SyntheticNoteGenerator, LEXICON_DIR
+
+
+STAGES = ['split', 'markup', 'from_markup', 'compare', 'to_knowtator']
+
+
+def get_peak_rss():
+    """
+    Returns the peak resident set size of this process in megabytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': # bytes instead of kilobytes
+        peak /= 1024
+    return peak / 1024
+
+
+def time_stages(notes, model):
+    """
+    Runs every stage on `notes`, a list of (rpt_id, text) tuples.
+    Returns a dictionary of stage: seconds and the number of sentences.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    documents = [ClinicalTextDocument(text, rpt_id=rpt_id) for rpt_id, text in notes]
+    timings['split'] = time.perf_counter() - start
+    num_sentences = sum(len(document.sentences) for document in documents)
+
+    start = time.perf_counter()
+    markups = [[model.markup_sentence(sentence['text']) for sentence in document.sentences]
+               for document in documents]
+    timings['markup'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for document, document_markups in zip(documents, markups):
+        annotations = document.annotations['hai_detect']
+        for sentence_num, (sentence, markup) in enumerate(zip(document.sentences, document_markups)):
+            for target in markup.getMarkedTargets():
+                annotation = Annotation()
+                annotation.from_markup(target, markup, sentence['text'], sentence['span'], rpt_id=document.rpt_id,
+                                       document_text=document.raw_text)
+                if not annotation.classification:
+                    continue
+                annotation.sentence_num = sentence_num
+                annotations.append(annotation)
+    timings['from_markup'] = time.perf_counter() - start
+
+    for document in documents:
+        document.annotations['gold_standard'] = [copy.copy(a) for a in document.annotations['hai_detect']]
+    start = time.perf_counter()
+    for document in documents:
+        categories = {a.annotation_type for a in document.annotations['gold_standard']}
+        document.compare_annotations(categories=categories)
+    timings['compare'] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as outdir:
+        start = time.perf_counter()
+        for document in documents:
+            document.to_knowtator(outdir, verbose=False)
+        timings['to_knowtator'] = time.perf_counter() - start
+
+    return timings, num_sentences
+
+
+def run_benchmarks(num_notes=200, num_sentences=40, target_density=0.2, seed=0, repeat=3):
+    """
+    Times every stage `repeat` times on the same synthetic corpus and keeps the fastest time for each stage.
+    Returns a dictionary that can be saved as json.
+    """
+    generator = SyntheticNoteGenerator(seed=seed, num_sentences=num_sentences, target_density=target_density)
+    notes = generator.generate_notes(num_notes)
+    model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'), os.path.join(LEXICON_DIR, 'modifiers.tsv'),
+                              gate_on_targets=True)
+
+    best = {}
+    for _ in range(repeat):
+        timings, total_sentences = time_stages(notes, model)
+        for stage, seconds in timings.items():
+            best[stage] = min(seconds, best.get(stage, seconds))
+
+    stages = {}
+    for stage in STAGES:
+        seconds = best[stage]
+        stages[stage] = {'seconds': seconds,
+                         'notes_per_sec': num_notes / seconds if seconds else None,
+                         'sentences_per_sec': total_sentences / seconds if seconds else None}
+    total_seconds = sum(best.values())
+    return {'params': {'notes': num_notes, 'sentences_per_note': num_sentences,
+                       'target_density': target_density, 'seed': seed, 'repeat': repeat},
+            'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+            'num_sentences': total_sentences,
+            'stages': stages,
+            'total': {'seconds': total_seconds,
+                      'notes_per_sec': num_notes / total_seconds,
+                      'sentences_per_sec': total_sentences / total_seconds},
+            'peak_rss_mb': get_peak_rss()}
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Returns a list of (stage, baseline seconds, seconds) for every stage that is
+    more than `tolerance` slower than in `baseline`.
+    Both must have been run with the same params.
+    """
+    if results['params'] != baseline['params']:
+        raise ValueError("Benchmark params don't match the baseline: {} != {}".format(
+            results['params'], baseline['params']))
+    regressions = []
+    for stage in STAGES + ['total']:
+        new = results['stages'][stage] if stage in results['stages'] else results[stage]
+        old = baseline['stages'][stage] if stage in baseline['stages'] else baseline[stage]
+        if new['seconds'] > old['seconds'] * (1 + tolerance):
+            regressions.append((stage, old['seconds'], new['seconds']))
+    return regressions
+
+
+def main():
+    results = run_benchmarks(args.notes, args.sentences, args.density, args.seed, args.repeat)
+    for stage in STAGES:
+        print("{:<14}{:>10.3f}s{:>12.1f} notes/sec{:>12.1f} sentences/sec".format(
+            stage, results['stages'][stage]['seconds'], results['stages'][stage]['notes_per_sec'],
+            results['stages'][stage]['sentences_per_sec']))
+    print("{:<14}{:>10.3f}s{:>12.1f} notes/sec{:>12.1f} sentences/sec".format(
+        'total', results['total']['seconds'], results['total']['notes_per_sec'],
+        results['total']['sentences_per_sec']))
+    print("Peak RSS: {:.1f} MB".format(results['peak_rss_mb']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Saved at {}".format(args.output))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for stage, old, new in regressions:
+            print("{} is slower than the baseline: {:.3f}s -> {:.3f}s".format(stage, old, new))
+        if regressions:
+            sys.exit(1)
+        print("No regressions compared to {}".format(args.baseline))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--notes', type=int, default=200, help="the number of synthetic notes")
+    parser.add_argument('--sentences', type=int, default=40, help="the number of sentences in each note")
+    parser.add_argument('--density', type=float, default=0.2,
+                        help="the fraction of sentences that mention a target")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="keep the fastest of this many runs")
+    parser.add_argument('--output', help="save the results to this json file")
+    parser.add_argument('--baseline', help="a json file saved with --output to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="the fraction a stage can be slower than the baseline before it is a regression")
+    args = parser.parse_args()
+    main()
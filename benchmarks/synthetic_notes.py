@@ -0,0 +1,113 @@
+"""
+This module generates synthetic clinical notes for benchmarking.
+The notes are built from the terms in the lexicon and the headers in `utils.helpers`
+so that they exercise the same code paths as real notes without containing any patient data.
+The same seed always generates the same notes.
+"""
+import os
+import re
+import csv
+import random
+
+from utils import helpers
+
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lexicon')
+
+# Sentences that don't mention any targets
+FILLER_SENTENCES = [
+    'the patient was seen and examined at the bedside',
+    'vital signs are stable and within normal limits',
+    'she is tolerating a regular diet without nausea',
+    'he ambulated in the hallway with assistance',
+    'pain is well controlled on the current regimen',
+    'labs were reviewed with the attending physician',
+    'will continue to monitor overnight',
+    'family was updated on the plan of care',
+    'patient denies chest pain or shortness of breath',
+    'follow up in clinic in two weeks',
+]
+
+# Sentences that mention a target and optionally a modifier
+TARGET_TEMPLATES = [
+    '{modifier} {target} was noted on exam',
+    'there is {modifier} {target} near the incision',
+    'the patient has {modifier} {target}',
+    '{modifier} {target} at the surgical site',
+    'on assessment today, {modifier} {target}',
+]
+
+
+def read_lexicon_terms(filepath):
+    """
+    Returns the list of terms in the `Lex` column of a lexicon tsv file.
+    """
+    terms = []
+    with open(filepath) as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        for row in reader:
+            term = (row.get('Lex') or '').strip()
+            if term:
+                terms.append(term.lower())
+    return terms
+
+
+def get_literal_headers():
+    """
+    Returns the headers in `helpers.HEADER_PATTERNS` that are plain text and not regular expressions.
+    """
+    return [pattern for pattern in helpers.HEADER_PATTERNS if re.fullmatch(r'[A-Za-z0-9 ]+:', pattern)]
+
+
+class SyntheticNoteGenerator(object):
+    """
+    Generates notes with `num_sentences` sentences each.
+    `target_density` is the fraction of sentences that mention a target from the lexicon
+    and `modifier_rate` is the fraction of those sentences that also contain a modifier.
+    A header is started every `sentences_per_header` sentences.
+    """
+
+    def __init__(self, targets_file=None, modifiers_file=None, seed=0, num_sentences=40,
+                 target_density=0.2, modifier_rate=0.5, sentences_per_header=5):
+        if targets_file is None:
+            targets_file = os.path.join(LEXICON_DIR, 'targets.tsv')
+        if modifiers_file is None:
+            modifiers_file = os.path.join(LEXICON_DIR, 'modifiers.tsv')
+        self.targets = read_lexicon_terms(targets_file)
+        self.modifiers = read_lexicon_terms(modifiers_file)
+        self.headers = get_literal_headers()
+        self.seed = seed
+        self.num_sentences = num_sentences
+        self.target_density = target_density
+        self.modifier_rate = modifier_rate
+        self.sentences_per_header = sentences_per_header
+
+
+    def generate_sentence(self, rng):
+        if rng.random() >= self.target_density:
+            sentence = rng.choice(FILLER_SENTENCES)
+        else:
+            modifier = rng.choice(self.modifiers) if rng.random() < self.modifier_rate else ''
+            sentence = rng.choice(TARGET_TEMPLATES).format(modifier=modifier, target=rng.choice(self.targets))
+            sentence = ' '.join(sentence.split())
+        return sentence[0].upper() + sentence[1:] + '.'
+
+
+    def generate_note(self, rng):
+        """
+        Returns the text of a single note, preprocessed the same way as the notes in the corpus.
+        """
+        parts = []
+        for i in range(self.num_sentences):
+            if self.sentences_per_header and i % self.sentences_per_header == 0:
+                parts.append('  ' + rng.choice(self.headers))
+            parts.append(self.generate_sentence(rng))
+        return helpers.preprocess_human(' '.join(parts))
+
+
+    def generate_notes(self, num_notes):
+        """
+        Returns a list of `num_notes` (rpt_id, text) tuples.
+        """
+        rng = random.Random(self.seed)
+        return [('synthetic_{:06d}'.format(i), self.generate_note(rng)) for i in range(num_notes)]
@@ -2,48 +2,127 @@
 This script takes as an argument the path to a directory which contains
 saved human annotations in datadir/saved/Annotations.xlsx. It then applies `hai_detect`
 to annotate the reports found in datadir/corpus.
+Usage: python evaluate_annotations.py datadir relative/path/to/Annotations.xlsx [workers] [lexicon_index.pkl]
+Instead of an Excel file, the relative path can be a directory of knowtator xml files saved by eHOST, such as 'saved'.
+If a lexicon index is given, only the sentences that changes to the lexicon could affect
+are annotated again, and the index is saved for the next run.
 """
 import os, sys
+import multiprocessing
+from collections import OrderedDict
 from annotations.Annotation import Annotation
 from annotations.ClinicalTextDocument import  ClinicalTextDocument
-from models.mention_level_models import MentionLevelModel
-from openpyxl import load_workbook
+from annotations.KnowtatorReader import read_knowtator, KNOWTATOR_SUFFIX
 
-def import_from_xlsx(corpus_dir, file_name):
+def _load_document(filepath):
+    """
+    Reads and splits a single document. Used to load documents in a process pool.
+    """
+    return ClinicalTextDocument(filepath=filepath)
+
+
+def import_from_xlsx(corpus_dir, file_name, workers=1):
+    """
+    Reads the gold standard annotations exported from eHOST to `file_name`
+    and returns a dictionary mapping file names in `corpus_dir` to ClinicalTextDocuments
+    with the annotations in `annotations['gold_standard']`.
+    The workbook is streamed one row at a time and each document is only read and split once.
+    If `workers` is greater than 1, the documents are read in a pool of processes.
+    """
 
     print(corpus_dir)
     assert os.path.exists(corpus_dir)
     print(file_name)
-    wb = load_workbook(filename=file_name, read_only=False)
+    from openpyxl import load_workbook
+    wb = load_workbook(filename=file_name, read_only=True)
     ws=wb.active # just getting the first worksheet regardless of its name
+    rows = ws.iter_rows()
 
-    row = list(ws)[0]
+    row = next(rows)
     col_size = len(row)
     if (col_size != 11): #no more no less
         raise ValueError("MalformedHostExcelRow") #MalformedeHostExcelRow
 
-    documents = dict()
-    row_cnt = len(list(ws))
-    print("{} rows".format(row_cnt))
-
-    for i in range(1, row_cnt):
-        #if i == 10:
-        #    break
-        row = list(ws)[i]
+    # Group the annotations by file before reading any documents
+    annotations = OrderedDict() # file name: [annotations, ...]
+    row_cnt = 1
+    for row in rows:
+        row_cnt += 1
         full_file_name = row[1].value #second column
-        full_file_path = os.path.join(corpus_dir, full_file_name)
-        if not os.path.exists(full_file_path):
+        if full_file_name is None: # Empty row
+            continue
+        if full_file_name not in annotations:
+            if not os.path.exists(os.path.join(corpus_dir, full_file_name)):
+                annotations[full_file_name] = None
+                continue
+            annotations[full_file_name] = []
+        elif annotations[full_file_name] is None:
             continue
 
         anno = Annotation()
         anno.from_ehost_xlsx(row)
-        doc = documents.setdefault(full_file_name,ClinicalTextDocument())
-        doc.annotations['gold_standard'].append(anno)
+        annotations[full_file_name].append(anno)
+    wb.close()
+    print("{} rows".format(row_cnt))
+
+    file_names = [name for name, annos in annotations.items() if annos is not None]
+    filepaths = [os.path.join(corpus_dir, name) for name in file_names]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            loaded_documents = pool.map(_load_document, filepaths, chunksize=max(1, len(filepaths) // (workers * 4)))
+    else:
+        loaded_documents = map(_load_document, filepaths)
+
+    documents = dict()
+    for full_file_name, doc in zip(file_names, loaded_documents):
+        doc.annotations['gold_standard'].extend(annotations[full_file_name])
         doc.filepath = full_file_name
-        doc.rpt_id = os.path.splitext(os.path.basename(doc.filepath))[0]
-        doc.processText(filepath=full_file_path, rpt_id=os.path.splitext(os.path.basename(doc.filepath))[0])
+        documents[full_file_name] = doc
+
+    return documents
 
 
+def _load_ehost_document(filepaths):
+    """
+    Reads and splits a document and reads its knowtator annotations. Used to load documents in a process pool.
+    """
+    filepath, knowtator_filepath = filepaths
+    doc = ClinicalTextDocument(filepath=filepath)
+    return doc, read_knowtator(knowtator_filepath, rpt_id=doc.rpt_id)
+
+
+def import_from_ehost(corpus_dir, saved_dir, workers=1, annotator='gold_standard'):
+    """
+    Reads the annotations in the knowtator xml files in `saved_dir`
+    and returns a dictionary mapping file names in `corpus_dir` to ClinicalTextDocuments
+    with the annotations in `annotations[annotator]`.
+    If `annotator` is None, the annotations are grouped by the annotator saved with each of them.
+    Files without a report in `corpus_dir` are skipped.
+    If `workers` is greater than 1, the files are read in a pool of processes.
+    """
+    assert os.path.exists(corpus_dir)
+    file_names = []
+    filepaths = []
+    for knowtator_file in sorted(os.listdir(saved_dir)):
+        if not knowtator_file.endswith(KNOWTATOR_SUFFIX):
+            continue
+        full_file_name = knowtator_file[:-len(KNOWTATOR_SUFFIX)]
+        if not os.path.exists(os.path.join(corpus_dir, full_file_name)):
+            continue
+        file_names.append(full_file_name)
+        filepaths.append((os.path.join(corpus_dir, full_file_name), os.path.join(saved_dir, knowtator_file)))
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            loaded = pool.map(_load_ehost_document, filepaths, chunksize=max(1, len(filepaths) // (workers * 4)))
+    else:
+        loaded = map(_load_ehost_document, filepaths)
+
+    documents = dict()
+    for full_file_name, (doc, annotations) in zip(file_names, loaded):
+        for anno in annotations:
+            doc.annotations[annotator or anno.annotator].append(anno)
+        doc.filepath = full_file_name
+        documents[full_file_name] = doc
     return documents
 
 
@@ -81,7 +160,14 @@ def compute_metrics(comparisons, categories):
             metrics[anno_type]['fp'] += 1
             metrics[anno_type]['pred_count'] += 1
 
-    # Now compute precision, recall, F1
+    return compute_scores(metrics, categories)
+
+
+def compute_scores(metrics, categories):
+    """
+    Computes the precision, recall and F1 of each class name in categories
+    from the counts in a dictionary returned by `compute_metrics`.
+    """
     for cat in categories:
         try:
             p = metrics[cat]['tp']/metrics[cat]['pred_count']
@@ -109,25 +195,37 @@ def compute_metrics(comparisons, categories):
 
 
 def main():
+    from models.mention_level_models import MentionLevelModel
+    from models.lexicon_index import LexiconIndex
     saved_annotations = os.path.join(datadir, rel_path)
     try:
         assert os.path.exists(saved_annotations)
     except AssertionError as e:
         print("Make sure {} exists".format(saved_annotations))
         exit()
-    documents = import_from_xlsx(os.path.join(datadir, "corpus"), saved_annotations)
+    if os.path.isdir(saved_annotations):
+        documents = import_from_ehost(os.path.join(datadir, "corpus"), saved_annotations, workers=workers)
+    else:
+        documents = import_from_xlsx(os.path.join(datadir, "corpus"), saved_annotations, workers=workers)
     print("{} Documents".format(len(documents)))
 
     targets = os.path.abspath('lexicon/targets.tsv')
     modifiers = os.path.abspath('lexicon/modifiers.tsv')
-    model = MentionLevelModel(targets, modifiers)
+    model = MentionLevelModel(targets, modifiers, gate_on_targets=True)
 
     results = [] # This will contain a list of dicts with counts and results
     comparisons = [] # List of AnnotationComparisons
     # Specify which categories to look at
     categories = ['Evidence of SSI', 'Evidence of UTI', 'Evidence of Pneumonia']
+    if lexicon_index:
+        index = LexiconIndex.load(lexicon_index)
+        num_annotated = index.annotate_documents(documents.values(), model)
+        index.save(lexicon_index)
+        print("Annotated {} sentences".format(num_annotated))
+    else:
+        for name, document in documents.items():
+            document.annotate(model)
     for name, document in documents.items():
-        document.annotate(model)
         comparisons.extend(document.compare_annotations(categories=categories))
     metrics = compute_metrics(comparisons, categories)
     with open('test.txt', 'w') as f:
@@ -161,4 +259,6 @@ def main():
 if __name__ == '__main__':
     datadir = sys.argv[1] # Folder contianing /corpus/, /saved/,
     rel_path = sys.argv[2] # path from datadir to Excel file
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1 # Number of processes to read documents with
+    lexicon_index = sys.argv[4] if len(sys.argv) > 4 else None # File to save the lexicon index to
     main()
@@ -0,0 +1,285 @@
+"""
+This script measures how much each row of the lexicon helps or hurts the evaluation metrics.
+Instead of removing a row and evaluating the corpus again, which runs every regular expression
+over every sentence, the corpus is scanned once and the tagObjects that each row marked in every sentence are kept.
+Removing a row is then simulated by building the markups of only the sentences that the row marked
+from the kept tagObjects of the other rows. The rest of pyConText's logic, creating the annotations
+and comparing them to the gold standard only run again for those sentences and documents,
+so the metrics are exactly the ones a full evaluation without the row would give.
+pyConText compiles one expression per literal from the first row with that literal, so when that row is removed
+and the next row with the literal has a different expression, the sentences that the new expression could match
+are marked up again. Identical rows are removed together and reported as one result.
+
+Usage: python lexicon_ablation.py datadir relative/path/to/Annotations.xlsx [--workers N] [--output ablation.tsv]
+"""
+import os
+import re
+import argparse
+
+import pyConTextNLP.pyConTextGraph as pyConText
+
+from evaluate_annotations import import_from_xlsx, import_from_ehost, compute_metrics, compute_scores
+from models.mention_level_models import MentionLevelModel
+from models.lexicon_index import get_entry
+from models.lexicon_matcher import get_pattern
+from models.markup_cache import copy_tag_object, normalize_sentence
+
+
+COUNTS = ('true_count', 'pred_count', 'tp', 'fp', 'fn')
+SCORES = ('precision', 'recall', 'f1')
+
+
+class LexiconAblation(object):
+    """
+    Computes the metrics of `model` on `documents` with each row of the lexicon removed.
+    `documents` are ClinicalTextDocuments with gold_standard annotations.
+    Rows are identified by the tuples returned by `lexicon_index.get_entry()`.
+    Identical rows have the same entry, so they're removed together.
+    """
+
+    def __init__(self, documents, model, categories):
+        self.documents = {document.rpt_id: document for document in documents}
+        self.model = model
+        self.categories = categories
+        self.rows = {} # entry: [item idx, ...]
+        for idx, (item, mode) in enumerate(model.matcher.items):
+            self.rows.setdefault(get_entry(item, mode), []).append(idx)
+        self.marks = {} # (rpt_id, sentence_num): [(item idx, mode, [tagObject, ...]), ...]
+        self.postings = {} # entry: set((rpt_id, sentence_num))
+        self.annotations = {} # (rpt_id, sentence_num): [Annotation, ...]
+        self.comparisons = {} # rpt_id: [AnnotationComparison, ...]
+        self.metrics = None
+
+
+    def mark_sentence(self, text, without=(), regexes=None):
+        """
+        Returns a list of (item idx, mode, [tagObject, ...]) for every row of the lexicon that matches `text`,
+        in the order that `LexiconMatcher.mark()` adds them to a markup.
+        The rows in `without` are skipped, and `regexes` is a dictionary of {item idx: compiled regex}
+        with expressions to use instead of the ones the matcher was compiled with.
+        If the model is gated on targets and no target matches, an empty list is returned.
+        """
+        regexes = regexes or {}
+        markup = pyConText.ConTextMarkup()
+        markup.setRawText(text)
+        markup.cleanText()
+        matcher = self.model.matcher
+        marks = []
+        # Modifiers come before targets in `matcher.items`
+        for idx in sorted(set(matcher.get_candidates(markup.getText())).union(regexes)):
+            if idx in without:
+                continue
+            mode = matcher.items[idx][1]
+            terms = matcher.mark_item(markup, idx, regexes.get(idx))
+            if terms:
+                marks.append((idx, mode, terms))
+        if self.model.gate_on_targets and not any(mode == 'target' for (idx, mode, terms) in marks):
+            return []
+        return marks
+
+
+    def build_markup(self, text, marks, without=()):
+        """
+        Returns the markup that `MentionLevelModel.markup_sentence()` would return for `text`
+        from the tagObjects in `marks`, leaving out the ones marked by the rows in `without`.
+        """
+        marks = [(idx, mode, terms) for (idx, mode, terms) in marks if idx not in without]
+        markup = pyConText.ConTextMarkup()
+        markup.setRawText(text)
+        markup.cleanText()
+        if self.model.gate_on_targets and not any(mode == 'target' for (idx, mode, terms) in marks):
+            return markup
+        for idx, mode, terms in marks:
+            markup.add_nodes_from([copy_tag_object(term, markup) for term in terms], category=mode)
+        try:
+            markup.pruneMarks()
+        except TypeError as e:
+            print("Error in pruneMarks")
+            print(markup)
+            print(e)
+        markup.dropMarks('Exclusion')
+        markup.applyModifiers()
+        markup.pruneSelfModifyingRelationships()
+        markup.dropInactiveModifiers()
+        return markup
+
+
+    def get_shifted_regexes(self, entry):
+        """
+        pyConText compiles one expression per literal from the first row with that literal.
+        Returns a dictionary of {item idx: compiled regex} with the expression that the other rows
+        with the literal of `entry` would use without it, or an empty dictionary if they wouldn't change.
+        """
+        without = self.rows[entry]
+        literal = entry[1]
+        rows = [idx for idx, (item, mode) in enumerate(self.model.matcher.items) if item.getLiteral() == literal]
+        remaining = [idx for idx in rows if idx not in without]
+        if rows[0] not in without or not remaining:
+            return {}
+        pattern = get_pattern(self.model.matcher.items[remaining[0]][0])
+        if pattern == self.model.matcher.regexes[rows[0]].pattern:
+            return {}
+        regex = re.compile(pattern, re.IGNORECASE|re.UNICODE)
+        return {idx: regex for idx in remaining}
+
+
+    def mark_documents(self):
+        """
+        Scans every sentence of the corpus once and sets the hai_detect annotations of every document.
+        Returns the metrics of the full lexicon.
+        """
+        comparisons = []
+        for rpt_id, document in self.documents.items():
+            for sentence_num, sentence in enumerate(document.sentences):
+                marks = self.mark_sentence(sentence['text'])
+                if not marks:
+                    continue
+                key = (rpt_id, sentence_num)
+                self.marks[key] = marks
+                for idx, mode, terms in marks:
+                    self.postings.setdefault(get_entry(self.model.matcher.items[idx][0], mode), set()).add(key)
+                markup = self.build_markup(sentence['text'], marks)
+                self.annotations[key] = document.annotate_sentence(self.model, sentence_num, sentence, markup=markup)
+            document.annotations['hai_detect'] = self.get_annotations(rpt_id)
+            document.sentences_with_annotations = [a.sentence_num for a in document.annotations['hai_detect']]
+            self.comparisons[rpt_id] = document.compare_annotations(categories=self.categories)
+            comparisons.extend(self.comparisons[rpt_id])
+        self.metrics = compute_metrics(comparisons, self.categories)
+        return self.metrics
+
+
+    def get_annotations(self, rpt_id, new_annotations=None):
+        """
+        Returns the hai_detect annotations of a document,
+        with the annotations of the sentences in `new_annotations`, {(rpt_id, sentence_num): [Annotation, ...]},
+        instead of the ones of the full lexicon.
+        """
+        new_annotations = new_annotations or {}
+        document = self.documents[rpt_id]
+        annotations = []
+        for sentence_num in range(len(document.sentences)):
+            key = (rpt_id, sentence_num)
+            if key in new_annotations:
+                annotations.extend(new_annotations[key])
+            elif key in self.marks:
+                annotations.extend(self.annotations[key])
+        return annotations
+
+
+    def annotate_without(self, entry):
+        """
+        Returns a dictionary of {(rpt_id, sentence_num): [Annotation, ...]} for every sentence
+        whose annotations could change if the lexicon row `entry` were removed.
+        Usually these are the sentences that the row marked, whose markups are built from the kept tagObjects
+        of the other rows. If the other rows with its literal would use a different expression,
+        every sentence that they marked or could match is marked up again.
+        """
+        without = set(self.rows[entry])
+        regexes = self.get_shifted_regexes(entry)
+        affected = set(self.postings.get(entry, ()))
+        if regexes:
+            for other_entry, keys in self.postings.items():
+                if other_entry[1] == entry[1]:
+                    affected.update(keys)
+            regex = next(iter(regexes.values()))
+            for rpt_id, document in self.documents.items():
+                for sentence_num, sentence in enumerate(document.sentences):
+                    if regex.search(normalize_sentence(sentence['text'])):
+                        affected.add((rpt_id, sentence_num))
+
+        new_annotations = {}
+        for rpt_id, sentence_num in affected:
+            document = self.documents[rpt_id]
+            sentence = document.sentences[sentence_num]
+            if regexes:
+                marks = self.mark_sentence(sentence['text'], without, regexes)
+            else:
+                marks = self.marks[(rpt_id, sentence_num)]
+            markup = self.build_markup(sentence['text'], marks, without)
+            new_annotations[(rpt_id, sentence_num)] = document.annotate_sentence(
+                self.model, sentence_num, sentence, markup=markup)
+        return new_annotations
+
+
+    def ablate(self, entry):
+        """
+        Returns the metrics of the corpus without the lexicon row `entry`.
+        Only the comparisons of the documents with a sentence that could change are computed again.
+        """
+        new_annotations = self.annotate_without(entry)
+        old_comparisons = []
+        new_comparisons = []
+        for rpt_id in sorted({rpt_id for (rpt_id, sentence_num) in new_annotations}):
+            document = self.documents[rpt_id]
+            annotations = document.annotations['hai_detect']
+            document.annotations['hai_detect'] = self.get_annotations(rpt_id, new_annotations)
+            new_comparisons.extend(document.compare_annotations(categories=self.categories))
+            document.annotations['hai_detect'] = annotations
+            old_comparisons.extend(self.comparisons[rpt_id])
+
+        old_metrics = compute_metrics(old_comparisons, self.categories)
+        new_metrics = compute_metrics(new_comparisons, self.categories)
+        metrics = {}
+        for cat in self.categories:
+            metrics[cat] = {key: self.metrics[cat][key] - old_metrics[cat][key] + new_metrics[cat][key]
+                            for key in COUNTS}
+        return compute_scores(metrics, self.categories)
+
+
+    def run(self):
+        """
+        Returns a list with a dictionary for every row of the lexicon and category:
+        {'mode', 'literal', 'category', 'num_rows', 'class', 'num_sentences', 'delta_tp', ..., 'delta_f1'}
+        where 'num_rows' is the number of identical rows that are removed together.
+        A positive delta means that the metric would go up if the row were removed.
+        """
+        if self.metrics is None:
+            self.mark_documents()
+        results = []
+        for entry, rows in self.rows.items():
+            item, mode = self.model.matcher.items[rows[0]]
+            metrics = self.ablate(entry)
+            for cat in self.categories:
+                result = {'mode': mode, 'literal': item.getLiteral(), 'category': ', '.join(item.getCategory()),
+                          'num_rows': len(rows), 'class': cat, 'num_sentences': len(self.postings.get(entry, ()))}
+                for key in ('tp', 'fp', 'fn') + SCORES:
+                    result['delta_' + key] = metrics[cat][key] - self.metrics[cat][key]
+                results.append(result)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Computes the change in metrics from removing each row of the lexicon")
+    parser.add_argument('datadir', help="Folder containing /corpus/")
+    parser.add_argument('rel_path', help="Path from datadir to the Excel file or directory of knowtator files")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes to read documents with")
+    parser.add_argument('--targets', default=os.path.abspath('lexicon/targets.tsv'))
+    parser.add_argument('--modifiers', default=os.path.abspath('lexicon/modifiers.tsv'))
+    parser.add_argument('--output', default='ablation.tsv', help="File to save the deltas of every row to")
+    args = parser.parse_args()
+
+    saved_annotations = os.path.join(args.datadir, args.rel_path)
+    if os.path.isdir(saved_annotations):
+        documents = import_from_ehost(os.path.join(args.datadir, "corpus"), saved_annotations, workers=args.workers)
+    else:
+        documents = import_from_xlsx(os.path.join(args.datadir, "corpus"), saved_annotations, workers=args.workers)
+    print("{} Documents".format(len(documents)))
+    model = MentionLevelModel(args.targets, args.modifiers, gate_on_targets=True)
+    categories = ['Evidence of SSI', 'Evidence of UTI', 'Evidence of Pneumonia']
+
+    ablation = LexiconAblation(documents.values(), model, categories)
+    print(ablation.mark_documents())
+    results = ablation.run()
+    # The rows that hurt F1 the most come first
+    results.sort(key=lambda result: -result['delta_f1'])
+    columns = ['mode', 'literal', 'category', 'num_rows', 'class', 'num_sentences',
+               'delta_tp', 'delta_fp', 'delta_fn', 'delta_precision', 'delta_recall', 'delta_f1']
+    with open(args.output, 'w') as f:
+        f.write('\t'.join(columns) + '\n')
+        for result in results:
+            f.write('\t'.join(str(result[column]) for column in columns) + '\n')
+    print("Saved {} results to {}".format(len(results), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,29 @@
 """
 This script offers a simple demo of how to run hai_detect on all files found in `corpus_dir`.
-Usage: python main.py /path/to/batch/folder
+Usage: python main.py /path/to/batch/folder [--workers N]
 It will read in all .txt files found in /folder/corpus
 and will save annotations in /folder/hai_detect
+With --workers, the reports are annotated in a pool of N processes.
+With --result-cache, reports that were annotated in a previous run with the same lexicon are only saved again.
+With --archive, annotations are saved in sharded archives in /folder/hai_detect instead of one file per report.
+They can be extracted with `python -m annotations.KnowtatorArchive`.
+With --export DIR, a row for every hai_detect annotation is also saved in JSON Lines or Parquet files in DIR.
+With --profile FILE, the time, matches and annotations of every row of the lexicon are saved to a csv or json file.
 """
 import glob, os
 import argparse
+import multiprocessing
 
 
 
 from annotations.Annotation import Annotation
 from annotations.ClinicalTextDocument import ClinicalTextDocument
 from models.mention_level_models import MentionLevelModel
+from models.sentence_guard import SentenceGuard
+from models.result_cache import ResultCache
+from annotations.KnowtatorArchive import KnowtatorArchive
+from annotations.AnnotationExport import AnnotationExporter
+from pipeline import annotate_stream
 from hai_exceptions.exceptions import MalformedeHostExcelRow, MalformedSpanValue
 
 
@@ -33,25 +45,250 @@ def main():
     modifiers = os.path.abspath('lexicon/modifiers.tsv')
     #targets = 'https://raw.githubusercontent.com/abchapman93/hai_detect/master/lexicon/targets.tsv'
     #modifiers = 'https://raw.githubusercontent.com/abchapman93/hai_detect/master/lexicon/modifiers.tsv'
-    model = MentionLevelModel(targets, modifiers)
+    # Long sentences such as flowsheets are marked up in windows so that they can't stall the run
+    guard = None
+    if args.max_sentence_tokens:
+        guard = SentenceGuard(max_tokens=args.max_sentence_tokens, time_budget=args.sentence_time_budget)
+    if args.model_snapshot:
+        # Load the compiled lexicon, rebuilding the snapshot if the lexicon files have changed
+        model = MentionLevelModel.load(args.model_snapshot, targets, modifiers,
+                                       gate_on_targets=True, cache_size=args.cache_size, guard=guard)
+    else:
+        model = MentionLevelModel(targets, modifiers, gate_on_targets=True, cache_size=args.cache_size, guard=guard)
+    if model.cache is not None and args.markup_cache:
+        print("Loaded {} cached markups".format(model.cache.load(args.markup_cache)))
+    # Annotations of reports that haven't changed since the last run are loaded from here
+    result_cache = ResultCache(args.result_cache, model) if args.result_cache else None
+    archive_options = None
+    if args.archive:
+        archive_options = {'shard_size': args.shard_size, 'archive_format': args.archive_format,
+                           'compress': args.compress}
+    export_options = None
+    if args.export:
+        os.makedirs(args.export, exist_ok=True)
+        export_options = {'outdir': args.export, 'export_format': args.export_format, 'annotators': ['hai_detect']}
+
+    if args.workers > 1:
+        profile = annotate_in_pool(reports, model, outdir, args.workers, result_cache_dir=args.result_cache,
+                                   archive_options=archive_options, export_options=export_options,
+                                   profile=bool(args.profile))
+        if profile is not None:
+            save_profile(profile, args.profile)
+        return
+
+    if args.profile:
+        model.start_profile()
+
+    archive = KnowtatorArchive(outdir, **archive_options) if archive_options else None
+    exporter = AnnotationExporter(**export_options) if export_options else None
+    if args.stream:
+        # Read, annotate and save one report at a time without listing the corpus first
+        reports = glob.iglob(os.path.join(args.datadir, 'corpus', '*.txt'))
+        try:
+            for i, result in enumerate(annotate_stream(reports, model, outdir, result_cache=result_cache,
+                                                       archive=archive)):
+                if exporter is not None:
+                    exporter.add_annotations(result.annotations)
+                if i % 100 == 0:
+                    print("{} reports annotated".format(i))
+        finally:
+            # Save the reports that were archived or exported before any error
+            if archive is not None:
+                archive.close()
+            if exporter is not None:
+                exporter.close()
+        finish_run(model, result_cache, args)
+        return
 
     # Now iterate through each report and annotate using `model`
     # Save findings in `outdir`
-    for i, report in enumerate(reports):
-        if i % 10 == 0:
-            print("{}/{}".format(i, len(reports)))
-        document = ClinicalTextDocument(filepath=report)
-        document.annotate(model)
-        for annotation in document.get_annotations():
-            print(annotation)
-            print()
-        document.to_knowtator(outdir)
+    try:
+        for i, report in enumerate(reports):
+            if i % 10 == 0:
+                print("{}/{}".format(i, len(reports)))
+            document = ClinicalTextDocument(filepath=report)
+            if result_cache is not None:
+                result_cache.annotate(document, model)
+            else:
+                document.annotate(model)
+            for annotation in document.get_annotations():
+                print(annotation)
+                print()
+            if archive is not None:
+                archive.add(document)
+            else:
+                document.to_knowtator(outdir)
+            if exporter is not None:
+                exporter.add(document)
+    finally:
+        # Save the reports that were archived or exported before any error
+        if archive is not None:
+            archive.close()
+        if exporter is not None:
+            exporter.close()
+    finish_run(model, result_cache, args)
+
+
+def finish_run(model, result_cache, args):
+    """
+    Prints the stats of the caches, saves the markup cache for the next run and saves the profile.
+    """
+    if result_cache is not None:
+        print(result_cache.get_stats())
+    if model.cache is not None:
+        print(model.cache.get_stats())
+        if args.markup_cache:
+            model.cache.save(args.markup_cache)
+    if args.profile:
+        save_profile(model.stop_profile(), args.profile)
+
+
+def save_profile(profile, filepath, num_rows=10):
+    """
+    Saves a MatchProfile and prints the slowest rows of the lexicon and the number that never matched.
+    """
+    profile.save(filepath)
+    print("Slowest lexicon rows in {} sentences:".format(profile.num_sentences))
+    for row in profile.get_rows()[:num_rows]:
+        print("{:>10.2f}ms {:>5.1f}% {:>8} matches  {} {}".format(
+            row['seconds'] * 1000, row['percent_of_time'], row['matches'], row['mode'], row['literal']))
+    print("{} rows never matched".format(len(profile.get_dead_rows())))
+    print("Saved profile at {}".format(filepath))
+
+
+# The model and result cache used by each worker process
+_worker_model = None
+_worker_result_cache = None
+
+
+def _init_worker(model, result_cache_dir=None):
+    """
+    Sets the model for a worker process.
+    With the 'fork' start method the model is inherited from the parent without being copied,
+    otherwise it is unpickled once per worker.
+    """
+    global _worker_model, _worker_result_cache
+    _worker_model = model
+    if result_cache_dir:
+        _worker_result_cache = ResultCache(result_cache_dir, model)
+
+
+def _annotate_chunk(chunk, outdir, archive_options=None, export_options=None, profile=False):
+    """
+    Annotates a list of reports in a worker process and saves them to `outdir`.
+    If `archive_options` are given, the reports are saved in a KnowtatorArchive that's closed with the chunk.
+    If `export_options` are given, the annotations are also exported with an AnnotationExporter.
+    Returns the worker's process ID, the number of reports, the number of annotations
+    and, if `profile` is True, the MatchProfile of the chunk.
+    """
+    num_annotations = 0
+    if profile:
+        _worker_model.start_profile()
+    archive = KnowtatorArchive(outdir, **archive_options) if archive_options else None
+    exporter = AnnotationExporter(**export_options) if export_options else None
+    try:
+        for report in chunk:
+            document = ClinicalTextDocument(filepath=report)
+            if _worker_result_cache is not None:
+                _worker_result_cache.annotate(document, _worker_model)
+            else:
+                document.annotate(_worker_model)
+            num_annotations += len(document.annotations['hai_detect'])
+            if archive is not None:
+                archive.add(document)
+            else:
+                document.to_knowtator(outdir, verbose=False)
+            if exporter is not None:
+                exporter.add(document)
+    finally:
+        # Save the reports that were archived before any error
+        if archive is not None:
+            archive.close()
+        if exporter is not None:
+            exporter.close()
+    return os.getpid(), len(chunk), num_annotations, _worker_model.stop_profile()
+
+
+def _annotate_chunk_star(args):
+    return _annotate_chunk(*args)
+
+
+def chunk_by_size(reports, num_chunks):
+    """
+    Splits `reports` into at most `num_chunks` lists of roughly the same total file size.
+    The chunks with the largest total size come first so that the longest chunks are dispatched first.
+    """
+    reports = sorted(reports, key=os.path.getsize, reverse=True)
+    chunk_sizes = [0] * num_chunks
+    chunks = [[] for _ in range(num_chunks)]
+    for report in reports:
+        # Add each report to the chunk with the smallest total size
+        i = chunk_sizes.index(min(chunk_sizes))
+        chunks[i].append(report)
+        chunk_sizes[i] += os.path.getsize(report)
+    chunks = sorted([(size, chunk) for size, chunk in zip(chunk_sizes, chunks) if chunk], key=lambda pair: -pair[0])
+    return [chunk for size, chunk in chunks]
 
 
+def annotate_in_pool(reports, model, outdir, workers, chunks_per_worker=4, result_cache_dir=None,
+                     archive_options=None, export_options=None, profile=False):
+    """
+    Annotates `reports` with `model` in a pool of `workers` processes.
+    Progress is printed for each chunk of reports as it finishes.
+    If `result_cache_dir` is given, the workers share a ResultCache in that directory.
+    If `archive_options` are given, each chunk is saved to its own KnowtatorArchive shards in `outdir`.
+    If `export_options` are given, each chunk's annotations are exported to their own file.
+    If `profile` is True, the MatchProfiles of every chunk are merged and returned.
+    """
+    chunks = chunk_by_size(reports, workers * chunks_per_worker)
+    print("Annotating {} reports in {} chunks with {} workers".format(len(reports), len(chunks), workers))
+    num_done = 0
+    worker_counts = {} # pid: [num_reports, num_annotations]
+    total_profile = None
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(model, result_cache_dir)) as pool:
+        # Chunks are dispatched in order and their results are read as soon as they finish
+        results = pool.imap_unordered(_annotate_chunk_star, [(chunk, outdir, archive_options, export_options, profile)
+                                                             for chunk in chunks])
+        for pid, num_reports, num_annotations, chunk_profile in results:
+            if chunk_profile is not None:
+                if total_profile is None:
+                    total_profile = chunk_profile
+                else:
+                    total_profile.merge(chunk_profile)
+            num_done += num_reports
+            counts = worker_counts.setdefault(pid, [0, 0])
+            counts[0] += num_reports
+            counts[1] += num_annotations
+            print("Worker {}: {} reports, {} annotations ({}/{} total)".format(
+                pid, counts[0], counts[1], num_done, len(reports)))
+    return total_profile
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('datadir', help="the directory containing subdirectories 'corpus' and 'saved'")
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help="the number of sentence markups to cache, 0 to disable caching")
+    parser.add_argument('--markup-cache', help="a file to load cached markups from and save them to after the run")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="the number of processes to annotate reports with")
+    parser.add_argument('--stream', action='store_true',
+                        help="annotate the corpus as a stream without printing annotations")
+    parser.add_argument('--model-snapshot', help="a file to load the compiled model from, created if it doesn't exist")
+    parser.add_argument('--result-cache',
+                        help="a directory of cached annotations, reports that haven't changed aren't annotated again")
+    parser.add_argument('--archive', action='store_true',
+                        help="save annotations in sharded archives instead of one knowtator file per report")
+    parser.add_argument('--shard-size', type=int, default=1000, help="the number of reports in each archive shard")
+    parser.add_argument('--archive-format', choices=['zip', 'tar'], default='zip')
+    parser.add_argument('--compress', action='store_true', help="compress the archive shards")
+    parser.add_argument('--export', help="a directory to export a row for every annotation to")
+    parser.add_argument('--export-format', choices=['jsonl', 'parquet'], default='jsonl')
+    parser.add_argument('--profile',
+                        help="a .csv or .json file to save the time, matches and annotations of each lexicon row to")
+    parser.add_argument('--max-sentence-tokens', type=int, default=0,
+                        help="mark up sentences longer than this many tokens in overlapping windows, 0 to disable")
+    parser.add_argument('--sentence-time-budget', type=float, default=0.25,
+                        help="seconds a windowed sentence may take before the rest of it is marked up in smaller windows")
     args = parser.parse_args()
     main()
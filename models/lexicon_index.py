@@ -0,0 +1,261 @@
+"""
+This module defines `LexiconIndex`, which makes it possible to see the effect of a lexicon edit
+without annotating the whole corpus again.
+
+The index keeps the annotations of every document along with two inverted indices:
+    - `entry_postings` maps each lexicon entry to the sentences that its regular expression matched
+    - `gram_postings` maps every `prefix_length`-character string to the sentences that contain it,
+      which are the only sentences that a new entry with that prefix could match
+When the lexicon changes, only the sentences that a removed entry matched or that an added entry
+could match are marked up again. An edited row is a removed entry followed by an added one.
+pyConText compiles one expression per literal from the first row with it, so reordering the rows
+that share a literal also changes them.
+
+Example:
+    index = LexiconIndex.load('lexicon_index.pkl')
+    model = MentionLevelModel(targets, modifiers)
+    index.annotate_documents(documents, model)
+    index.save('lexicon_index.pkl')
+"""
+import os
+import hashlib
+import pickle
+
+from models.lexicon_matcher import UnsupportedPattern, get_pattern
+from models.markup_cache import normalize_sentence
+from models.result_cache import RESULT_VERSION, dump_annotations, load_annotations
+
+
+def get_entry(item, mode):
+    """
+    Returns a tuple that identifies a single row of the lexicon.
+    """
+    return (mode, item.getLiteral(), tuple(item.getCategory()), item.getRE(), item.getRule())
+
+
+def get_rows_by_literal(entries):
+    """
+    Returns a dictionary mapping each literal to the list of its entries in lexicon order.
+    """
+    rows = {}
+    for entry in entries:
+        rows.setdefault(entry[1], []).append(entry)
+    return rows
+
+
+def get_text_hash(text):
+    return hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class LexiconIndex(object):
+    """
+    An index of the sentences of a corpus by the lexicon entries that matched them.
+    `entries` is the list of entries of the lexicon that the saved annotations were created with.
+    `documents` maps each rpt_id to (hash of the text, [sentence id, ...], saved annotations).
+    Sentence ids are never reused. When a document changes or is no longer in the corpus,
+    the ids of its old sentences are dropped from `sentences` and pruned from the postings.
+    """
+
+    def __init__(self, prefix_length=3):
+        self.version = RESULT_VERSION
+        self.gate_on_targets = None
+        self.guard_config = None
+        self.prefix_length = prefix_length
+        self.entries = []
+        self.entry_postings = {} # entry: set(sentence id)
+        self.gram_postings = {} # prefix: set(sentence id)
+        self.sentences = {} # sentence id: (rpt_id, sentence_num)
+        self.documents = {} # rpt_id: (text hash, [sentence id, ...], annotation states)
+        self.next_sentence_id = 0
+
+
+    def _get_grams(self, text):
+        folded = text.casefold()
+        k = self.prefix_length
+        return {folded[i:i+k] for i in range(len(folded) - k + 1)}
+
+
+    def _get_items(self, model):
+        "Returns a list of (entry, contextItem, compiled regex) in the order of `model.matcher.items`"
+        return [(get_entry(item, mode), item, regex)
+                for (item, mode), regex in zip(model.matcher.items, model.matcher.regexes)]
+
+
+    def _index_sentence(self, sentence_id, text, items, matcher):
+        """
+        Adds the sentence to `gram_postings` and to the postings of every entry in `items` that matches it.
+        Only the entries that `matcher` finds a prefix of in the sentence are searched.
+        """
+        text = normalize_sentence(text)
+        for gram in self._get_grams(text):
+            self.gram_postings.setdefault(gram, set()).add(sentence_id)
+        for idx in matcher.get_candidates(text):
+            entry, item, regex = items[idx]
+            if regex.search(text):
+                self.entry_postings.setdefault(entry, set()).add(sentence_id)
+
+
+    def _index_document(self, document, items, matcher):
+        """
+        Indexes every sentence of `document` under new sentence ids.
+        """
+        sentence_ids = []
+        for sentence_num, sentence in enumerate(document.sentences):
+            sentence_id = self.next_sentence_id
+            self.next_sentence_id += 1
+            self.sentences[sentence_id] = (document.rpt_id, sentence_num)
+            self._index_sentence(sentence_id, sentence['text'], items, matcher)
+            sentence_ids.append(sentence_id)
+        self.documents[document.rpt_id] = (get_text_hash(document.raw_text), sentence_ids, None)
+
+
+    def _prune_postings(self):
+        """
+        Removes the ids of sentences that are no longer in `sentences` from the postings.
+        """
+        for postings in (self.entry_postings, self.gram_postings):
+            for key in list(postings):
+                sentence_ids = {sentence_id for sentence_id in postings[key] if sentence_id in self.sentences}
+                if sentence_ids:
+                    postings[key] = sentence_ids
+                else:
+                    del postings[key]
+
+
+    def get_candidates(self, matcher, item):
+        """
+        Returns the ids of the sentences that `item` could match, or None if it could match any sentence.
+        """
+        try:
+            prefixes = matcher.get_prefixes(get_pattern(item))
+        except UnsupportedPattern:
+            return None
+        candidates = set()
+        for prefix in prefixes:
+            candidates.update(self.gram_postings.get(prefix, ()))
+        return candidates
+
+
+    def get_changed_literals(self, model):
+        """
+        Returns the set of literals with a row that was added, removed, edited or moved
+        relative to the other rows with the same literal in `model`'s lexicon.
+        pyConText compiles one expression per literal from the first row with it,
+        so every entry with one of these literals may match different sentences.
+        """
+        old_rows = get_rows_by_literal(self.entries)
+        new_rows = get_rows_by_literal(get_entry(item, mode) for item, mode in model.matcher.items)
+        return {literal for literal in set(old_rows).union(new_rows)
+                if old_rows.get(literal) != new_rows.get(literal)}
+
+
+    def get_affected_sentences(self, model):
+        """
+        Returns the set of sentence ids whose markup could be different with `model`'s lexicon.
+        """
+        changed_literals = self.get_changed_literals(model)
+        affected = set()
+        for entry in self.entries:
+            if entry[1] in changed_literals:
+                affected.update(self.entry_postings.get(entry, ()))
+        for item, mode in model.matcher.items:
+            if item.getLiteral() in changed_literals:
+                candidates = self.get_candidates(model.matcher, item)
+                if candidates is None:
+                    return set(self.sentences)
+                affected.update(candidates)
+        return affected.intersection(self.sentences)
+
+
+    def annotate_documents(self, documents, model):
+        """
+        Sets the hai_detect annotations of every ClinicalTextDocument in `documents` for `model`'s lexicon.
+        Documents that are new or have changed are annotated in full.
+        For every other document, the saved annotations are loaded and only the sentences
+        that the lexicon changes could affect are annotated again.
+        Returns the number of sentences that were annotated.
+        """
+        model = model.pin()
+        guard_config = model.guard.get_config() if model.guard is not None else None
+        if self.version != RESULT_VERSION or self.gate_on_targets != model.gate_on_targets \
+                or getattr(self, 'guard_config', None) != guard_config:
+            # The annotation logic changed, so none of the saved annotations can be used
+            self.__init__(self.prefix_length)
+            self.gate_on_targets = model.gate_on_targets
+            self.guard_config = guard_config
+        documents = {document.rpt_id: document for document in documents}
+        # The documents with saved annotations that can be updated
+        reusable = set()
+        num_dropped = 0
+        for rpt_id, (text_hash, sentence_ids, states) in list(self.documents.items()):
+            if rpt_id in documents and states is not None and text_hash == get_text_hash(documents[rpt_id].raw_text):
+                reusable.add(rpt_id)
+                continue
+            # The document is gone or will be indexed again under new sentence ids
+            del self.documents[rpt_id]
+            for sentence_id in sentence_ids:
+                self.sentences.pop(sentence_id, None)
+            num_dropped += len(sentence_ids)
+        if num_dropped:
+            self._prune_postings()
+
+        changed_literals = self.get_changed_literals(model)
+        affected_by_document = {} # rpt_id: {sentence_id: sentence_num}
+        for sentence_id in self.get_affected_sentences(model):
+            rpt_id, sentence_num = self.sentences[sentence_id]
+            if rpt_id in reusable:
+                affected_by_document.setdefault(rpt_id, {})[sentence_id] = sentence_num
+
+        # Update the postings of the entries whose expressions may have changed
+        items = self._get_items(model)
+        changed_items = [(entry, item, regex) for (entry, item, regex) in items if entry[1] in changed_literals]
+        for entry in self.entries:
+            if entry[1] in changed_literals:
+                self.entry_postings.pop(entry, None)
+        for rpt_id, sentence_nums in affected_by_document.items():
+            for sentence_id, sentence_num in sentence_nums.items():
+                text = normalize_sentence(documents[rpt_id].sentences[sentence_num]['text'])
+                for entry, item, regex in changed_items:
+                    if regex.search(text):
+                        self.entry_postings.setdefault(entry, set()).add(sentence_id)
+
+        num_annotated = 0
+        for rpt_id, document in documents.items():
+            if rpt_id in reusable:
+                document.annotations['hai_detect'] = load_annotations(self.documents[rpt_id][2], document)
+                sentence_nums = affected_by_document.get(rpt_id, {}).values()
+                document.reannotate(model, sentence_nums)
+                # The kept annotations are the ones the new lexicon would have created
+                for annotation in document.annotations['hai_detect']:
+                    annotation.lexicon_version = model.lexicon_version
+                num_annotated += len(sentence_nums)
+            else:
+                document.annotate(model)
+                self._index_document(document, items, model.matcher)
+                num_annotated += len(document.sentences)
+            text_hash, sentence_ids, states = self.documents[rpt_id]
+            if document.degraded_sentences:
+                # The annotations depend on how long the sentences took, so the document is annotated in full next time
+                self.documents[rpt_id] = (text_hash, sentence_ids, None)
+                continue
+            self.documents[rpt_id] = (text_hash, sentence_ids, dump_annotations(document.annotations['hai_detect']))
+        self.entries = [entry for (entry, item, regex) in items]
+        return num_annotated
+
+
+    def save(self, filepath):
+        tmp_filepath = filepath + '.tmp'
+        with open(tmp_filepath, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+
+
+    @classmethod
+    def load(cls, filepath, prefix_length=3):
+        """
+        Loads an index saved with `save()`, or returns an empty index if `filepath` doesn't exist.
+        """
+        if not os.path.exists(filepath):
+            return cls(prefix_length)
+        with open(filepath, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,275 @@
+"""
+This module defines `LexiconMatcher`, which marks all targets and modifiers in a sentence
+with a single scan of the text instead of running every lexicon regex over every sentence.
+
+Each contextItem's regular expression is reduced to the set of fixed-length literal prefixes
+that any match must start with. When a sentence is marked up, the text is scanned once for those
+prefixes and only the items that could possibly match are run with `mark_item()`, a copy of pyConText's `markItem`.
+Items whose regular expressions can't be reduced to prefixes (for example, ones that start with `.`
+or a negated character class) are always run.
+The tagObjects that are added to the markup are exactly the ones that `ConTextMarkup.markItems`
+would have added, in the same order.
+Every matcher keeps the expressions it was compiled with, so a matcher built for an older lexicon
+keeps marking sentences the same way after a new lexicon is loaded.
+"""
+import re
+import time
+try:
+    from re import _parser as sre_parse
+except ImportError: # Python < 3.11
+    import sre_parse
+
+import pyConTextNLP.pyConTextGraph as pyConText
+
+
+def get_pattern(item):
+    """
+    Returns the regular expression that pyConText compiles for `item`.
+    """
+    if not item.getRE():
+        return r"\b{}\b".format(item.getLiteral())
+    return item.getRE()
+
+
+class UnsupportedPattern(Exception):
+    "Raised when a regular expression can't be reduced to a set of literal prefixes"
+    pass
+
+
+class LexiconMatcher(object):
+    """
+    A compiled index over a list of modifiers and a list of targets.
+    `prefix_length` is the number of characters that each indexed prefix has.
+    `max_prefixes` is the maximum number of prefixes a single item may expand to
+    before it is treated as an item that always has to be run.
+    """
+
+    def __init__(self, modifiers, targets, prefix_length=3, max_prefixes=256):
+        self.prefix_length = prefix_length
+        self.max_prefixes = max_prefixes
+        # A list of (contextItem, mode) in the order that pyConText would mark them
+        self.items = [(item, 'modifier') for item in modifiers] + [(item, 'target') for item in targets]
+        self.prefix_index = {} # prefix: [item_idx, ...]
+        self.unindexed = [] # item_idx that are run on every sentence
+        self.regexes = [] # The compiled expression of each item
+        self.compile()
+
+
+    def compile(self):
+        """
+        Builds `prefix_index` and `unindexed` from `self.items`.
+        """
+        self.prefix_index = {}
+        self.unindexed = []
+        self.regexes = []
+        literals = set()
+        for idx, (item, mode) in enumerate(self.items):
+            # The first item with each literal replaces an expression compiled for an older lexicon
+            regex = self._get_compiled_regex(item, refresh=item.getLiteral() not in literals)
+            literals.add(item.getLiteral())
+            self.regexes.append(regex)
+            try:
+                prefixes = self.get_prefixes(regex.pattern)
+            except UnsupportedPattern:
+                self.unindexed.append(idx)
+                continue
+            for prefix in prefixes:
+                self.prefix_index.setdefault(prefix, []).append(idx)
+
+
+    def __setstate__(self, state):
+        """
+        Restores a pickled matcher without recomputing the prefixes.
+        pyConText's cache of compiled expressions is global,
+        so it has to be filled again in the same order in a new process.
+        """
+        self.__dict__.update(state)
+        literals = set()
+        regexes = []
+        for item, mode in self.items:
+            regexes.append(self._get_compiled_regex(item, refresh=item.getLiteral() not in literals))
+            literals.add(item.getLiteral())
+        if 'regexes' not in state:
+            # Saved before matchers kept their own expressions
+            self.regexes = regexes
+
+
+    def _get_compiled_regex(self, item, refresh=False):
+        """
+        Returns the regular expression that pyConText will use for `item`.
+        pyConText caches compiled expressions by literal, so the first item with a given literal
+        decides the expression for all of them. Items are compiled here in the same order that
+        `MentionLevelModel.markup_sentence` marks them so that the cache is the same.
+        If `refresh` is True, a cached expression with a different pattern is replaced,
+        which happens when the regex of an item is edited and the lexicon is loaded again.
+        """
+        regExp = get_pattern(item)
+        cached = pyConText.compiledRegExprs.get(item.getLiteral())
+        if cached is None or (refresh and cached.pattern != regExp):
+            pyConText.compiledRegExprs[item.getLiteral()] = re.compile(regExp, re.IGNORECASE|re.UNICODE)
+        return pyConText.compiledRegExprs[item.getLiteral()]
+
+
+    def get_prefixes(self, pattern):
+        """
+        Returns the set of casefolded strings of length `prefix_length`
+        that every match of `pattern` has to start with.
+        Raises UnsupportedPattern if this can't be decided.
+        """
+        parsed = sre_parse.parse(pattern, re.IGNORECASE|re.UNICODE)
+        prefixes = self._expand(list(parsed), {''})
+        if not prefixes or any(len(prefix) < self.prefix_length for prefix in prefixes):
+            # The pattern can match something shorter than a prefix
+            raise UnsupportedPattern(pattern)
+        return prefixes
+
+
+    def _expand(self, nodes, partials):
+        """
+        Extends each string in `partials` with every string that the parsed `nodes` can match,
+        stopping once a string is `prefix_length` characters long.
+        Zero-width assertions are skipped, which can only make the set of prefixes larger.
+        """
+        for op, av in nodes:
+            if all(len(p) >= self.prefix_length for p in partials):
+                break
+            if op is sre_parse.LITERAL:
+                partials = self._append_chars(partials, [chr(av)])
+            elif op is sre_parse.IN:
+                partials = self._append_chars(partials, self._get_class_chars(av))
+            elif op is sre_parse.SUBPATTERN:
+                partials = self._expand(list(av[-1]), partials)
+            elif op is sre_parse.BRANCH:
+                branch_partials = set()
+                for branch in av[1]:
+                    branch_partials.update(self._expand(list(branch), partials))
+                partials = branch_partials
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                min_repeat, max_repeat, subpattern = av
+                repeated = set(partials)
+                partials = set(partials) if min_repeat == 0 else set()
+                # Every repetition that adds a character brings a string closer to `prefix_length`,
+                # so no more than `prefix_length` repetitions need to be expanded
+                for i in range(1, min(max_repeat, max(min_repeat, self.prefix_length + 1)) + 1):
+                    repeated = self._expand(list(subpattern), repeated)
+                    if i >= min_repeat:
+                        partials.update(repeated)
+            elif op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                continue
+            else:
+                raise UnsupportedPattern(op)
+            if len(partials) > self.max_prefixes:
+                raise UnsupportedPattern("Too many prefixes")
+        return partials
+
+
+    def _append_chars(self, partials, chars):
+        extended = set()
+        for partial in partials:
+            if len(partial) >= self.prefix_length:
+                extended.add(partial)
+                continue
+            for char in chars:
+                extended.add((partial + char.casefold())[:self.prefix_length])
+        return extended
+
+
+    def _get_class_chars(self, members):
+        """
+        Returns a list of characters that a character class like `[a-z ]` can match.
+        pyConText collapses all whitespace to single spaces before marking,
+        so the whitespace category only ever matches ' '.
+        """
+        chars = []
+        for op, av in members:
+            if op is sre_parse.LITERAL:
+                chars.append(chr(av))
+            elif op is sre_parse.RANGE:
+                chars.extend(chr(c) for c in range(av[0], av[1] + 1))
+            elif op is sre_parse.CATEGORY and av is sre_parse.CATEGORY_SPACE:
+                chars.append(' ')
+            elif op is sre_parse.CATEGORY and av is sre_parse.CATEGORY_DIGIT:
+                chars.extend('0123456789')
+            else:
+                raise UnsupportedPattern(op)
+            if len(chars) > self.max_prefixes:
+                raise UnsupportedPattern("Too many characters")
+        return chars
+
+
+    def get_candidates(self, text):
+        """
+        Returns the sorted indices of all items in `self.items` that could match `text`.
+        """
+        folded = text.casefold()
+        if len(folded) != len(text):
+            # Casefolding changed the offsets, so the prefixes can't be trusted
+            return list(range(len(self.items)))
+        k = self.prefix_length
+        grams = {folded[i:i+k] for i in range(len(folded) - k + 1)}
+        candidates = set(self.unindexed)
+        for gram in grams.intersection(self.prefix_index):
+            candidates.update(self.prefix_index[gram])
+        return sorted(candidates)
+
+
+    def mark_item(self, markup, idx, regex=None):
+        """
+        Returns the tagObjects of every match of item number `idx` in `markup`.
+        Equivalent to `markup.markItem()`, but with the expression this matcher was compiled with
+        instead of the one in pyConText's global cache, or with `regex` if it's given.
+        """
+        item, mode = self.items[idx]
+        if regex is None:
+            regex = self.regexes[idx]
+        terms = []
+        for match in regex.finditer(markup.getText()):
+            term = pyConText.tagObject(item, mode, tagid=markup.getNextTagID(), scope=markup.getScope())
+            term.setSpan(match.span())
+            term.setPhrase(match.group())
+            term.setMatchedGroupDictionary(match.groupdict())
+            terms.append(term)
+        return terms
+
+
+    def _profile_item(self, markup, idx, profile):
+        start = time.perf_counter()
+        terms = self.mark_item(markup, idx)
+        profile.add_call(idx, time.perf_counter() - start, len(terms))
+        return terms
+
+
+    def mark(self, markup, modes=('modifier', 'target'), require_target=False, profile=None):
+        """
+        Marks all items in `markup` with one scan of its text.
+        Equivalent to calling `markup.markItems()` with the modifiers and then the targets.
+        `modes` can be used to only mark modifiers or targets.
+        If `require_target` is True, targets are searched for first and nothing is marked
+        when none of them match.
+        If a MatchProfile is given, the time and matches of every item that is run are added to it.
+        Returns False if marking was skipped because there were no targets, otherwise True.
+        """
+        if not markup.getText():
+            markup.cleanText()
+        candidates = self.get_candidates(markup.getText())
+        if profile is None:
+            mark_item = self.mark_item
+        else:
+            profile.num_sentences += 1
+            mark_item = lambda markup, idx: self._profile_item(markup, idx, profile)
+
+        target_marks = []
+        if 'target' in modes or require_target:
+            target_marks = [mark_item(markup, idx) for idx in candidates if self.items[idx][1] == 'target']
+            if require_target and not any(target_marks):
+                return False
+
+        # Modifiers are added before targets to keep the same node order as markItems()
+        if 'modifier' in modes:
+            for idx in candidates:
+                if self.items[idx][1] == 'modifier':
+                    markup.add_nodes_from(mark_item(markup, idx), category='modifier')
+        if 'target' in modes:
+            for terms in target_marks:
+                markup.add_nodes_from(terms, category='target')
+        return True
@@ -0,0 +1,151 @@
+"""
+This module defines `MarkupCache`, a bounded LRU cache of pyConText markups
+that is used by `MentionLevelModel` to skip sentences that it has already marked up.
+Clinical notes contain many templated and copy-forwarded sentences,
+so the same sentence text is often seen many times across a corpus.
+"""
+import os
+import re
+import copy
+import pickle
+from collections import OrderedDict
+
+import pyConTextNLP.pyConTextGraph as pyConText
+
+
+# pyConText collapses whitespace the same way before marking a sentence
+_whitespace = re.compile(r"\s+", re.UNICODE)
+
+
+def normalize_sentence(sentence):
+    """
+    Returns the text that pyConText will actually mark up for `sentence`.
+    Sentences that only differ in whitespace have the same markup.
+    """
+    return _whitespace.sub(" ", sentence)
+
+
+def copy_tag_object(node, markup):
+    """
+    Returns a copy of the tagObject `node` with a new tag ID from `markup` and its own scope.
+    """
+    new_node = copy.copy(node)
+    # tagObject doesn't have setters for its ID or scope
+    new_node._tagObject__tagID = markup.getNextTagID()
+    new_node._tagObject__scope = list(node.getScope())
+    new_node.setCategory(node.getCategory())
+    return new_node
+
+
+def copy_markup(markup, sentence):
+    """
+    Returns a copy of `markup` for the raw text `sentence` that shares no mutable state with `markup`.
+    Every tagObject is given a new tag ID so that annotations created from
+    different copies of the same markup have unique IDs.
+    """
+    new_markup = pyConText.ConTextMarkup()
+    new_markup.graph.update(markup.graph)
+    new_markup.graph["__rawTxt"] = sentence
+    new_nodes = {}
+    for node, data in markup.nodes(data=True):
+        new_node = copy_tag_object(node, new_markup)
+        new_nodes[node] = new_node
+        new_markup.add_node(new_node, **data)
+    for node1, node2, data in markup.edges(data=True):
+        new_markup.add_edge(new_nodes[node1], new_nodes[node2], **data)
+    return new_markup
+
+
+class MarkupCache(object):
+    """
+    A size-bounded, least-recently-used cache of markups keyed by the normalized sentence text.
+    `fingerprint` identifies the lexicon and settings of the model that created the markups.
+    A saved cache is only loaded into a cache with the same fingerprint.
+    Keeps track of the number of hits, misses and evictions.
+    """
+
+    def __init__(self, maxsize, fingerprint=''):
+        self.maxsize = maxsize
+        self.fingerprint = fingerprint
+        self.markups = OrderedDict() # (prune_inactive, normalized sentence): markup
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, sentence, prune_inactive=True):
+        """
+        Returns a copy of the cached markup for `sentence`, or None if it hasn't been cached.
+        """
+        key = (prune_inactive, normalize_sentence(sentence))
+        try:
+            markup = self.markups[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.markups.move_to_end(key)
+        self.hits += 1
+        return copy_markup(markup, sentence)
+
+
+    def put(self, sentence, markup, prune_inactive=True):
+        """
+        Saves a copy of `markup` for `sentence`,
+        evicting the least recently used markups if the cache is full.
+        """
+        if self.maxsize <= 0:
+            return
+        key = (prune_inactive, normalize_sentence(sentence))
+        self.markups[key] = copy_markup(markup, sentence)
+        self.markups.move_to_end(key)
+        while len(self.markups) > self.maxsize:
+            self.markups.popitem(last=False)
+            self.evictions += 1
+
+
+    def clear(self):
+        self.markups.clear()
+
+
+    def get_stats(self):
+        """
+        Returns a dictionary with the size of the cache and the hit, miss and eviction counts.
+        """
+        return {'size': len(self.markups),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+    def save(self, filepath):
+        """
+        Pickles the cached markups to `filepath`, from least to most recently used.
+        """
+        tmp_filepath = filepath + '.tmp'
+        with open(tmp_filepath, 'wb') as f:
+            pickle.dump({'fingerprint': self.fingerprint, 'markups': list(self.markups.items())},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+
+
+    def load(self, filepath):
+        """
+        Loads markups saved with `save()`.
+        Returns the number of markups that were loaded and kept, which will be 0 if the file doesn't exist
+        or was saved by a model with a different fingerprint.
+        If there are more than `maxsize` markups, the least recently used ones are evicted.
+        """
+        if not os.path.exists(filepath):
+            return 0
+        with open(filepath, 'rb') as f:
+            saved = pickle.load(f)
+        if saved['fingerprint'] != self.fingerprint:
+            return 0
+        for key, markup in saved['markups']:
+            self.markups[key] = markup
+            self.markups.move_to_end(key)
+        while len(self.markups) > self.maxsize:
+            self.markups.popitem(last=False)
+            self.evictions += 1
+        return sum(1 for key, markup in saved['markups'] if key in self.markups)
@@ -0,0 +1,142 @@
+"""
+This module defines `MatchProfile`, which records what each row of the lexicon costs and contributes
+while a MentionLevelModel annotates a corpus. Profiling is started with `MentionLevelModel.start_profile()`.
+
+For every row, the profile counts:
+    - calls: the number of sentences the row's expression was run on.
+      Sentences that the prefix index rules out for the row aren't counted.
+    - seconds: the total time spent running the expression and creating tagObjects for its matches
+    - matches: the number of times the expression matched
+    - annotations: the number of annotations whose target or modifiers came from the row
+    - shadowed: whether an earlier row has the same literal. pyConText compiles one expression per literal
+      from the first row with it, so a shadowed row is run with that row's expression instead of its own 'regex'.
+Sentences whose markups come from the markup cache aren't scanned, so they only count towards annotations.
+Rows that only differ in their regex can't be told apart in a markup,
+so their annotations are counted for the first of them.
+
+Rows with a high cost per call are patterns worth simplifying, and rows that never match
+over a large corpus are dead rows that every sentence still pays for.
+
+Example:
+    profile = model.start_profile()
+    for document in documents:
+        document.annotate(model)
+    profile.save('profile.csv')
+"""
+import csv
+import json
+
+from models.lexicon_index import get_entry
+
+
+COLUMNS = ['mode', 'literal', 'category', 'regex', 'shadowed', 'rule', 'calls', 'matches', 'annotations',
+           'seconds', 'us_per_call', 'percent_of_time']
+SORT_KEYS = ('seconds', 'us_per_call', 'calls', 'matches', 'annotations')
+
+
+def get_term_key(term, mode):
+    """
+    Returns (mode, literal, category, rule) for a contextItem or a tagObject created from it.
+    """
+    return (mode, term.getLiteral(), tuple(term.getCategory()), term.getRule())
+
+
+class MatchProfile(object):
+    """
+    Per-row counts for the items of a LexiconMatcher, in the order of `matcher.items`.
+    """
+
+    def __init__(self, items):
+        self.entries = [get_entry(item, mode) for item, mode in items]
+        self.shadowed = []
+        self._row_index = {} # (mode, literal, category, rule): index of the first row with them
+        literals = set()
+        for idx, (item, mode) in enumerate(items):
+            self.shadowed.append(item.getLiteral() in literals)
+            literals.add(item.getLiteral())
+            self._row_index.setdefault(get_term_key(item, mode), idx)
+        self.num_sentences = 0
+        self.calls = [0] * len(self.entries)
+        self.seconds = [0.0] * len(self.entries)
+        self.matches = [0] * len(self.entries)
+        self.annotations = [0] * len(self.entries)
+
+
+    def add_call(self, idx, seconds, num_matches):
+        self.calls[idx] += 1
+        self.seconds[idx] += seconds
+        self.matches[idx] += num_matches
+
+
+    def add_annotations(self, annotations, markup):
+        """
+        Counts an annotation for the target and every modifier of each annotation in `annotations`,
+        which were created from the targets of `markup`.
+        """
+        if not annotations:
+            return
+        targets = {str(target.getTagID()): target for target in markup.getMarkedTargets()}
+        for annotation in annotations:
+            target = targets.get(annotation.id)
+            if target is None:
+                continue
+            for term, mode in [(target, 'target')] + [(mod, 'modifier') for mod in markup.getModifiers(target)]:
+                idx = self._row_index.get(get_term_key(term, mode))
+                if idx is not None:
+                    self.annotations[idx] += 1
+
+
+    def merge(self, other):
+        """
+        Adds the counts of another profile of the same lexicon, such as one from a worker process.
+        """
+        if other.entries != self.entries:
+            raise ValueError("Profiles of different lexicons can't be merged")
+        self.num_sentences += other.num_sentences
+        for counts, other_counts in ((self.calls, other.calls), (self.seconds, other.seconds),
+                                     (self.matches, other.matches), (self.annotations, other.annotations)):
+            for idx, count in enumerate(other_counts):
+                counts[idx] += count
+
+
+    def get_rows(self, sort_by='seconds'):
+        """
+        Returns a dictionary with the columns in `COLUMNS` for every row of the lexicon,
+        sorted by `sort_by` from highest to lowest.
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError("sort_by must be one of {}, not {}".format(SORT_KEYS, sort_by))
+        total_seconds = sum(self.seconds)
+        rows = []
+        for idx, (mode, literal, category, regex, rule) in enumerate(self.entries):
+            calls = self.calls[idx]
+            seconds = self.seconds[idx]
+            rows.append({'mode': mode, 'literal': literal, 'category': ', '.join(category),
+                         'regex': regex, 'shadowed': self.shadowed[idx], 'rule': rule, 'calls': calls, 'matches': self.matches[idx],
+                         'annotations': self.annotations[idx], 'seconds': seconds,
+                         'us_per_call': seconds / calls * 1e6 if calls else 0.0,
+                         'percent_of_time': seconds / total_seconds * 100 if total_seconds else 0.0})
+        rows.sort(key=lambda row: -row[sort_by])
+        return rows
+
+
+    def get_dead_rows(self):
+        """
+        Returns the rows that were run on at least one sentence and never matched.
+        """
+        return [row for row in self.get_rows() if row['calls'] and not row['matches']]
+
+
+    def save(self, filepath, sort_by='seconds'):
+        """
+        Saves the report as json if `filepath` ends with '.json', otherwise as csv.
+        """
+        rows = self.get_rows(sort_by)
+        with open(filepath, 'w', newline='') as f:
+            if filepath.endswith('.json'):
+                json.dump({'num_sentences': self.num_sentences, 'total_seconds': sum(self.seconds),
+                           'rows': rows}, f, indent=2)
+            else:
+                writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
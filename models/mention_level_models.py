@@ -2,12 +2,34 @@
 Classes defined for extracting and classifying mention-level annotations of HAIs.
 """
 import os
+import hashlib
+import pickle
+import urllib.request, urllib.parse
 import pyConTextNLP.pyConTextGraph as pyConText
 import pyConTextNLP.itemData as itemData
 
-from nltk import word_tokenize
-
 from utils import helpers
+from models.lexicon_matcher import LexiconMatcher
+from models.markup_cache import MarkupCache
+from models.match_profile import MatchProfile
+
+# Increment this whenever the format of a saved model changes
+SNAPSHOT_VERSION = 1
+
+
+def get_source_hash(targets_file, modifiers_file):
+    """
+    Returns a hash of the contents of the targets and modifiers files.
+    Like pyConText, the files can be either local paths or URLs.
+    """
+    source_hash = hashlib.sha1()
+    for filepath in (targets_file, modifiers_file):
+        if not urllib.parse.urlparse(filepath).scheme:
+            filepath = "file://" + filepath
+        with urllib.request.urlopen(filepath) as f:
+            source_hash.update(f.read())
+        source_hash.update(b'\0')
+    return source_hash.hexdigest()
 
 
 class MentionLevelModel(object):
@@ -17,12 +39,129 @@ class MentionLevelModel(object):
     from which other models will inherit.
     """
 
-    def __init__(self, targets_file, modifiers_file):
-        """Instantiate targets and modifiers"""
+    def __init__(self, targets_file, modifiers_file, gate_on_targets=False, cache_size=0, guard=None):
+        """
+        Instantiate targets and modifiers.
+        If `gate_on_targets` is True, sentences are first checked for targets
+        and modifiers are only marked in sentences that have at least one.
+        If `cache_size` is greater than 0, the markups of up to `cache_size` sentences
+        are cached in `self.cache` and reused for identical sentences.
+        If `guard` is a SentenceGuard, `markup_windows()` splits long sentences into windows.
+        """
         self.targets_file = targets_file
         self.modifiers_file = modifiers_file
+        self.gate_on_targets = gate_on_targets
+        self.guard = guard
         self.targets = self.instantiate_targets()
         self.modifiers = self.instantiate_modifiers()
+        # Marks all modifiers and targets with a single scan of each sentence
+        self.matcher = LexiconMatcher(self.modifiers, self.targets)
+        self.source_hash = get_source_hash(self.targets_file, self.modifiers_file)
+        self.lexicon_fingerprint = self.get_lexicon_fingerprint()
+        self.cache = None
+        if cache_size > 0:
+            self.cache = MarkupCache(cache_size, fingerprint=self.lexicon_fingerprint)
+        self.profile = None
+
+
+    def save(self, filepath):
+        """
+        Saves the parsed targets and modifiers and the compiled matcher to `filepath`
+        so that the model can be loaded with `MentionLevelModel.load()`
+        without parsing the lexicon files again.
+        """
+        snapshot = {'version': SNAPSHOT_VERSION,
+                    'targets_file': self.targets_file,
+                    'modifiers_file': self.modifiers_file,
+                    'source_hash': self.source_hash,
+                    'targets': self.targets,
+                    'modifiers': self.modifiers,
+                    'matcher': self.matcher,
+                    }
+        tmp_filepath = filepath + '.tmp'
+        with open(tmp_filepath, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+
+
+    @classmethod
+    def load(cls, filepath, targets_file=None, modifiers_file=None, gate_on_targets=False, cache_size=0,
+             guard=None):
+        """
+        Loads a model saved with `save()`.
+        `targets_file` and `modifiers_file` default to the files that the saved model was built from.
+        If the snapshot doesn't exist, can't be read, or the contents of the lexicon files have changed,
+        the model is built from the lexicon files and saved to `filepath` again.
+        """
+        try:
+            with open(filepath, 'rb') as f:
+                snapshot = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            snapshot = {}
+
+        targets_file = targets_file or snapshot.get('targets_file')
+        modifiers_file = modifiers_file or snapshot.get('modifiers_file')
+        if targets_file is None or modifiers_file is None:
+            raise ValueError("{} is not a saved model and no lexicon files were given".format(filepath))
+
+        source_hash = get_source_hash(targets_file, modifiers_file)
+        if snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('source_hash') != source_hash:
+            snapshot = None
+
+        if snapshot is None:
+            print("Building model from {} and {}".format(targets_file, modifiers_file))
+            model = cls(targets_file, modifiers_file, gate_on_targets=gate_on_targets, cache_size=cache_size,
+                        guard=guard)
+            model.save(filepath)
+            return model
+
+        model = cls.__new__(cls)
+        model.targets_file = targets_file
+        model.modifiers_file = modifiers_file
+        model.gate_on_targets = gate_on_targets
+        model.guard = guard
+        model.targets = snapshot['targets']
+        model.modifiers = snapshot['modifiers']
+        model.matcher = snapshot['matcher']
+        model.source_hash = source_hash
+        model.lexicon_fingerprint = model.get_lexicon_fingerprint()
+        model.cache = None
+        if cache_size > 0:
+            model.cache = MarkupCache(cache_size, fingerprint=model.lexicon_fingerprint)
+        model.profile = None
+        return model
+
+
+    @property
+    def lexicon_version(self):
+        """
+        Identifies the contents of the lexicon files that the model was built from.
+        """
+        return self.source_hash[:12]
+
+
+    def pin(self):
+        """
+        Returns the model to annotate a document with. See `ReloadableModel.pin()`.
+        """
+        return self
+
+
+    def start_profile(self):
+        """
+        Starts recording the time, matches and annotations of every row of the lexicon
+        in a new MatchProfile, which is returned.
+        """
+        self.profile = MatchProfile(self.matcher.items)
+        return self.profile
+
+
+    def stop_profile(self):
+        """
+        Stops profiling and returns the profile.
+        """
+        profile, self.profile = self.profile, None
+        return profile
 
 
     def instantiate_targets(self):
@@ -35,6 +174,20 @@ class MentionLevelModel(object):
         return modifiers
 
 
+    def get_lexicon_fingerprint(self):
+        """
+        Returns a hash of the modifiers, targets and settings that decide how a sentence is marked up.
+        """
+        fingerprint = hashlib.sha1()
+        fingerprint.update(repr(self.gate_on_targets).encode())
+        for items in (self.modifiers, self.targets):
+            for item in items:
+                fingerprint.update(repr((item.getLiteral(), item.getCategory(),
+                                         item.getRE(), item.getRule())).encode())
+            fingerprint.update(b'\n')
+        return fingerprint.hexdigest()
+
+
     def _preprocess_text(self, text):
         """
         Takes a report as a string and preprocesses it
@@ -51,13 +204,39 @@ class MentionLevelModel(object):
 
     def markup_sentence(self, sentence, prune_inactive=True):
         """
-        Identifies all markups in a sentence
+        Identifies all markups in a sentence.
+        If the model is gated on targets and the sentence has no targets,
+        an empty markup is returned without marking modifiers.
+        If caching is enabled, a copy of a cached markup is returned for a sentence that has been seen before.
+        """
+        if self.cache is None:
+            return self._markup_sentence(sentence, prune_inactive)
+        markup = self.cache.get(sentence, prune_inactive)
+        if markup is None:
+            markup = self._markup_sentence(sentence, prune_inactive)
+            self.cache.put(sentence, markup, prune_inactive)
+        return markup
+
+
+    def markup_windows(self, sentence):
         """
+        Returns a list of (offset, markup) for `sentence` and whether the sentence was degraded.
+        Without a guard this is the markup of the whole sentence at offset 0,
+        otherwise long sentences are marked up in windows, see `SentenceGuard.markup()`.
+        """
+        if self.guard is None:
+            return [(0, self.markup_sentence(sentence))], False
+        return self.guard.markup(self, sentence)
+
+
+    def _markup_sentence(self, sentence, prune_inactive=True):
         markup = pyConText.ConTextMarkup()
         markup.setRawText(sentence)
         #markup.cleanText()
-        markup.markItems(self.modifiers, mode="modifier")
-        markup.markItems(self.targets, mode="target")
+        # Equivalent to calling markItems() with the modifiers and then the targets
+        has_targets = self.matcher.mark(markup, require_target=self.gate_on_targets, profile=self.profile)
+        if not has_targets:
+            return markup
         try:
             markup.pruneMarks()
         except TypeError as e:
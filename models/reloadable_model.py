@@ -0,0 +1,195 @@
+"""
+This module defines `ReloadableModel`, a handle to a MentionLevelModel whose lexicon can change
+while the process that holds it keeps running.
+
+`reload()` builds a new MentionLevelModel from the lexicon files, checks it with `validate()`
+and only then replaces the current model, so a lexicon that can't be parsed or has no targets
+never replaces a working one. Replacing the model is a single assignment,
+so `pin()` always returns a complete model.
+`ClinicalTextDocument.annotate()` pins the model once for the whole document,
+so a document that is being annotated during a reload is finished with the old version,
+and every annotation records the `lexicon_version` of the model that created it.
+
+`watch()` starts a background thread that reloads the model when the lexicon files change.
+If the new lexicon only differs in ways that don't change how sentences are marked up,
+such as the order of the files' columns, the new model keeps the old model's markup cache.
+
+Example:
+    model = ReloadableModel('lexicon/targets.tsv', 'lexicon/modifiers.tsv', gate_on_targets=True)
+    model.watch(interval=5)
+    document.annotate(model)
+"""
+import os
+import threading
+import urllib.parse
+
+from models.mention_level_models import MentionLevelModel, get_source_hash
+
+
+# Sentences that every new model must be able to mark up
+VALIDATION_SENTENCES = ('the patient shows symptoms of pneumonia.',
+                        'there is no evidence of infection at the incision site.')
+
+
+class ReloadableModel(object):
+    """
+    Holds the current version of a MentionLevelModel built from `targets_file` and `modifiers_file`.
+    The other arguments are passed to every MentionLevelModel that is built.
+    Each model is checked by marking up `validation_sentences` before it's used.
+    """
+
+    def __init__(self, targets_file, modifiers_file, gate_on_targets=False, cache_size=0, guard=None,
+                 validation_sentences=VALIDATION_SENTENCES):
+        self.targets_file = targets_file
+        self.modifiers_file = modifiers_file
+        self.gate_on_targets = gate_on_targets
+        self.cache_size = cache_size
+        self.guard = guard
+        self.validation_sentences = validation_sentences
+        self.model = self.build()
+        self.num_reloads = 0
+        self.last_error = None
+        # Only one reload can build a model at a time
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_pid = None
+        self._stop = threading.Event()
+
+
+    def __getstate__(self):
+        # Locks and threads can't be copied to another process, which has to call watch() itself
+        state = self.__dict__.copy()
+        for name in ('_reload_lock', '_watcher', '_watcher_pid', '_stop'):
+            del state[name]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_pid = None
+        self._stop = threading.Event()
+
+
+    def pin(self):
+        """
+        Returns the current MentionLevelModel.
+        The returned model never changes, so it should be used for everything that has to be consistent.
+        """
+        return self.model
+
+
+    @property
+    def lexicon_version(self):
+        return self.model.lexicon_version
+
+
+    def build(self):
+        model = MentionLevelModel(self.targets_file, self.modifiers_file,
+                                  gate_on_targets=self.gate_on_targets, cache_size=self.cache_size,
+                                  guard=self.guard)
+        self.validate(model)
+        return model
+
+
+    def validate(self, model):
+        """
+        Raises a ValueError if `model` can't be used to annotate documents.
+        """
+        if not model.targets:
+            raise ValueError("{} doesn't have any targets".format(model.targets_file))
+        for sentence in self.validation_sentences:
+            try:
+                model.markup_sentence(sentence)
+            except Exception as e:
+                raise ValueError("The new lexicon can't mark up {!r}: {!r}".format(sentence, e))
+
+
+    def reload(self):
+        """
+        Builds a model from the current contents of the lexicon files and makes it the current model.
+        Returns True if the model was replaced, or False if the lexicon files haven't changed.
+        If the new model can't be built or isn't valid, the current model is kept and the error is raised.
+        """
+        with self._reload_lock:
+            if get_source_hash(self.targets_file, self.modifiers_file) == self.model.source_hash:
+                return False
+            model = self.build()
+            old_model = self.model
+            if old_model.cache is not None and model.cache is not None \
+                    and model.lexicon_fingerprint == old_model.lexicon_fingerprint:
+                model.cache = old_model.cache
+            self.model = model
+            self.num_reloads += 1
+            self.last_error = None
+            return True
+
+
+    def reload_in_background(self):
+        """
+        Starts a thread that calls `reload()` and returns it.
+        Errors are saved in `last_error` instead of being raised.
+        """
+        thread = threading.Thread(target=self._try_reload, daemon=True)
+        thread.start()
+        return thread
+
+
+    def _try_reload(self):
+        try:
+            return self.reload()
+        except Exception as e:
+            self.last_error = e
+            print("Keeping lexicon version {}: {!r}".format(self.lexicon_version, e))
+            return False
+
+
+    def _get_mtimes(self):
+        mtimes = []
+        for filepath in (self.targets_file, self.modifiers_file):
+            # URLs can't be watched
+            if urllib.parse.urlparse(filepath).scheme:
+                mtimes.append(None)
+                continue
+            try:
+                stat = os.stat(filepath)
+                mtimes.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+
+    def watch(self, interval=1.0):
+        """
+        Starts a thread that checks the lexicon files every `interval` seconds and reloads the model
+        when one of them changes. Only local files are watched.
+        """
+        # A forked process has a copy of the handle but not of the thread
+        if self._watcher is not None and self._watcher_pid == os.getpid():
+            return
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, args=(interval, self._get_mtimes()), daemon=True)
+        self._watcher_pid = os.getpid()
+        self._watcher.start()
+
+
+    def _watch(self, interval, mtimes):
+        while not self._stop.wait(interval):
+            new_mtimes = self._get_mtimes()
+            if new_mtimes == mtimes:
+                continue
+            mtimes = new_mtimes
+            # A file that is still being written will change again and be reloaded then
+            self._try_reload()
+
+
+    def stop(self):
+        """
+        Stops watching the lexicon files.
+        """
+        if self._watcher is None or self._watcher_pid != os.getpid():
+            return
+        self._stop.set()
+        self._watcher.join()
+        self._watcher = None
@@ -0,0 +1,132 @@
+"""
+This module defines `ResultCache`, an on-disk cache of the annotations of each document.
+Entries are addressed by a hash of the document's text, the lexicon files, the model's SentenceGuard settings
+and `RESULT_VERSION`, so re-running a batch only runs the NLP on notes that are new or have changed
+and the cache is invalidated whenever the lexicon changes.
+Documents with a sentence that the guard degraded because it was too slow aren't cached.
+"""
+import os
+import hashlib
+import pickle
+
+from annotations.Annotation import Annotation
+
+
+# Increment this whenever a change to the annotation logic changes the annotations of a document
+RESULT_VERSION = 2
+
+
+def dump_annotations(annotations):
+    """
+    Returns a list with the slot values of each Annotation that can be pickled without the document's text.
+    """
+    states = []
+    for annotation in annotations:
+        state = [getattr(annotation, slot) for slot in Annotation.__slots__]
+        state[Annotation.__slots__.index('_document_text')] = None
+        states.append(state)
+    return states
+
+
+def load_annotations(states, document):
+    """
+    Returns the Annotations saved with `dump_annotations()`, linked to `document`.
+    """
+    annotations = []
+    for state in states:
+        annotation = Annotation()
+        for slot, value in zip(Annotation.__slots__, state):
+            setattr(annotation, slot, value)
+        annotation.rpt_id = document.rpt_id
+        if annotation._text is None:
+            annotation._document_text = document.raw_text
+        annotations.append(annotation)
+    return annotations
+
+
+class ResultCache(object):
+    """
+    Caches the hai_detect annotations of documents annotated by `model` in `cache_dir`.
+    Each entry is saved in its own file so that several processes can share a cache.
+    Keeps track of the number of hits and misses.
+    """
+
+    def __init__(self, cache_dir, model):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.source_hash = model.source_hash
+        self.guard_config = model.guard.get_config() if model.guard is not None else None
+        self.hits = 0
+        self.misses = 0
+
+
+    def get_key(self, text, source_hash=None):
+        key = hashlib.sha1()
+        key.update('{}\0{}\0'.format(RESULT_VERSION, self.source_hash).encode())
+        if source_hash is not None and source_hash != self.source_hash:
+            # The lexicon has been reloaded since the cache was created
+            key.update('{}\0'.format(source_hash).encode())
+        if self.guard_config is not None:
+            # Long sentences are marked up in windows
+            key.update('{}\0'.format(self.guard_config).encode())
+        key.update(text.encode('utf-8', 'surrogatepass'))
+        return key.hexdigest()
+
+
+    def get_filepath(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pkl')
+
+
+    def get(self, document, source_hash=None):
+        """
+        Returns the cached annotations for `document`, or None if it hasn't been cached.
+        `source_hash` is the hash of the lexicon that annotated the document,
+        which defaults to the lexicon of the model that the cache was created for.
+        """
+        filepath = self.get_filepath(self.get_key(document.raw_text, source_hash))
+        try:
+            with open(filepath, 'rb') as f:
+                states = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return load_annotations(states, document)
+
+
+    def put(self, document, source_hash=None):
+        """
+        Saves the hai_detect annotations of `document`.
+        The document's text isn't saved with them.
+        """
+        filepath = self.get_filepath(self.get_key(document.raw_text, source_hash))
+        states = dump_annotations(document.annotations['hai_detect'])
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_filepath = '{}.{}.tmp'.format(filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            pickle.dump(states, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+
+
+    def annotate(self, document, model):
+        """
+        Sets the hai_detect annotations of `document` from the cache
+        or annotates it with `model` and caches the annotations.
+        Returns True if the annotations were cached.
+        If `model` is a ReloadableModel, the cache is keyed by the lexicon of its current version.
+        """
+        model = model.pin()
+        annotations = self.get(document, model.source_hash)
+        if annotations is None:
+            document.annotate(model)
+            if not document.degraded_sentences:
+                self.put(document, model.source_hash)
+            return False
+        document.annotations['hai_detect'] = annotations
+        document.sentences_with_annotations = [annotation.sentence_num for annotation in annotations]
+        return True
+
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,105 @@
+"""
+This module defines `SentenceGuard`, which keeps pathological sentences from stalling a MentionLevelModel.
+
+Flowsheets, lab tables and vitals dumps have no sentence punctuation, so `split_sentences`
+can return a single sentence of thousands of tokens. pyConText compares every pair of marks
+in `pruneMarks` and every modifier with every target in `applyModifiers`,
+so the time to mark up a sentence grows with the square of its length.
+With a guard, a sentence longer than `max_tokens` tokens is marked up in windows of `max_tokens` tokens
+that overlap by `overlap` tokens, so a term or a modifier and its target near the end of a window
+are also seen together in the next one.
+If a sentence still takes longer than `time_budget` seconds, the rest of it is marked up
+in windows of `degraded_tokens` tokens without any overlap, which is faster but can miss modifiers
+that are further from their targets.
+
+Example:
+    model = MentionLevelModel(targets, modifiers, guard=SentenceGuard(max_tokens=100, time_budget=0.25))
+    document.annotate(model)
+"""
+import re
+import time
+
+from models.markup_cache import normalize_sentence
+
+
+_token = re.compile(r'\S+')
+
+
+class SentenceGuard(object):
+    """
+    Splits long sentences into windows before they're marked up and degrades slow sentences.
+    The number of sentences that were split or degraded is kept in `num_windowed` and `num_degraded`.
+    """
+
+    def __init__(self, max_tokens=100, overlap=20, time_budget=0.25, degraded_tokens=25):
+        if not 0 <= overlap < max_tokens:
+            raise ValueError("overlap must be at least 0 and less than max_tokens, not {}".format(overlap))
+        if degraded_tokens < 1:
+            raise ValueError("degraded_tokens must be at least 1, not {}".format(degraded_tokens))
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.time_budget = time_budget
+        self.degraded_tokens = degraded_tokens
+        self.num_windowed = 0
+        self.num_degraded = 0
+
+
+    def get_config(self):
+        """
+        Returns the settings that decide the annotations of a sentence that wasn't degraded.
+        """
+        return (self.max_tokens, self.overlap, self.degraded_tokens)
+
+
+    def get_windows(self, text, max_tokens, overlap=0):
+        """
+        Returns the (start, end) offsets in `text` of windows of up to `max_tokens` tokens,
+        each of which starts `overlap` tokens before the end of the previous one.
+        A text that isn't longer than `max_tokens` tokens is a single window.
+        """
+        spans = [match.span() for match in _token.finditer(text)]
+        if len(spans) <= max_tokens:
+            return [(0, len(text))]
+        windows = []
+        for first in range(0, len(spans), max_tokens - overlap):
+            last = min(first + max_tokens, len(spans)) - 1
+            windows.append((spans[first][0], spans[last][1]))
+            if last == len(spans) - 1:
+                break
+        return windows
+
+
+    def markup(self, model, sentence):
+        """
+        Marks up `sentence` with `model` and returns (markups, degraded).
+        `markups` is a list of (offset, markup) for each window, where `offset` is where the window starts
+        in the text that pyConText marks up, the sentence with its whitespace collapsed.
+        `degraded` is True if the time budget ran out. The markups of a degraded sentence depend on
+        how fast it was marked up, so they shouldn't be saved.
+        """
+        start_time = time.perf_counter()
+        text = normalize_sentence(sentence)
+        windows = self.get_windows(text, self.max_tokens, self.overlap)
+        if len(windows) == 1:
+            markups = [(0, model.markup_sentence(sentence))]
+            elapsed = time.perf_counter() - start_time
+            if self.time_budget is not None and elapsed > self.time_budget:
+                print("Marking up a sentence of {} characters took {:.3f}s".format(len(text), elapsed))
+            return markups, False
+
+        self.num_windowed += 1
+        markups = []
+        degraded = False
+        for window_start, window_end in windows:
+            elapsed = time.perf_counter() - start_time
+            if self.time_budget is not None and elapsed > self.time_budget:
+                self.num_degraded += 1
+                degraded = True
+                print("Marking up a sentence of {} characters took more than {:.3f}s, "
+                      "marking up the rest in windows of {} tokens".format(len(text), elapsed, self.degraded_tokens))
+                rest = text[window_start:]
+                for start, end in self.get_windows(rest, self.degraded_tokens):
+                    markups.append((window_start + start, model.markup_sentence(rest[start:end])))
+                break
+            markups.append((window_start, model.markup_sentence(text[window_start:window_end])))
+        return markups, degraded
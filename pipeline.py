@@ -0,0 +1,146 @@
+"""
+This module defines a streaming pipeline that annotates a corpus one document at a time.
+Reading, annotating and saving documents happen in separate stages connected by bounded queues,
+so the memory used stays the same no matter how many documents are in the corpus.
+
+Example:
+    model = MentionLevelModel(targets, modifiers)
+    for result in annotate_stream(glob.iglob('corpus/*.txt'), model, outdir='hai_detect'):
+        print(result.rpt_id, len(result.annotations))
+"""
+import os
+import threading
+from collections import namedtuple
+from queue import Queue
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+
+
+# The result for a single document.
+# `annotations` is the list of hai_detect Annotations; the text and sentences are not kept.
+AnnotatedDocument = namedtuple('AnnotatedDocument', ['rpt_id', 'annotations'])
+
+# Put in a queue to mark the end of the stream
+_END = object()
+
+
+class _StageError(object):
+    "Passes an exception raised in a background stage to the consumer"
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def read_documents(paths_or_texts):
+    """
+    Yields (rpt_id, text) for each item in `paths_or_texts`.
+    Each item is either a filepath or an (rpt_id, text) tuple.
+    Files are only read when they are reached.
+    """
+    for item in paths_or_texts:
+        if isinstance(item, tuple):
+            yield item
+        else:
+            rpt_id = os.path.splitext(os.path.basename(item))[0]
+            with open(item) as f:
+                yield rpt_id, f.read()
+
+
+def _fill_queue(iterable, queue, stop):
+    """
+    Puts every item from `iterable` in `queue`, followed by `_END`.
+    Blocks whenever the queue is full.
+    Stops early if `stop` is set.
+    """
+    try:
+        for item in iterable:
+            if stop.is_set():
+                break
+            queue.put(item)
+    except Exception as e:
+        queue.put(_StageError(e))
+    queue.put(_END)
+
+
+def _write_documents(queue, outdir, errors, archive=None):
+    """
+    Saves each document from `queue` to `outdir` as knowtator xml until `_END` is reached.
+    If `archive` is given, documents are added to the KnowtatorArchive instead.
+    """
+    while True:
+        document = queue.get()
+        if document is _END:
+            return
+        if errors:
+            # Keep draining the queue so the producer doesn't block
+            continue
+        try:
+            if archive is not None:
+                archive.add(document)
+            else:
+                document.to_knowtator(outdir, verbose=False)
+        except Exception as e:
+            errors.append(e)
+
+
+def annotate_stream(paths_or_texts, model, outdir=None, queue_size=16, result_cache=None, archive=None):
+    """
+    Lazily annotates every document in `paths_or_texts` with `model`
+    and yields an AnnotatedDocument for each of them in order.
+    `paths_or_texts` can be any iterable of filepaths or (rpt_id, text) tuples, including a generator.
+    Documents are read in a background thread. If `outdir` is given, each document is also saved
+    to a knowtator xml file in a second background thread.
+    At most `queue_size` documents are waiting to be annotated or saved at any time.
+    If `result_cache` is given, documents that have already been annotated are loaded from it.
+    If `archive` is given, documents are saved to that KnowtatorArchive instead of `outdir`.
+    The archive isn't closed.
+    """
+    if outdir is not None and not os.path.isdir(outdir):
+        raise FileNotFoundError("{} is not a directory".format(outdir))
+
+    stop = threading.Event()
+    read_queue = Queue(maxsize=queue_size)
+    reader = threading.Thread(target=_fill_queue, args=(read_documents(paths_or_texts), read_queue, stop))
+    reader.daemon = True
+    reader.start()
+
+    write_queue = None
+    writer = None
+    write_errors = []
+    if outdir is not None or archive is not None:
+        write_queue = Queue(maxsize=queue_size)
+        writer = threading.Thread(target=_write_documents, args=(write_queue, outdir, write_errors, archive))
+        writer.daemon = True
+        writer.start()
+
+    reached_end = False
+    try:
+        while True:
+            item = read_queue.get()
+            if item is _END:
+                reached_end = True
+                break
+            if isinstance(item, _StageError):
+                raise item.exception
+            rpt_id, text = item
+            document = ClinicalTextDocument(text, rpt_id=rpt_id)
+            if result_cache is not None:
+                result_cache.annotate(document, model)
+            else:
+                document.annotate(model)
+            if write_queue is not None:
+                if write_errors:
+                    raise write_errors[0]
+                write_queue.put(document)
+            yield AnnotatedDocument(rpt_id, document.annotations['hai_detect'])
+    finally:
+        stop.set()
+        if not reached_end:
+            # Unblock the reader if it's waiting on a full queue. It always puts `_END` last
+            while read_queue.get() is not _END:
+                pass
+        reader.join()
+        if writer is not None:
+            write_queue.put(_END)
+            writer.join()
+    if write_errors:
+        raise write_errors[0]
@@ -0,0 +1,431 @@
+"""
+This script runs hai_detect as a local HTTP service so that notes can be annotated
+without paying for Python startup, imports and lexicon compilation on every batch.
+The service holds one or more warm MentionLevelModels and annotates notes in a pool of worker processes
+behind an asyncio event loop.
+
+Usage: python service.py [--port 8765 | --socket /path/to/socket] [--workers N]
+                         [--model name=targets.tsv,modifiers.tsv ...]
+
+Endpoints:
+    POST /annotate with a JSON body of either a single note or a batch:
+        {"rpt_id": "report1", "text": "...", "model": "default", "format": "json"}
+        {"notes": [{"rpt_id": "report1", "text": "..."}, ...], "model": "default", "format": "knowtator"}
+    returns {"results": [{"rpt_id": ..., "annotations": [row, ...]}, ...]}
+    where each row has the columns of `AnnotationExport.COLUMNS`,
+    or {"rpt_id": ..., "knowtator": "<annotations ...>"} for each note if the format is "knowtator".
+    GET /health returns the names and lexicon versions of the models and the number of notes waiting to be annotated.
+
+Notes that arrive within `batch_delay` seconds of each other are sent to the pool together,
+and a note that is identical to one that's already being annotated waits for that result instead.
+If more than `max_pending` notes are waiting, new requests are refused with 503 until the pool catches up.
+A request with more than `max_pending` notes is refused with 413.
+
+With --reload-interval, every process watches the lexicon files and switches to a new version of a model
+once it has been built, without restarting. Each annotation has the `lexicon_version` that created it.
+
+Sentences longer than --max-sentence-tokens tokens, such as flowsheets without punctuation,
+are marked up in windows (see `SentenceGuard`) so that a single malformed note can't hold up a batch.
+"""
+import os
+import io
+import json
+import asyncio
+import argparse
+import multiprocessing
+import concurrent.futures
+import concurrent.futures.process
+from collections import OrderedDict
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.AnnotationExport import get_record
+from annotations.KnowtatorWriter import KnowtatorWriter
+from models.mention_level_models import MentionLevelModel
+from models.reloadable_model import ReloadableModel
+from models.sentence_guard import SentenceGuard
+
+
+OUTPUT_FORMATS = ('json', 'knowtator')
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class ServiceBusy(Exception):
+    "Raised when too many notes are waiting to be annotated"
+    pass
+
+
+class BatchTooLarge(Exception):
+    "Raised when a request has more notes than can ever wait to be annotated at once"
+    pass
+
+
+# The models used by each worker process
+_worker_models = None
+
+
+def _init_worker(models, reload_interval=None):
+    global _worker_models
+    _worker_models = models
+    if reload_interval:
+        for model in models.values():
+            if isinstance(model, ReloadableModel):
+                model.watch(reload_interval)
+
+
+def get_result(document, output_format='json'):
+    """
+    Returns the JSON-serializable result for an annotated ClinicalTextDocument.
+    """
+    if output_format == 'knowtator':
+        f = io.StringIO()
+        KnowtatorWriter(f).write_document(document)
+        return {'rpt_id': document.rpt_id, 'knowtator': f.getvalue()}
+    return {'rpt_id': document.rpt_id,
+            'annotations': [get_record(annotation) for annotation in document.annotations['hai_detect']]}
+
+
+def _annotate_batch(model_name, notes, output_format):
+    """
+    Annotates a list of (rpt_id, text) with one of the worker's models.
+    """
+    model = _worker_models[model_name]
+    results = []
+    for rpt_id, text in notes:
+        document = ClinicalTextDocument(text, rpt_id=rpt_id)
+        document.annotate(model)
+        results.append(get_result(document, output_format))
+    return results
+
+
+class AnnotationService(object):
+    """
+    Annotates notes with the MentionLevelModels or ReloadableModels in `models`, a dictionary of {name: model}.
+    Notes are annotated in a pool of `workers` processes that each get a copy of the models when they start.
+    If a worker dies, the notes that were sent to the pool fail and a new pool is started.
+    If `workers` is 0, notes are annotated in a single background thread of this process.
+    If `reload_interval` is given, every process reloads its ReloadableModels when their lexicon files change.
+    """
+
+    def __init__(self, models, workers=1, max_pending=1000, max_batch_size=16, batch_delay=0.002,
+                 max_body_size=10 * 1024 * 1024, reload_interval=None):
+        self.models = OrderedDict(models)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_batch_size = max_batch_size
+        self.batch_delay = batch_delay
+        self.max_body_size = max_body_size
+        self.reload_interval = reload_interval
+        if workers > 0:
+            self.executor = self._create_executor()
+        # The models of this process are used for annotating if there are no workers and for reporting versions
+        _init_worker(self.models, reload_interval)
+        if workers <= 0:
+            self.executor = self._create_executor()
+        self.batches = {} # (model name, output format): [(key, future), ...]
+        self.in_flight = {} # (model name, output format, rpt_id, text): future
+        self.num_pending = 0
+        self.num_coalesced = 0
+        self.num_annotated = 0
+        self.num_restarts = 0
+
+
+    def _create_executor(self):
+        if self.workers > 0:
+            # Forked workers would inherit the connections that are open when a pool is replaced
+            # and keep them open after this process has closed them
+            context = None
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+            return concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                                          initargs=(self.models, self.reload_interval))
+        return concurrent.futures.ThreadPoolExecutor(1)
+
+
+    def _restart_executor(self, executor):
+        """
+        Replaces `executor` with a new pool if it's still the current one.
+        A ProcessPoolExecutor can't be used again after one of its workers has died.
+        """
+        if executor is not self.executor:
+            return
+        print("A worker died, starting a new pool")
+        executor.shutdown(wait=False)
+        self.executor = self._create_executor()
+        self.num_restarts += 1
+
+
+    async def warm_up(self):
+        """
+        Starts the workers so that the first request doesn't wait for them.
+        """
+        loop = asyncio.get_running_loop()
+        name = next(iter(self.models))
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _annotate_batch, name, [('', '')], 'json')
+                               for _ in range(max(1, self.workers))])
+
+
+    def submit(self, model_name, rpt_id, text, output_format='json'):
+        """
+        Returns a future for the result of a single note.
+        """
+        key = (model_name, output_format, rpt_id, text)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.num_coalesced += 1
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.in_flight[key] = future
+        self.num_pending += 1
+        batch = self.batches.setdefault((model_name, output_format), [])
+        batch.append((key, future))
+        if len(batch) >= self.max_batch_size:
+            self._flush(model_name, output_format)
+        elif len(batch) == 1:
+            loop.call_later(self.batch_delay, self._flush, model_name, output_format)
+        return future
+
+
+    def _flush(self, model_name, output_format):
+        """
+        Sends the notes waiting for a model to the pool.
+        """
+        batch = self.batches.pop((model_name, output_format), None)
+        if not batch:
+            return
+        notes = [(key[2], key[3]) for key, future in batch]
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            pool_future = loop.run_in_executor(executor, _annotate_batch, model_name, notes, output_format)
+        except Exception as e:
+            # This runs in a callback of the event loop, so the error can only be passed on through the futures
+            if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+                self._restart_executor(executor)
+            self._set_results(batch, exception=e)
+            return
+        pool_future.add_done_callback(lambda done: self._on_batch_done(batch, executor, done))
+
+
+    def _on_batch_done(self, batch, executor, done):
+        if done.cancelled():
+            self._set_results(batch, exception=concurrent.futures.CancelledError())
+        elif done.exception() is not None:
+            if isinstance(done.exception(), concurrent.futures.process.BrokenProcessPool):
+                self._restart_executor(executor)
+            self._set_results(batch, exception=done.exception())
+        else:
+            self._set_results(batch, results=done.result())
+
+
+    def _set_results(self, batch, results=None, exception=None):
+        """
+        Resolves the future of every note in `batch` with its result or with `exception`.
+        """
+        for i, (key, future) in enumerate(batch):
+            del self.in_flight[key]
+            self.num_pending -= 1
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(results[i])
+        if exception is None:
+            self.num_annotated += len(batch)
+
+
+    async def annotate(self, notes, model_name=None, output_format='json'):
+        """
+        Annotates a list of (rpt_id, text) and returns a list of results in the same order.
+        Raises BatchTooLarge if there are more than `max_pending` notes
+        and ServiceBusy if the notes would make more than `max_pending` notes wait.
+        """
+        if model_name is None:
+            model_name = next(iter(self.models))
+        if model_name not in self.models:
+            raise KeyError("{} is not a model, must be one of {}".format(model_name, list(self.models)))
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("format must be one of {}, not {}".format(OUTPUT_FORMATS, output_format))
+        if len(notes) > self.max_pending:
+            raise BatchTooLarge("A request can have at most {} notes".format(self.max_pending))
+        if self.num_pending + len(notes) > self.max_pending:
+            raise ServiceBusy("{} notes are already waiting".format(self.num_pending))
+        futures = [self.submit(model_name, rpt_id, text, output_format) for rpt_id, text in notes]
+        # Other requests may be waiting for the same futures, so they're never cancelled
+        return await asyncio.gather(*[asyncio.shield(future) for future in futures])
+
+
+    def get_stats(self):
+        return {'status': 'ok', 'models': list(self.models), 'workers': self.workers,
+                'lexicon_versions': {name: model.lexicon_version for name, model in self.models.items()},
+                'pending': self.num_pending, 'annotated': self.num_annotated, 'coalesced': self.num_coalesced,
+                'restarts': self.num_restarts}
+
+
+    async def handle_request(self, method, path, body):
+        """
+        Returns (status, dictionary) for a single request.
+        """
+        path = path.split('?')[0]
+        if path == '/health':
+            if method != 'GET':
+                return 405, {'error': 'Use GET'}
+            return 200, self.get_stats()
+        if path != '/annotate':
+            return 404, {'error': '{} not found'.format(path)}
+        if method != 'POST':
+            return 405, {'error': 'Use POST'}
+
+        try:
+            request = json.loads(body.decode('utf-8'))
+            if 'notes' in request:
+                notes = [(str(note.get('rpt_id', '')), note['text']) for note in request['notes']]
+            else:
+                notes = [(str(request.get('rpt_id', '')), request['text'])]
+            if not all(isinstance(text, str) for rpt_id, text in notes):
+                raise ValueError("text must be a string")
+            results = await self.annotate(notes, request.get('model'), request.get('format', 'json'))
+        except BatchTooLarge as e:
+            return 413, {'error': str(e)}
+        except ServiceBusy as e:
+            return 503, {'error': str(e)}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return 400, {'error': 'Invalid request: {}'.format(e)}
+        except Exception as e:
+            return 500, {'error': repr(e)}
+        return 200, {'results': results}
+
+
+    async def _write_response(self, writer, status, response, keep_alive):
+        payload = json.dumps(response).encode('utf-8')
+        head = ['HTTP/1.1 {} {}'.format(status, REASONS[status]),
+                'Content-Type: application/json',
+                'Content-Length: {}'.format(len(payload)),
+                'Connection: {}'.format('keep-alive' if keep_alive else 'close')]
+        if status == 503:
+            head.append('Retry-After: 1')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+
+
+    async def handle_connection(self, reader, writer):
+        """
+        Reads HTTP/1.1 requests from a connection until the client closes it.
+        A malformed request is answered with 400 and the connection is closed.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self._write_response(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+                method, path, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    content_length = int(headers.get('content-length', 0))
+                except ValueError:
+                    content_length = -1
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                if content_length < 0:
+                    status, response = 400, {'error': 'Invalid Content-Length: {}'.format(headers['content-length'])}
+                    keep_alive = False
+                elif content_length > self.max_body_size:
+                    status, response = 413, {'error': 'The body must be at most {} bytes'.format(self.max_body_size)}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(content_length)
+                    status, response = await self.handle_request(method, path, body)
+                await self._write_response(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def start(self, host='127.0.0.1', port=8765, unix_socket=None):
+        """
+        Starts listening on `host`:`port` or on the Unix socket `unix_socket` and returns the asyncio server.
+        """
+        await self.warm_up()
+        if unix_socket is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+    def close(self):
+        self.executor.shutdown()
+        for model in self.models.values():
+            if isinstance(model, ReloadableModel):
+                model.stop()
+
+
+def parse_model(value):
+    """
+    Parses a --model argument of name=targets.tsv,modifiers.tsv
+    """
+    name, _, files = value.partition('=')
+    targets, _, modifiers = files.partition(',')
+    if not name or not targets or not modifiers:
+        raise argparse.ArgumentTypeError("{} must be name=targets.tsv,modifiers.tsv".format(value))
+    return name, os.path.abspath(targets), os.path.abspath(modifiers)
+
+
+async def serve(args):
+    models = OrderedDict()
+    guard = None
+    if args.max_sentence_tokens:
+        guard = SentenceGuard(max_tokens=args.max_sentence_tokens, time_budget=args.sentence_time_budget)
+    for name, targets, modifiers in args.model or [('default', os.path.abspath('lexicon/targets.tsv'),
+                                                     os.path.abspath('lexicon/modifiers.tsv'))]:
+        if args.reload_interval:
+            models[name] = ReloadableModel(targets, modifiers, gate_on_targets=True, guard=guard)
+        else:
+            models[name] = MentionLevelModel(targets, modifiers, gate_on_targets=True, guard=guard)
+    service = AnnotationService(models, workers=args.workers, max_pending=args.max_pending,
+                                max_batch_size=args.batch_size, reload_interval=args.reload_interval)
+    server = await service.start(args.host, args.port, args.socket)
+    print("Serving {} on {}".format(list(models), args.socket or '{}:{}'.format(args.host, args.port)))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves hai_detect over HTTP with warm models")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help="a Unix socket to listen on instead of a port")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="the number of processes to annotate notes with, 0 to annotate in a thread")
+    parser.add_argument('--model', type=parse_model, action='append',
+                        help="a model to serve as name=targets.tsv,modifiers.tsv, can be given more than once")
+    parser.add_argument('--max-pending', type=int, default=1000,
+                        help="the number of notes that can wait to be annotated before requests are refused")
+    parser.add_argument('--batch-size', type=int, default=16, help="the most notes sent to a worker at once")
+    parser.add_argument('--reload-interval', type=float,
+                        help="reload a model when its lexicon files change, checking every this many seconds")
+    parser.add_argument('--max-sentence-tokens', type=int, default=100,
+                        help="mark up sentences longer than this many tokens in overlapping windows, 0 to disable")
+    parser.add_argument('--sentence-time-budget', type=float, default=0.25,
+                        help="seconds a windowed sentence may take before the rest of it is marked up in smaller windows")
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 import unittest
+import pickle
 from annotations.Annotation import Annotation
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
 import os.path
 from openpyxl import load_workbook
 from hai_exceptions.exceptions import MalformedeHostExcelRow, MalformedSpanValue
@@ -275,8 +278,61 @@ class test_Annotation(unittest.TestCase):
         # self.assertFalse(self._anno_overlap(left, right))
 
    
-        
-        
+
+
+class test_compact_Annotation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        targets = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon', 'targets.tsv')
+        modifiers = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon', 'modifiers.tsv')
+        cls.model = MentionLevelModel(targets, modifiers)
+
+    def _annotate(self, text):
+        document = ClinicalTextDocument(text, rpt_id='report')
+        document.annotate(self.model)
+        return document
+
+    def test_no_instance_dict(self):
+        annotation = Annotation()
+        self.assertFalse(hasattr(annotation, '__dict__'))
+        self.assertRaises(AttributeError, setattr, annotation, 'not_an_attribute', 1)
+
+    def test_spans(self):
+        annotation = Annotation()
+        self.assertIsNone(annotation.span_in_document)
+        annotation.span_in_document = (3, 10)
+        self.assertEqual(annotation.span_in_document, (3, 10))
+        annotation.span_in_document = [4, 11]
+        self.assertEqual(annotation.span_in_document, (4, 11))
+        annotation.span_in_document = '--'
+        self.assertEqual(annotation.span_in_document, '--')
+
+    def test_text_references_document(self):
+        text = 'The patient is here.   There is  an Abscess near the wound. He has a history of pneumonia.'
+        document = self._annotate(text)
+        self.assertEqual(len(document.annotations['hai_detect']), 2)
+        for annotation in document.annotations['hai_detect']:
+            sentence = document.sentences[annotation.sentence_num]['text']
+            self.assertIs(annotation._document_text, document.raw_text)
+            self.assertIsNone(annotation._text)
+            self.assertEqual(annotation.text, sentence)
+            self.assertEqual(annotation.sentence, sentence)
+
+    def test_pickle(self):
+        document = self._annotate('There is an abscess near the wound. He has a history of pneumonia.')
+        annotations = pickle.loads(pickle.dumps(document.annotations['hai_detect']))
+        for old, new in zip(document.annotations['hai_detect'], annotations):
+            self.assertEqual((old.id, old.span_in_document, old.text, old.classification, old.attributes),
+                             (new.id, new.span_in_document, new.text, new.classification, new.attributes))
+            self.assertEqual(new.to_etree()[0].findtext('spannedText'), old.text)
+
+    def test_creation_date_is_shared(self):
+        first, second = Annotation(), Annotation()
+        if first.datetime == second.datetime: # Unless they were created in different seconds
+            self.assertIs(first.datetime, second.datetime)
+
+
 if __name__ == '__main__':
     suit = unittest.TestLoader().loadTestsFromTestCase(test_Annotation)
     unittest.TextTestRunner(verbosity=2).run(suit)
\ No newline at end of file
@@ -0,0 +1,83 @@
+import unittest
+import os
+import tempfile
+
+from annotations.Annotation import Annotation
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.AnnotationExport import AnnotationExporter, COLUMNS, get_record, read_jsonl
+from models.mention_level_models import MentionLevelModel
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+
+class test_AnnotationExport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                  os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+        cls.documents = []
+        for i in range(5):
+            document = ClinicalTextDocument('There is an abscess near the wound. He has a history of pneumonia.',
+                                            rpt_id='doc{}'.format(i))
+            document.annotate(model)
+            cls.documents.append(document)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_record(self):
+        record = get_record(self.documents[0].annotations['hai_detect'][0])
+        self.assertEqual(list(record), COLUMNS)
+        self.assertEqual((record['rpt_id'], record['span_start'], record['span_end']), ('doc0', 0, 35))
+        self.assertEqual((record['annotation_type'], record['assertion'], record['temporality'], record['ssi_class']),
+                         ('Evidence of SSI', 'present', 'current', 'organ-space'))
+        self.assertEqual(record['classification'], 'Positive Evidence of SSI')
+        self.assertIn('organ-space surgical site infection', record['modifier_categories'])
+
+        annotation = Annotation()
+        annotation.span_in_document = '--'
+        record = get_record(annotation)
+        self.assertEqual((record['span_start'], record['span_end'], record['ssi_class']), (None, None, None))
+
+    def test_jsonl(self):
+        with AnnotationExporter(self.tmpdir.name, batch_size=3) as exporter:
+            for document in self.documents:
+                exporter.add(document)
+            # Nothing is visible until the file is closed
+            self.assertEqual(list(read_jsonl(self.tmpdir.name)), [])
+        expected = [get_record(a) for d in self.documents for a in d.annotations['hai_detect']]
+        self.assertEqual(exporter.num_rows, 10)
+        self.assertEqual(list(read_jsonl(self.tmpdir.name)), expected)
+
+    def test_annotators(self):
+        document = ClinicalTextDocument('There is an abscess.', rpt_id='gold')
+        gold = Annotation()
+        gold.annotator = 'gold_standard'
+        document.annotations['gold_standard'] = [gold]
+        with AnnotationExporter(self.tmpdir.name, annotators=['hai_detect']) as exporter:
+            exporter.add(document)
+        self.assertEqual(list(read_jsonl(self.tmpdir.name)), [])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow isn't installed")
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+        with AnnotationExporter(self.tmpdir.name, export_format='parquet', batch_size=3) as exporter:
+            for document in self.documents:
+                exporter.add(document)
+        table = pq.read_table(exporter.filepath)
+        self.assertEqual(table.column_names, COLUMNS)
+        self.assertEqual(table.to_pylist(), [get_record(a) for d in self.documents for a in d.annotations['hai_detect']])
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_AnnotationExport)
+    unittest.TextTestRunner(verbosity=2).run(suit)
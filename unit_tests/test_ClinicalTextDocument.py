@@ -1,4 +1,5 @@
 import unittest
+import random
 from annotations.Annotation import Annotation
 from annotations.ClinicalTextDocument import ClinicalTextDocument
 
@@ -171,6 +172,74 @@ class test_ClinicalTextDocument(unittest.TestCase):
     #     pass
         
         
+class test_compare_annotations(unittest.TestCase):
+
+    categories = ['Evidence of SSI', 'Evidence of UTI', 'Evidence of Pneumonia']
+
+    def _anno(self, annotator, span, annotation_type, assertion='present', temporality='current'):
+        anno = Annotation()
+        anno.rpt_id = 'report'
+        anno.annotator = annotator
+        anno.span_in_document = span
+        anno.annotation_type = annotation_type
+        anno.attributes = {'assertion': assertion, 'temporality': temporality}
+        return anno
+
+    def _nested_loop_comparisons(self, document):
+        """The pairs that comparing every gold annotation to every system annotation would find"""
+        pairs = []
+        others = document.annotations['hai_detect']
+        matched = set()
+        for gold in document.annotations['gold_standard']:
+            if gold.annotation_type not in self.categories:
+                continue
+            had_overlap = False
+            for other in others:
+                if gold.isOverlap(other):
+                    had_overlap = True
+                    matched.add(id(other))
+                    pairs.append((id(gold), id(other)))
+            if not had_overlap:
+                pairs.append((id(gold), None))
+        unmatched = [(None, id(other)) for other in others if id(other) not in matched]
+        return pairs + unmatched
+
+    def _pairs(self, comparisons):
+        return [(id(c.a) if c.has_a else None, id(c.b) if c.has_b else None) for c in comparisons]
+
+    def test_compare_annotations(self):
+        document = ClinicalTextDocument()
+        gold = document.annotations['gold_standard']
+        other = document.annotations['hai_detect']
+        gold.append(self._anno('gold', (0, 10), 'Evidence of SSI'))
+        gold.append(self._anno('gold', (20, 30), 'Evidence of UTI', assertion='negated'))
+        gold.append(self._anno('gold', (50, 60), 'Evidence of SSI'))
+        gold.append(self._anno('gold', (70, 80), 'Not a category'))
+        other.append(self._anno('hai_detect', (5, 15), 'Evidence of SSI'))
+        other.append(self._anno('hai_detect', (25, 35), 'Evidence of UTI'))
+        other.append(self._anno('hai_detect', (55, 58), 'Evidence of UTI'))
+        other.append(self._anno('hai_detect', (10, 20), 'Evidence of SSI'))
+
+        comparisons = document.compare_annotations(categories=self.categories)
+        self.assertEqual(self._pairs(comparisons), self._nested_loop_comparisons(document))
+        self.assertEqual([c.is_match for c in comparisons], [True, False, False, False, False])
+
+    def test_matches_nested_loop(self):
+        random.seed(0)
+        types = self.categories + ['Not a category']
+        document = ClinicalTextDocument()
+        for annotator in ('gold_standard', 'hai_detect'):
+            for i in range(300):
+                start = random.randint(0, 5000)
+                span = (start, start + random.choice([0, 1, 5, 50, 300]))
+                document.annotations[annotator].append(self._anno(annotator, span, random.choice(types)))
+        document.annotations['gold_standard'].append(self._anno('gold_standard', None, 'Evidence of SSI'))
+        document.annotations['hai_detect'].append(self._anno('hai_detect', '--', 'Evidence of SSI'))
+
+        comparisons = document.compare_annotations(categories=self.categories)
+        self.assertEqual(self._pairs(comparisons), self._nested_loop_comparisons(document))
+
+
 if __name__ == '__main__':
     suit = unittest.TestLoader().loadTestsFromTestCase(test_Annotation)
     unittest.TextTestRunner(verbosity=2).run(suit)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import unittest
+import os
+import io
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.KnowtatorArchive import KnowtatorArchive, read_index, extract_documents
+from annotations.KnowtatorWriter import KnowtatorWriter
+from models.mention_level_models import MentionLevelModel
+from pipeline import annotate_stream
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+TEXTS = [('doc{}'.format(i), 'There is an abscess near the abdomen. He has a history of pneumonia {}.'.format(i))
+         for i in range(7)]
+
+
+class test_KnowtatorArchive(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                  os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+        cls.documents = []
+        for rpt_id, text in TEXTS:
+            document = ClinicalTextDocument(text, rpt_id=rpt_id)
+            document.annotate(model)
+            cls.documents.append(document)
+        cls.model = model
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.archive_dir = os.path.join(self.tmpdir.name, 'hai_detect')
+        os.mkdir(self.archive_dir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _xml(self, document):
+        f = io.StringIO()
+        KnowtatorWriter(f).write_document(document)
+        return f.getvalue()
+
+    def _check_extracted(self, outdir, documents):
+        saved = os.path.join(outdir, 'saved')
+        self.assertEqual(sorted(os.listdir(saved)), sorted(d.rpt_id + '.txt.knowtator.xml' for d in documents))
+        for document in documents:
+            with open(os.path.join(saved, document.rpt_id + '.txt.knowtator.xml'), encoding='utf-8') as f:
+                self.assertEqual(f.read(), self._xml(document))
+
+    def test_formats(self):
+        for archive_format, compress, extension in [('zip', False, '.zip'), ('zip', True, '.zip'),
+                                                    ('tar', False, '.tar'), ('tar', True, '.tar.gz')]:
+            archive_dir = os.path.join(self.tmpdir.name, archive_format + str(compress))
+            os.mkdir(archive_dir)
+            with KnowtatorArchive(archive_dir, shard_size=3, archive_format=archive_format,
+                                  compress=compress) as archive:
+                for document in self.documents:
+                    archive.add(document)
+            shards = sorted(f for f in os.listdir(archive_dir) if f.endswith(extension))
+            self.assertEqual(len(shards), 3)
+            self.assertEqual(len(read_index(archive_dir)), len(self.documents))
+
+            outdir = os.path.join(self.tmpdir.name, 'review' + archive_format + str(compress))
+            self.assertEqual(extract_documents(archive_dir, outdir, rpt_ids=['doc1', 'doc5']), 2)
+            self._check_extracted(outdir, [self.documents[1], self.documents[5]])
+
+    def test_later_shards_replace_documents(self):
+        with KnowtatorArchive(self.archive_dir) as archive:
+            for document in self.documents:
+                archive.add(document)
+        # Archive doc0 again with the annotations of doc1
+        document = ClinicalTextDocument(TEXTS[1][1], rpt_id='doc0')
+        document.annotations = self.documents[1].annotations
+        with KnowtatorArchive(self.archive_dir) as archive:
+            archive.add(document)
+        outdir = os.path.join(self.tmpdir.name, 'review')
+        extract_documents(self.archive_dir, outdir)
+        self._check_extracted(outdir, [document] + self.documents[1:])
+
+    def test_unclosed_shard_is_not_indexed(self):
+        archive = KnowtatorArchive(self.archive_dir, shard_size=5)
+        for document in self.documents:
+            archive.add(document)
+        self.assertEqual(sorted(read_index(self.archive_dir)), ['doc0', 'doc1', 'doc2', 'doc3', 'doc4'])
+        with self.assertRaises(KeyError):
+            extract_documents(self.archive_dir, os.path.join(self.tmpdir.name, 'review'), rpt_ids=['doc6'])
+        archive.close()
+        self.assertEqual(len(read_index(self.archive_dir)), len(self.documents))
+
+    def test_extract_corpus(self):
+        corpus_dir = os.path.join(self.tmpdir.name, 'corpus')
+        os.mkdir(corpus_dir)
+        for rpt_id, text in TEXTS:
+            with open(os.path.join(corpus_dir, rpt_id + '.txt'), 'w') as f:
+                f.write(text)
+        with KnowtatorArchive(self.archive_dir) as archive:
+            for document in self.documents:
+                archive.add(document)
+        outdir = os.path.join(self.tmpdir.name, 'review')
+        extract_documents(self.archive_dir, outdir, rpt_ids=['doc2'], corpus_dir=corpus_dir)
+        self.assertEqual(os.listdir(os.path.join(outdir, 'corpus')), ['doc2.txt'])
+
+    def test_annotate_stream(self):
+        with KnowtatorArchive(self.archive_dir) as archive:
+            results = list(annotate_stream(iter(TEXTS), self.model, archive=archive))
+        self.assertEqual(len(results), len(TEXTS))
+        self.assertEqual(sorted(read_index(self.archive_dir)), [rpt_id for rpt_id, text in TEXTS])
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_KnowtatorArchive)
+    unittest.TextTestRunner(verbosity=2).run(suit)
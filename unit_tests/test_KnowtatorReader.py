@@ -0,0 +1,97 @@
+import unittest
+import os
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.KnowtatorReader import read_knowtator, get_rpt_id
+from models.mention_level_models import MentionLevelModel
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LEXICON_DIR = os.path.join(ROOT_DIR, 'lexicon')
+DEMO_SAVED = os.path.join(ROOT_DIR, 'demo', 'saved', 'example.txt.knowtator.xml')
+
+# The class and slots come before the annotation and the annotation has two spans
+REORDERED = '''<annotations textSource="report.txt">
+  <stringSlotMention id="m11">
+    <mentionSlot id="assertion"/>
+    <stringSlotMentionValue value="negated"/>
+  </stringSlotMention>
+  <classMention id="m1">
+    <mentionClass id="Evidence of UTI">no uti</mentionClass>
+    <hasSlotMention id="m11"/>
+    <hasSlotMention id="m12"/>
+  </classMention>
+  <stringSlotMention id="m12">
+    <mentionSlot id="temporality"/>
+    <stringSlotMentionValue value="historical"/>
+  </stringSlotMention>
+  <annotation>
+    <mention id="m1"/>
+    <annotator id="eHOST_2010">reviewer</annotator>
+    <span start="20" end="26"/>
+    <span start="4" end="10"/>
+    <spannedText>no uti</spannedText>
+    <creationDate>01012018 10:00:00</creationDate>
+  </annotation>
+  <annotation>
+    <mention id="m2"/>
+    <annotator id="eHOST_2010">reviewer</annotator>
+    <span start="30" end="35"/>
+    <spannedText>no class</spannedText>
+  </annotation>
+</annotations>
+'''
+
+
+class test_KnowtatorReader(unittest.TestCase):
+
+    def test_get_rpt_id(self):
+        self.assertEqual(get_rpt_id('/path/to/report1.txt.knowtator.xml'), 'report1')
+        self.assertEqual(get_rpt_id('report1.knowtator.xml'), 'report1')
+
+    def test_demo(self):
+        annotations = read_knowtator(DEMO_SAVED)
+        self.assertEqual(len(annotations), 7)
+        first = annotations[0]
+        self.assertEqual((first.rpt_id, first.annotator, first.span_in_document, first.text),
+                         ('example', 'hai_detect', (44, 62), 'signs of pneumonia'))
+        self.assertEqual(first.id, '115004829850514214288261239058027033064')
+        self.assertEqual(first.annotation_type, 'Evidence of Pneumonia')
+        self.assertEqual(first.attributes, {'assertion': 'probable', 'temporality': 'current'})
+        self.assertEqual(first.datetime, '12182017 07:40:05')
+        self.assertEqual(annotations[2].classification, 'Negated Evidence of UTI')
+
+    def test_reordered_elements(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filepath = os.path.join(tmpdir, 'report.txt.knowtator.xml')
+            with open(filepath, 'w') as f:
+                f.write(REORDERED)
+            annotations = read_knowtator(filepath, rpt_id='other')
+        self.assertEqual(len(annotations), 1)
+        annotation = annotations[0]
+        self.assertEqual((annotation.rpt_id, annotation.annotator, annotation.span_in_document),
+                         ('other', 'reviewer', (4, 26)))
+        self.assertEqual(annotation.classification, 'Negated Evidence of UTI - Historical')
+
+    def test_round_trip(self):
+        model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                  os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+        document = ClinicalTextDocument('There is an abscess near the wound & incision. He has a history of pneumonia. '
+                                        'There is no uti.', rpt_id='doc1')
+        document.annotate(model)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            document.to_knowtator(tmpdir, verbose=False)
+            annotations = read_knowtator(os.path.join(tmpdir, 'doc1.txt.knowtator.xml'))
+        expected = document.annotations['hai_detect']
+        self.assertEqual(len(annotations), len(expected))
+        for annotation, other in zip(annotations, expected):
+            self.assertEqual((annotation.id, annotation.rpt_id, annotation.annotator, annotation.span_in_document,
+                              annotation.text, annotation.annotation_type, annotation.attributes,
+                              annotation.classification),
+                             (other.id, other.rpt_id, other.annotator, other.span_in_document,
+                              other.text, other.annotation_type, other.attributes, other.classification))
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_KnowtatorReader)
+    unittest.TextTestRunner(verbosity=2).run(suit)
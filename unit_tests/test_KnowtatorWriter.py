@@ -0,0 +1,74 @@
+import unittest
+import os
+import io
+import tempfile
+
+from lxml import etree
+
+from annotations.Annotation import Annotation
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.KnowtatorWriter import KnowtatorWriter
+from models.mention_level_models import MentionLevelModel
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+
+class test_KnowtatorWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                       os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def _write(self, document):
+        f = io.StringIO()
+        KnowtatorWriter(f).write_document(document)
+        return f.getvalue()
+
+    def _expected(self, document):
+        return etree.tostring(document.to_etree(), pretty_print=True, encoding='unicode')
+
+    def test_matches_to_etree(self):
+        text = 'There is an abscess near the wound. He has a history of pneumonia. There is no uti.'
+        document = ClinicalTextDocument(text, rpt_id='doc1')
+        document.annotate(self.model)
+        self.assertEqual(len(document.annotations['hai_detect']), 3)
+        self.assertEqual(self._write(document), self._expected(document))
+
+    def test_no_annotations(self):
+        document = ClinicalTextDocument('Nothing to see here.', rpt_id='doc2')
+        document.annotate(self.model)
+        self.assertEqual(self._write(document), self._expected(document))
+
+    def test_escaping(self):
+        document = ClinicalTextDocument('The wound & "incision" <are> fine.', rpt_id='a&b "c"')
+        annotation = Annotation()
+        annotation.id = 'id"&<1>'
+        annotation.annotator = 'gold & <standard>'
+        annotation.span_in_document = (0, 34)
+        annotation.text = 'the wound & "incision" <are>\tfine.\r\n]]> é'
+        annotation.annotation_type = 'Evidence of SSI'
+        annotation.attributes.update({'assertion': 'negated', 'ssi_class': 'super\n"ficial"\t&'})
+        other = Annotation()
+        other.id = '2'
+        other.span_in_document = (0, 1)
+        other.annotation_type = 'Evidence of UTI'
+        document.annotations['gold_standard'] = [annotation, other]
+        self.assertEqual(self._write(document), self._expected(document))
+
+    def test_to_knowtator_invalid_text(self):
+        document = ClinicalTextDocument('There is an abscess near the wound.', rpt_id='doc3')
+        document.annotate(self.model)
+        document.annotations['hai_detect'][0].text = 'abscess\x0b'
+        with tempfile.TemporaryDirectory() as outdir:
+            with self.assertRaises(ValueError):
+                document.to_knowtator(outdir, verbose=False)
+            self.assertEqual(os.listdir(outdir), [])
+            document.annotations['hai_detect'][0].text = 'abscess'
+            document.to_knowtator(outdir, verbose=False)
+            with open(os.path.join(outdir, 'doc3.txt.knowtator.xml')) as f:
+                self.assertEqual(f.read(), self._expected(document))
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_KnowtatorWriter)
+    unittest.TextTestRunner(verbosity=2).run(suit)
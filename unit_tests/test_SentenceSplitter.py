@@ -0,0 +1,69 @@
+import unittest
+import random
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.SentenceSplitter import SentenceSplitter
+from benchmarks.synthetic_notes import SyntheticNoteGenerator
+
+
+class test_SentenceSplitter(unittest.TestCase):
+
+    def setUp(self):
+        self.splitter = SentenceSplitter()
+
+    def _word_walk(self, text):
+        "The sentences found by walking through every word"
+        document = ClinicalTextDocument()
+        preprocessed = document.preprocess(text)
+        return [dict(s) for s in document.split_sentences(preprocessed, document.get_text_spans(text))]
+
+    def _regex(self, text):
+        return [dict(s) for s in self.splitter.split(text.lower())]
+
+    def test_parity(self):
+        texts = [
+            '',
+            '   ',
+            'no termination point',
+            'The wound is CDI.  Seen by Dr. Smith;\nno  erythema a/p: continue',
+            'Mr. and Mrs. Jones met Ms. Smith, M.D. today! Is it infected? yes; no.',
+            '...  . ; ? !',
+            'a/p:a/p: a/p: done.dr. x',
+            'tabs\tand\r\nnew\x0blines.  trailing space.   ',
+            'Ünïcödé wörds. Full width. End',
+        ]
+        texts.extend(text for rpt_id, text in SyntheticNoteGenerator(seed=3, num_sentences=30).generate_notes(20))
+        rng = random.Random(0)
+        pieces = ['dr.', 'mr.', 'a/p:', 'the', 'wound.', 'is;', '?', 'cdi!', 'm.d', '  ', '\n', 'x.y', 'ok']
+        for _ in range(200):
+            texts.append(' '.join(rng.choice(pieces) for _ in range(rng.randint(0, 20))))
+        for text in texts:
+            self.assertEqual(self._regex(text), self._word_walk(text), msg=repr(text))
+
+    def test_unicode_whitespace(self):
+        # NLTK's tokenizer doesn't split on separators like \x1c that str.split() does,
+        # which misaligns the words and spans in split_sentences()
+        text = 'the wound\x1cis cdi.\u3000next'
+        self.assertEqual([s['text'] for s in self.splitter.split(text)], ['the wound is cdi.', 'next'])
+        self.assertEqual([s['span'] for s in self.splitter.split(text)], [(0, 17), (18, 22)])
+
+    def test_document_uses_splitter(self):
+        text = 'There is an abscess.  Seen by Dr. Smith'
+        document = ClinicalTextDocument(text, rpt_id='report')
+        self.assertIsNone(document.sentences.token_bounds) # tokens haven't been found yet
+        self.assertEqual([s['span'] for s in document.sentences], [(0, 20), (22, 39)])
+        self.assertEqual(document.sentences[1]['word_spans'], [(22, 26), (27, 29), (30, 33), (34, 39)])
+        self.assertEqual(document.original_spans[:2], [(0, 5), (6, 8)])
+
+    def test_split_at_headers(self):
+        text = 'the wound is clean  physical exam: no erythema -fever?: no'
+        self.assertEqual([s['text'] for s in self.splitter.split(text)], [text.replace('  ', ' ')])
+        splitter = SentenceSplitter(split_at_headers=True)
+        self.assertEqual([s['text'] for s in splitter.split(text)],
+                         ['the wound is clean', 'physical exam: no erythema', '-fever?: no'])
+        self.assertEqual(splitter.split(text)[0]['span'], (0, 18))
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_SentenceSplitter)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,57 @@
+import unittest
+import pickle
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.SentenceTable import SentenceTable
+
+
+class test_SentenceTable(unittest.TestCase):
+
+    def setUp(self):
+        self.text = 'The wound is CDI.  Seen by Dr. Smith;\nno  erythema a/p: continue'
+        self.document = ClinicalTextDocument(self.text, rpt_id='report')
+
+    def test_dict_access(self):
+        sentences = self.document.sentences
+        self.assertEqual(len(sentences), 4)
+        self.assertEqual(dict(sentences[0]), {'idx': 0, 'text': 'the wound is cdi.',
+                                              'words': ['the', 'wound', 'is', 'cdi.'], 'span': (0, 17),
+                                              'word_spans': [(0, 3), (4, 9), (10, 12), (13, 17)]})
+        self.assertEqual([s['text'] for s in sentences],
+                         ['the wound is cdi.', 'seen by dr. smith;', 'no erythema a/p:', 'continue'])
+        self.assertEqual(sentences[-1]['span'], (len(self.text) - len('continue'), len(self.text)))
+        self.assertEqual('{text} '.format(**sentences[1]), 'seen by dr. smith; ')
+        self.assertRaises(IndexError, lambda: sentences[4])
+        self.assertRaises(KeyError, lambda: sentences[0]['annotations'])
+
+    def test_original_spans(self):
+        spans = self.document.original_spans
+        self.assertEqual(len(spans), len(self.text.split()))
+        self.assertEqual([self.text[start:end] for start, end in spans], self.text.split())
+
+    def test_find_sentence(self):
+        sentences = self.document.sentences
+        self.assertEqual(sentences.find_sentence(0), 0)
+        self.assertEqual(sentences.find_sentence(self.text.index('Smith')), 1)
+        self.assertEqual(sentences.find_sentence(self.text.index('continue') + 3), 3)
+        self.assertIsNone(sentences.find_sentence(17))
+        self.assertIsNone(sentences.find_sentence(len(self.text)))
+
+    def test_preprocessing_changes_length(self):
+        # 'İ'.lower() is two characters long, so the words can't be sliced from the preprocessed text
+        document = ClinicalTextDocument('İstanbul is here. Next', rpt_id='report')
+        self.assertEqual([s['text'] for s in document.sentences], ['i̇stanbul is here.', 'next'])
+        self.assertEqual(document.sentences[1]['span'], (18, 22))
+
+    def test_empty(self):
+        self.assertEqual(len(SentenceTable()), 0)
+        self.assertEqual(len(ClinicalTextDocument('   ', rpt_id='report').sentences), 0)
+
+    def test_pickle(self):
+        sentences = pickle.loads(pickle.dumps(self.document.sentences))
+        self.assertEqual([dict(s) for s in sentences], [dict(s) for s in self.document.sentences])
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_SentenceTable)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,78 @@
+import unittest
+import os
+import glob
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.KnowtatorReader import read_knowtator
+from benchmarks.synthetic_notes import SyntheticNoteGenerator
+from models.mention_level_models import MentionLevelModel
+import main
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+
+class test_annotate_in_pool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                      os.path.join(LEXICON_DIR, 'modifiers.tsv'), gate_on_targets=True)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.corpus = os.path.join(self.tmpdir.name, 'corpus')
+        os.mkdir(self.corpus)
+        self.reports = []
+        for i, num_sentences in enumerate([40, 5, 5, 5, 5, 20, 3, 10]):
+            rpt_id, text = SyntheticNoteGenerator(seed=i, num_sentences=num_sentences).generate_notes(1)[0]
+            filepath = os.path.join(self.corpus, 'report{}.txt'.format(i))
+            with open(filepath, 'w') as f:
+                f.write(text)
+            self.reports.append(filepath)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _read_outdir(self, outdir):
+        results = {}
+        for filepath in glob.glob(os.path.join(outdir, '*.xml')):
+            results[os.path.basename(filepath)] = [(a.span_in_document, a.annotation_type, a.classification)
+                                                   for a in read_knowtator(filepath)]
+        return results
+
+    def test_chunk_by_size(self):
+        chunks = main.chunk_by_size(self.reports, 3)
+        self.assertEqual(sorted(report for chunk in chunks for report in chunk), sorted(self.reports))
+        sizes = [sum(os.path.getsize(report) for report in chunk) for chunk in chunks]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertEqual(len(main.chunk_by_size(self.reports[:2], 3)), 2)
+
+    def test_annotate_chunk(self):
+        outdir = os.path.join(self.tmpdir.name, 'chunk')
+        os.mkdir(outdir)
+        main._init_worker(self.model)
+        pid, num_reports, num_annotations, profile = main._annotate_chunk(self.reports[:3], outdir)
+        self.assertEqual((pid, num_reports, profile), (os.getpid(), 3, None))
+        self.assertEqual(num_annotations, sum(len(annotations) for annotations in self._read_outdir(outdir).values()))
+
+    def test_matches_serial(self):
+        serial_dir = os.path.join(self.tmpdir.name, 'serial')
+        pool_dir = os.path.join(self.tmpdir.name, 'pool')
+        os.mkdir(serial_dir)
+        os.mkdir(pool_dir)
+        for report in self.reports:
+            document = ClinicalTextDocument(filepath=report)
+            document.annotate(self.model)
+            document.to_knowtator(serial_dir, verbose=False)
+        profile = main.annotate_in_pool(self.reports, self.model, pool_dir, workers=2, chunks_per_worker=2,
+                                        profile=True)
+        expected = self._read_outdir(serial_dir)
+        self.assertEqual(len(expected), len(self.reports))
+        self.assertEqual(self._read_outdir(pool_dir), expected)
+        self.assertEqual(sum(profile.annotations) > 0, any(expected.values()))
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_annotate_in_pool)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,56 @@
+import unittest
+import os
+import sqlite3 as sqlite
+
+from models.mention_level_models import MentionLevelModel
+from utils.data_wrangling.annotate_sqlite import annotate_database, ANNOTATION_COLUMNS
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+
+class test_annotate_sqlite(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                      os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def setUp(self):
+        self.con = sqlite.connect(':memory:')
+        self.con.execute("CREATE TABLE epic_notes (NOTE_ID INTEGER, NOTE TEXT)")
+        notes = [(1, 'There is an abscess near the abdomen. ' * 3),
+                 (2, 'There is no erythema to be seen along the surgical site. ' * 2),
+                 (3, 'Too short.'),
+                 (4, 'The patient has a history of wound infection. Nothing else to report today, he is doing well and will follow up.')]
+        self.con.executemany("INSERT INTO epic_notes VALUES (?, ?)", notes)
+        self.con.commit()
+
+    def tearDown(self):
+        self.con.close()
+
+    def _annotations(self):
+        return self.con.execute("SELECT rpt_id, classification FROM hai_annotations ORDER BY rpt_id").fetchall()
+
+    def test_annotate_database(self):
+        num_notes, num_annotations = annotate_database(self.con, self.model, batch_size=2)
+        self.assertEqual(num_notes, 3)
+        annotations = self._annotations()
+        self.assertEqual(len(annotations), num_annotations)
+        self.assertIn(('1', 'Positive Evidence of SSI'), annotations)
+        self.assertIn(('2', 'Negated Evidence of SSI'), annotations)
+        self.assertIn(('4', 'Positive Evidence of SSI - Historical'), annotations)
+        self.assertNotIn('3', [rpt_id for rpt_id, classification in annotations])
+
+        columns = [row[1] for row in self.con.execute("PRAGMA table_info(hai_annotations)")]
+        self.assertEqual(columns, ANNOTATION_COLUMNS)
+
+    def test_rerun_replaces_annotations(self):
+        annotate_database(self.con, self.model, batch_size=2)
+        annotations = self._annotations()
+        annotate_database(self.con, self.model, batch_size=10)
+        self.assertEqual(self._annotations(), annotations)
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_annotate_sqlite)
+    unittest.TextTestRunner(verbosity=2).run(suit)
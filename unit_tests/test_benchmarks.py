@@ -0,0 +1,35 @@
+import unittest
+
+from benchmarks.synthetic_notes import SyntheticNoteGenerator
+from benchmarks.run_benchmarks import run_benchmarks, compare_to_baseline, STAGES
+
+
+class test_benchmarks(unittest.TestCase):
+
+    def test_generator_is_deterministic(self):
+        notes = SyntheticNoteGenerator(seed=1, num_sentences=10).generate_notes(5)
+        self.assertEqual(notes, SyntheticNoteGenerator(seed=1, num_sentences=10).generate_notes(5))
+        self.assertNotEqual(notes, SyntheticNoteGenerator(seed=2, num_sentences=10).generate_notes(5))
+        self.assertEqual(len(notes), 5)
+
+    def test_target_density(self):
+        generator = SyntheticNoteGenerator(num_sentences=20, target_density=0.0)
+        for rpt_id, text in generator.generate_notes(5):
+            for target in generator.targets:
+                self.assertNotIn(' ' + target + ' ', text.lower())
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(num_notes=3, num_sentences=10, target_density=0.5, repeat=1)
+        self.assertEqual(sorted(results['stages']), sorted(STAGES))
+        self.assertGreater(results['num_sentences'], 0)
+        self.assertGreater(results['peak_rss_mb'], 0)
+
+        self.assertEqual(compare_to_baseline(results, results), [])
+        slower = {'params': results['params'], 'total': results['total'],
+                  'stages': {stage: {'seconds': stats['seconds'] * 2 + 1} for stage, stats in results['stages'].items()}}
+        self.assertEqual([stage for stage, old, new in compare_to_baseline(slower, results)], STAGES)
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_benchmarks)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,90 @@
+import unittest
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from evaluate_annotations import import_from_xlsx, import_from_ehost
+
+
+HEADER = ['Report', 'File', 'Text', 'Span', 'Class', 'Attribute 1', 'Value 1', 'Attribute 2', 'Value 2',
+          'Attribute 3', 'Value 3']
+
+
+class test_evaluate_annotations(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.corpus_dir = os.path.join(self.tmpdir.name, 'corpus')
+        os.mkdir(self.corpus_dir)
+        with open(os.path.join(self.corpus_dir, 'doc1.txt'), 'w') as f:
+            f.write('There is an abscess near the abdomen. The wound is CDI.')
+        with open(os.path.join(self.corpus_dir, 'doc2.txt'), 'w') as f:
+            f.write('He has a history of pneumonia.')
+
+        wb = Workbook()
+        ws = wb.active
+        ws.append(HEADER)
+        ws.append(['doc1', 'doc1.txt', 'There is an abscess near the abdomen.', '(0, 37)', 'Evidence of SSI',
+                   'assertion', 'present', 'temporality', 'current', 'ssi_class', 'superficial'])
+        ws.append(['doc2', 'doc2.txt', 'He has a history of pneumonia.', '(0, 30)', 'Evidence of Pneumonia',
+                   'assertion', 'present', 'temporality', 'historical', None, None])
+        ws.append(['missing', 'missing.txt', 'Not in the corpus.', '(0, 18)', 'Evidence of SSI',
+                   'assertion', 'present', 'temporality', 'current', None, None])
+        ws.append(['doc1', 'doc1.txt', 'The wound is CDI.', '(38, 55)', 'Evidence of SSI',
+                   'assertion', 'negated', 'temporality', 'current', 'ssi_class', 'superficial'])
+        self.xlsx = os.path.join(self.tmpdir.name, 'Annotations.xlsx')
+        wb.save(self.xlsx)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _check_documents(self, documents):
+        self.assertEqual(sorted(documents), ['doc1.txt', 'doc2.txt'])
+        doc1 = documents['doc1.txt']
+        self.assertEqual(doc1.rpt_id, 'doc1')
+        self.assertEqual(len(doc1.sentences), 2)
+        self.assertEqual([a.span_in_document for a in doc1.annotations['gold_standard']], [(0, 37), (38, 55)])
+        self.assertEqual([a.classification for a in doc1.annotations['gold_standard']],
+                         ['Positive Evidence of SSI', 'Negated Evidence of SSI'])
+        doc2 = documents['doc2.txt']
+        self.assertEqual(doc2.annotations['gold_standard'][0].classification,
+                         'Positive Evidence of Pneumonia - Historical')
+
+    def test_import_from_xlsx(self):
+        self._check_documents(import_from_xlsx(self.corpus_dir, self.xlsx))
+
+    def test_import_from_xlsx_in_pool(self):
+        self._check_documents(import_from_xlsx(self.corpus_dir, self.xlsx, workers=2))
+
+    def _save_knowtator(self):
+        saved_dir = os.path.join(self.tmpdir.name, 'saved')
+        os.mkdir(saved_dir)
+        for name in ('doc1.txt', 'doc2.txt', 'missing.txt'):
+            filepath = os.path.join(self.corpus_dir, name)
+            document = ClinicalTextDocument('missing file', rpt_id='missing')
+            if os.path.exists(filepath):
+                document = ClinicalTextDocument(filepath=filepath)
+            for anno in self.annotations[name]:
+                document.annotations['gold_standard'].append(anno)
+            document.to_knowtator(saved_dir, verbose=False)
+        return saved_dir
+
+    def test_import_from_ehost(self):
+        self.annotations = {name: [a for a in doc.annotations['gold_standard']]
+                            for name, doc in import_from_xlsx(self.corpus_dir, self.xlsx).items()}
+        self.annotations['missing.txt'] = []
+        for anno in self.annotations['doc1.txt'] + self.annotations['doc2.txt']:
+            anno.id = str(id(anno))
+        saved_dir = self._save_knowtator()
+        self._check_documents(import_from_ehost(self.corpus_dir, saved_dir))
+        self._check_documents(import_from_ehost(self.corpus_dir, saved_dir, workers=2))
+        documents = import_from_ehost(self.corpus_dir, saved_dir, annotator=None)
+        self.assertEqual(list(documents['doc1.txt'].annotations), ['Gold Standard'])
+
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_evaluate_annotations)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,34 @@
+import unittest
+
+from benchmarks.import_time import parse_importtime, run_import_benchmarks, check_budgets
+
+OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       129 |        129 |   _io
+import time:      1150 |     150526 |   pyConTextNLP.pyConTextGraph
+import time:      2573 |     207586 | models.mention_level_models
+"""
+
+
+class test_import_time(unittest.TestCase):
+
+    def test_parse_importtime(self):
+        self.assertEqual(parse_importtime(OUTPUT), {'_io': 129, 'pyConTextNLP.pyConTextGraph': 150526,
+                                                    'models.mention_level_models': 207586})
+
+    def test_deferred_imports(self):
+        results = run_import_benchmarks(['annotations.ClinicalTextDocument', 'evaluate_annotations'], repeat=1)
+        for module, result in results.items():
+            self.assertEqual(result['deferred_imported'], [], module)
+            self.assertGreater(result['ms'], 0)
+
+    def test_check_budgets(self):
+        results = {'fast': {'ms': 10.0, 'budget_ms': 20, 'deferred_imported': []},
+                   'slow': {'ms': 30.0, 'budget_ms': 20, 'deferred_imported': []},
+                   'heavy': {'ms': 10.0, 'budget_ms': 20, 'deferred_imported': ['nltk']}}
+        self.assertEqual(len(check_budgets(results)), 2)
+        self.assertEqual(check_budgets(results, scale=2.0), ['heavy imports nltk'])
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_import_time)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,139 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from benchmarks.synthetic_notes import SyntheticNoteGenerator
+from models.mention_level_models import MentionLevelModel
+from models.lexicon_index import get_entry
+from evaluate_annotations import compute_metrics
+from lexicon_ablation import LexiconAblation
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+CATEGORIES = ['Evidence of SSI', 'Evidence of UTI', 'Evidence of Pneumonia']
+
+EXTRA_NOTES = [
+    ('cdi', 'The wound is CDI. There is no definite pneumonia.'),
+    ('uti', 'There is a new uti. The abscess near the incision is draining.'),
+    ('patos', 'There was pneumonia present at the time of surgery. The pneumonia was patos.'),
+    ('ruled_out', 'Pneumonia is ruled out.'),
+]
+
+
+class test_LexiconAblation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.notes = SyntheticNoteGenerator(seed=3, num_sentences=20, target_density=0.5).generate_notes(20)
+        self.notes.extend(EXTRA_NOTES)
+        self.model = self._model(os.path.join(LEXICON_DIR, 'targets.tsv'), os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        # Put back the expressions of the original lexicon in pyConText's cache
+        self._model(os.path.join(LEXICON_DIR, 'targets.tsv'), os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def _model(self, targets, modifiers):
+        return MentionLevelModel(targets, modifiers, gate_on_targets=True)
+
+    def _documents(self):
+        """
+        Returns documents with a gold standard that leaves out every third annotation of the full lexicon.
+        """
+        documents = []
+        for rpt_id, text in self.notes:
+            document = ClinicalTextDocument(text, rpt_id=rpt_id)
+            document.annotate(self.model)
+            document.annotations['gold_standard'] = document.annotations['hai_detect'][::3]
+            documents.append(document)
+        return documents
+
+    def _evaluate(self, documents, model):
+        comparisons = []
+        for document in documents:
+            document.annotate(model)
+            comparisons.extend(document.compare_annotations(categories=CATEGORIES))
+        return compute_metrics(comparisons, CATEGORIES)
+
+    def _remove_row(self, filename, literal, first_only=False):
+        """
+        Returns a model built from a copy of the lexicon without the rows for `literal` in `filename`,
+        or only without the first of them if `first_only` is True.
+        """
+        for name in ('targets.tsv', 'modifiers.tsv'):
+            shutil.copy(os.path.join(LEXICON_DIR, name), os.path.join(self.tmpdir.name, name))
+        filepath = os.path.join(self.tmpdir.name, filename)
+        with open(filepath) as f:
+            lines = f.read().split('\n')
+        rows = [i for i, line in enumerate(lines) if line.startswith(literal + '\t')]
+        if first_only:
+            rows = rows[:1]
+        with open(filepath, 'w') as f:
+            f.write('\n'.join(line for i, line in enumerate(lines) if i not in rows))
+        return self._model(os.path.join(self.tmpdir.name, 'targets.tsv'),
+                           os.path.join(self.tmpdir.name, 'modifiers.tsv'))
+
+    def _get_entry(self, literal, mode):
+        for item, item_mode in self.model.matcher.items:
+            if item.getLiteral() == literal and item_mode == mode:
+                return get_entry(item, mode)
+
+    def test_mark_documents_matches_full_run(self):
+        documents = self._documents()
+        ablation = LexiconAblation(documents, self.model, CATEGORIES)
+        self.assertEqual(ablation.mark_documents(), self._evaluate(self._documents(), self.model))
+
+    def test_ablate_matches_full_run(self):
+        documents = self._documents()
+        ablation = LexiconAblation(documents, self.model, CATEGORIES)
+        ablation.mark_documents()
+        # 'no definite' hides the shorter 'no' when both match
+        for filename, literal, mode in [('targets.tsv', 'uti', 'target'), ('modifiers.tsv', 'cdi', 'modifier'),
+                                        ('modifiers.tsv', 'abscess', 'modifier'),
+                                        ('modifiers.tsv', 'no definite', 'modifier')]:
+            entry = self._get_entry(literal, mode)
+            self.assertIn(entry, ablation.postings)
+            expected = self._evaluate(self._documents(), self._remove_row(filename, literal))
+            self.assertEqual(ablation.ablate(entry), expected, literal)
+
+    def test_shared_literals(self):
+        documents = self._documents()
+        ablation = LexiconAblation(documents, self.model, CATEGORIES)
+        ablation.mark_documents()
+        # Without the first row, the literal uses the expression of the second row, \bpatos\b
+        entry = self._get_entry('present at the time of surgery', 'modifier')
+        model = self._remove_row('modifiers.tsv', 'present at the time of surgery', first_only=True)
+        self.assertEqual(ablation.ablate(entry), self._evaluate(self._documents(), model))
+        document = ClinicalTextDocument(dict(self.notes)['patos'], rpt_id='patos')
+        document.annotate(model)
+        expected = [(a.sentence_num, a.classification) for a in document.annotations['hai_detect']]
+        annotations = ablation.get_annotations('patos', ablation.annotate_without(entry))
+        self.assertEqual([(a.sentence_num, a.classification) for a in annotations], expected)
+        self.assertIn((0, 'Positive Evidence of Pneumonia'), expected)
+        self.assertIn((1, 'Positive Evidence of Pneumonia - Historical'), expected)
+        # Identical rows are removed together
+        entry = self._get_entry('is ruled out', 'modifier')
+        self.assertEqual(len(ablation.rows[entry]), 2)
+        self.assertEqual(ablation.ablate(entry),
+                         self._evaluate(self._documents(), self._remove_row('modifiers.tsv', 'is ruled out')))
+
+    def test_run(self):
+        ablation = LexiconAblation(self._documents(), self.model, CATEGORIES)
+        results = ablation.run()
+        self.assertEqual(len(results), len(ablation.rows) * len(CATEGORIES))
+        self.assertLess(len(ablation.rows), len(self.model.matcher.items))
+        ruled_out = [r for r in results if r['literal'] == 'is ruled out']
+        self.assertEqual([r['num_rows'] for r in ruled_out], [2] * len(CATEGORIES))
+        unused = [r for r in results if r['num_sentences'] == 0]
+        self.assertTrue(unused)
+        for result in unused:
+            self.assertEqual((result['delta_tp'], result['delta_fp'], result['delta_fn'], result['delta_f1']),
+                             (0, 0, 0, 0))
+        uti = [r for r in results if r['literal'] == 'uti' and r['class'] == 'Evidence of UTI'][0]
+        self.assertLess(uti['delta_tp'], 0)
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_LexiconAblation)
+    unittest.TextTestRunner(verbosity=2).run(suit)
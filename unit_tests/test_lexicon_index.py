@@ -0,0 +1,162 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from benchmarks.synthetic_notes import SyntheticNoteGenerator
+from models.mention_level_models import MentionLevelModel
+from models.lexicon_index import LexiconIndex
+from models.markup_cache import normalize_sentence
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+EXTRA_NOTES = [
+    ('healing', 'The incision is healing well. The wound is CDI. The wound is clean and dry.'),
+    ('oozing', 'The wound is oozing. There is a new uti.'),
+]
+
+
+class test_LexiconIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.targets = os.path.join(self.tmpdir.name, 'targets.tsv')
+        self.modifiers = os.path.join(self.tmpdir.name, 'modifiers.tsv')
+        shutil.copy(os.path.join(LEXICON_DIR, 'targets.tsv'), self.targets)
+        shutil.copy(os.path.join(LEXICON_DIR, 'modifiers.tsv'), self.modifiers)
+        self.notes = SyntheticNoteGenerator(seed=5, num_sentences=20, target_density=0.5).generate_notes(30)
+        self.notes.extend(EXTRA_NOTES)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        # Put back the expressions of the original lexicon in pyConText's cache
+        MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'), os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def _edit_lexicon(self):
+        with open(self.modifiers) as f:
+            lines = f.read().split('\n')
+        edited = []
+        for line in lines:
+            if line.startswith('healed\t'):
+                continue # Removed
+            if line.startswith('cdi\t'):
+                line = 'cdi\tNEGATED SUPERFICIAL SURGICAL SITE INFECTION\t\\bcdi\\b\tbidirectional\t' # Edited
+            edited.append(line)
+        edited.insert(1, 'oozing\tSUPERFICIAL SURGICAL SITE INFECTION\t\\booz(ing|ed)\\b\tbidirectional\t') # Added
+        with open(self.modifiers, 'w') as f:
+            f.write('\n'.join(edited))
+        with open(self.targets) as f:
+            lines = f.read().split('\n')
+        with open(self.targets, 'w') as f:
+            f.write('\n'.join(line for line in lines if not line.startswith('uti\t')))
+
+    def _documents(self):
+        return [ClinicalTextDocument(text, rpt_id=rpt_id) for rpt_id, text in self.notes]
+
+    def _model(self):
+        return MentionLevelModel(self.targets, self.modifiers, gate_on_targets=True)
+
+    def _results(self, documents):
+        return [(d.rpt_id, a.sentence_num, a.span_in_document, a.classification, sorted(a.attributes.items()),
+                 a.text) for d in documents for a in d.annotations['hai_detect']]
+
+    def test_first_run_annotates_everything(self):
+        index = LexiconIndex()
+        documents = self._documents()
+        num_annotated = index.annotate_documents(documents, self._model())
+        self.assertEqual(num_annotated, sum(len(d.sentences) for d in documents))
+        self.assertEqual(index.annotate_documents(self._documents(), self._model()), 0)
+
+    def test_lexicon_edit_matches_full_run(self):
+        index = LexiconIndex()
+        index.annotate_documents(self._documents(), self._model())
+        path = os.path.join(self.tmpdir.name, 'index.pkl')
+        index.save(path)
+
+        self._edit_lexicon()
+        model = self._model()
+        index = LexiconIndex.load(path)
+        documents = self._documents()
+        num_annotated = index.annotate_documents(documents, model)
+        self.assertGreater(num_annotated, 0)
+        self.assertLess(num_annotated, sum(len(d.sentences) for d in documents))
+
+        expected = self._documents()
+        for document in expected:
+            document.annotate(model)
+        self.assertEqual(self._results(documents), self._results(expected))
+        self.assertEqual({a.classification for a in documents[-1].annotations['hai_detect']},
+                         {'Positive Evidence of SSI'})
+
+    def test_changed_document(self):
+        index = LexiconIndex()
+        index.annotate_documents(self._documents(), self._model())
+        self.notes[0] = (self.notes[0][0], 'He has a history of pneumonia.')
+        documents = self._documents()
+        self.assertEqual(index.annotate_documents(documents, self._model()), 1)
+        self.assertEqual([a.classification for a in documents[0].annotations['hai_detect']],
+                         ['Positive Evidence of Pneumonia - Historical'])
+
+    def test_reordered_rows_with_shared_literal(self):
+        self.notes.append(('patos', 'The wound infection was present at the time of surgery. Wound infection patos.'))
+        index = LexiconIndex()
+        index.annotate_documents(self._documents(), self._model())
+
+        # The first row with a literal decides the expression of every row with it
+        with open(self.modifiers) as f:
+            lines = f.read().split('\n')
+        rows = [i for i, line in enumerate(lines) if line.startswith('present at the time of surgery\t')]
+        self.assertEqual(len(rows), 2)
+        lines[rows[0]], lines[rows[1]] = lines[rows[1]], lines[rows[0]]
+        with open(self.modifiers, 'w') as f:
+            f.write('\n'.join(lines))
+        model = self._model()
+        self.assertEqual(index.get_changed_literals(model), {'present at the time of surgery'})
+
+        documents = self._documents()
+        self.assertGreater(index.annotate_documents(documents, model), 0)
+        expected = self._documents()
+        for document in expected:
+            document.annotate(model)
+        self.assertEqual(self._results(documents), self._results(expected))
+        self.assertEqual([a.classification for a in documents[-1].annotations['hai_detect']],
+                         ['Positive Evidence of SSI', 'Positive Evidence of SSI - Historical'])
+
+    def test_postings_are_pruned(self):
+        index = LexiconIndex()
+        index.annotate_documents(self._documents(), self._model())
+        fresh = LexiconIndex()
+        fresh.annotate_documents(self._documents()[:-1], self._model())
+        self.assertEqual(len(index.sentences), len(fresh.sentences) + 2)
+
+        # A changed document and a removed one leave no sentence ids behind
+        self.notes[0] = (self.notes[0][0], 'He has a history of pneumonia.')
+        del self.notes[-1]
+        index.annotate_documents(self._documents(), self._model())
+        self.assertNotIn('oozing', index.documents)
+        self.assertEqual(len(index.sentences), sum(len(d.sentences) for d in self._documents()))
+        for postings in (index.entry_postings, index.gram_postings):
+            for sentence_ids in postings.values():
+                self.assertTrue(sentence_ids)
+                self.assertTrue(sentence_ids.issubset(index.sentences))
+
+    def test_postings_match_full_search(self):
+        index = LexiconIndex()
+        documents = self._documents()
+        model = self._model()
+        index.annotate_documents(documents, model)
+        # Searching only the matcher's candidates finds the same sentences as searching every entry
+        expected = {}
+        for document in documents:
+            for sentence_id, sentence in zip(index.documents[document.rpt_id][1], document.sentences):
+                text = normalize_sentence(sentence['text'])
+                for entry, item, regex in index._get_items(model):
+                    if regex.search(text):
+                        expected.setdefault(entry, set()).add(sentence_id)
+        self.assertEqual(index.entry_postings, expected)
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_LexiconIndex)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,78 @@
+import unittest
+import os
+
+import pyConTextNLP.pyConTextGraph as pyConText
+
+from models.mention_level_models import MentionLevelModel
+from models.lexicon_matcher import LexiconMatcher, UnsupportedPattern
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+
+class test_LexiconMatcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                      os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def _nodes(self, markup):
+        return [(n.getLiteral(), n.getSpan(), d['category']) for n, d in markup.nodes(data=True)]
+
+    def _mark_all(self, sentence):
+        markup = pyConText.ConTextMarkup()
+        markup.setRawText(sentence)
+        markup.markItems(self.model.modifiers, mode="modifier")
+        markup.markItems(self.model.targets, mode="target")
+        return markup
+
+    def _mark_matcher(self, sentence):
+        markup = pyConText.ConTextMarkup()
+        markup.setRawText(sentence)
+        self.model.matcher.mark(markup)
+        return markup
+
+    def test_get_prefixes(self):
+        matcher = self.model.matcher
+        self.assertEqual(matcher.get_prefixes(r'\bheal(ed|ing)\b'), {'hea'})
+        self.assertEqual(matcher.get_prefixes(r'\b(intra[ -]?)?abd(omen|ominal)?\b'), {'int', 'abd'})
+        self.assertEqual(matcher.get_prefixes(r'no[\s]*definite'), {'no ', 'nod'})
+        self.assertEqual(matcher.get_prefixes(r'(is|was) negative'), {'is ', 'was'})
+        self.assertRaises(UnsupportedPattern, lambda: matcher.get_prefixes(r'\bno\b'))
+        self.assertRaises(UnsupportedPattern, lambda: matcher.get_prefixes(r'.*infection'))
+
+    def test_same_marks_as_markItems(self):
+        sentences = [
+            'the wound is clean, dry and intact.',
+            'there is no erythema to be seen along the surgical site.',
+            'we discussed the risks of surgery, including abscess and erythema.',
+            'he has a history of surgical site infections.',
+            'there were complications due to pneumonia that was likely present at the time of surgery.',
+            'cannot rule the patient out for uti.',
+            'no  definite   signs of    infection in the intra-abdominal drain',
+            'The Wound Is CDI.',
+            '',
+        ]
+        for sentence in sentences:
+            self.assertEqual(self._nodes(self._mark_all(sentence)), self._nodes(self._mark_matcher(sentence)),
+                             msg=sentence)
+
+    def test_skips_items_without_prefix(self):
+        matcher = self.model.matcher
+        candidates = matcher.get_candidates('there is an abscess.')
+        literals = {matcher.items[idx][0].getLiteral() for idx in candidates}
+        self.assertIn('abscess', literals)
+        self.assertNotIn('pneumonia', literals)
+        self.assertLess(len(candidates), len(matcher.items))
+
+    def test_modes(self):
+        matcher = LexiconMatcher(self.model.modifiers, self.model.targets)
+        markup = pyConText.ConTextMarkup()
+        markup.setRawText('there is an abscess in the wound.')
+        matcher.mark(markup, modes=('target',))
+        self.assertEqual({d['category'] for n, d in markup.nodes(data=True)}, {'target'})
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_LexiconMatcher)
+    unittest.TextTestRunner(verbosity=2).run(suit)
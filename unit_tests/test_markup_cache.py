@@ -0,0 +1,84 @@
+import unittest
+import os
+import tempfile
+
+from annotations.Annotation import Annotation
+from models.mention_level_models import MentionLevelModel
+from models.markup_cache import MarkupCache
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+
+class test_MarkupCache(unittest.TestCase):
+
+    def setUp(self):
+        self.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                       os.path.join(LEXICON_DIR, 'modifiers.tsv'), cache_size=2)
+
+    def _nodes(self, markup):
+        return sorted((n.getLiteral(), n.getSpan(), d['category']) for n, d in markup.nodes(data=True))
+
+    def test_hits_and_misses(self):
+        sentence = 'the wound is clean, dry and intact.'
+        first = self.model.markup_sentence(sentence)
+        second = self.model.markup_sentence('the wound  is clean, dry and intact.')
+        self.assertEqual(self.model.cache.hits, 1)
+        self.assertEqual(self.model.cache.misses, 1)
+        self.assertEqual(self._nodes(first), self._nodes(second))
+        self.assertEqual(second.getRawText(), 'the wound  is clean, dry and intact.')
+
+    def test_evictions(self):
+        for sentence in ['there is an abscess.', 'there is pneumonia.', 'there is a uti.']:
+            self.model.markup_sentence(sentence)
+        self.assertEqual(self.model.cache.get_stats()['size'], 2)
+        self.assertEqual(self.model.cache.evictions, 1)
+        self.model.markup_sentence('there is an abscess.')
+        self.assertEqual(self.model.cache.hits, 0)
+
+    def test_copies_are_independent(self):
+        sentence = 'there is an abscess in the wound.'
+        first = self.model.markup_sentence(sentence)
+        second = self.model.markup_sentence(sentence)
+        first_ids = {n.getTagID() for n in first.nodes()}
+        second_ids = {n.getTagID() for n in second.nodes()}
+        self.assertEqual(len(first_ids.intersection(second_ids)), 0)
+
+        target = second.getMarkedTargets()[0]
+        annotation = Annotation()
+        annotation.from_markup(target, second, sentence, (0, len(sentence)), rpt_id='report')
+        self.assertEqual(annotation.classification, 'Positive Evidence of SSI')
+        self.assertEqual(annotation.id, str(target.getTagID()))
+
+        second.remove_nodes_from(list(second.nodes()))
+        self.assertEqual(self._nodes(self.model.markup_sentence(sentence)), self._nodes(first))
+
+    def test_save_and_load(self):
+        sentence = 'there is an abscess in the wound.'
+        self.model.markup_sentence(sentence)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filepath = os.path.join(tmpdir, 'markups.pickle')
+            self.model.cache.save(filepath)
+
+            cache = MarkupCache(10, fingerprint=self.model.lexicon_fingerprint)
+            self.assertEqual(cache.load(filepath), 1)
+            self.assertEqual(self._nodes(cache.get(sentence)), self._nodes(self.model.markup_sentence(sentence)))
+
+            other_cache = MarkupCache(10, fingerprint='another lexicon')
+            self.assertEqual(other_cache.load(filepath), 0)
+
+    def test_load_into_smaller_cache(self):
+        for sentence in ['there is an abscess.', 'there is pneumonia.']:
+            self.model.markup_sentence(sentence)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filepath = os.path.join(tmpdir, 'markups.pickle')
+            self.model.cache.save(filepath)
+            # Only the most recently used markup fits
+            cache = MarkupCache(1, fingerprint=self.model.lexicon_fingerprint)
+            self.assertEqual(cache.load(filepath), 1)
+            self.assertEqual(cache.get_stats()['evictions'], 1)
+            self.assertIsNotNone(cache.get('there is pneumonia.'))
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_MarkupCache)
+    unittest.TextTestRunner(verbosity=2).run(suit)
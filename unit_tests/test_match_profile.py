@@ -0,0 +1,109 @@
+import unittest
+import os
+import csv
+import json
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
+from benchmarks.synthetic_notes import SyntheticNoteGenerator
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+
+class test_MatchProfile(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                      os.path.join(LEXICON_DIR, 'modifiers.tsv'), gate_on_targets=True)
+        cls.notes = SyntheticNoteGenerator(seed=2, num_sentences=20, target_density=0.4).generate_notes(10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        self.model.stop_profile()
+
+    def _annotate(self):
+        documents = [ClinicalTextDocument(text, rpt_id=rpt_id) for rpt_id, text in self.notes]
+        for document in documents:
+            document.annotate(self.model)
+        return documents
+
+    def _get_annotations(self, documents):
+        return [(a.rpt_id, a.sentence_num, a.annotation_type, a.classification)
+                for document in documents for a in document.annotations['hai_detect']]
+
+    def test_profile(self):
+        expected = self._get_annotations(self._annotate())
+        profile = self.model.start_profile()
+        documents = self._annotate()
+        self.assertIs(self.model.stop_profile(), profile)
+        self.assertIsNone(self.model.profile)
+        # Profiling doesn't change the annotations
+        self.assertEqual(self._get_annotations(documents), expected)
+
+        self.assertEqual(profile.num_sentences, sum(len(document.sentences) for document in documents))
+        rows = profile.get_rows()
+        self.assertEqual(len(rows), len(self.model.matcher.items))
+        self.assertEqual([row['seconds'] for row in rows], sorted([row['seconds'] for row in rows], reverse=True))
+        # Every annotation has exactly one target
+        self.assertEqual(sum(row['annotations'] for row in rows if row['mode'] == 'target'), len(expected))
+        self.assertGreater(sum(row['annotations'] for row in rows if row['mode'] == 'modifier'), 0)
+        for row in rows:
+            self.assertLessEqual(row['calls'], profile.num_sentences)
+            if row['annotations']:
+                self.assertGreater(row['matches'], 0)
+        self.assertTrue(all(row['matches'] == 0 and row['calls'] > 0 for row in profile.get_dead_rows()))
+
+    def test_duplicate_rows(self):
+        profile = self.model.start_profile()
+        document = ClinicalTextDocument('Pneumonia is ruled out. Pneumonia was present at the time of surgery.',
+                                        rpt_id='report')
+        document.annotate(self.model)
+        self.assertEqual([a.classification for a in document.annotations['hai_detect']],
+                         ['Negated Evidence of Pneumonia', 'Positive Evidence of Pneumonia - Historical'])
+        for literal in ('is ruled out', 'present at the time of surgery'):
+            idxs = [idx for idx, entry in enumerate(profile.entries) if entry[1] == literal]
+            self.assertEqual(len(idxs), 2)
+            # The annotation is counted once, for the first row, and the second row runs the first row's expression
+            self.assertEqual([profile.annotations[idx] for idx in idxs], [1, 0])
+            self.assertEqual([profile.shadowed[idx] for idx in idxs], [False, True])
+        self.assertEqual(sum(row['shadowed'] for row in profile.get_rows()), sum(profile.shadowed))
+
+    def test_merge(self):
+        profile = self.model.start_profile()
+        self._annotate()
+        other = self.model.start_profile()
+        self._annotate()
+        matches = list(profile.matches)
+        profile.merge(other)
+        self.assertEqual(profile.matches, [count * 2 for count in matches])
+        self.assertEqual(profile.num_sentences, other.num_sentences * 2)
+        other.entries = other.entries[1:]
+        with self.assertRaises(ValueError):
+            profile.merge(other)
+
+    def test_save(self):
+        profile = self.model.start_profile()
+        self._annotate()
+        csv_path = os.path.join(self.tmpdir.name, 'profile.csv')
+        profile.save(csv_path, sort_by='matches')
+        with open(csv_path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), len(self.model.matcher.items))
+        self.assertEqual(int(rows[0]['matches']), max(profile.matches))
+
+        json_path = os.path.join(self.tmpdir.name, 'profile.json')
+        profile.save(json_path)
+        with open(json_path) as f:
+            report = json.load(f)
+        self.assertEqual(report['num_sentences'], profile.num_sentences)
+        self.assertEqual(report['rows'], profile.get_rows())
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_MatchProfile)
+    unittest.TextTestRunner(verbosity=2).run(suit)
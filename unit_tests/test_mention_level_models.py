@@ -0,0 +1,80 @@
+import unittest
+import os
+import glob
+import shutil
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LEXICON_DIR = os.path.join(ROOT_DIR, 'lexicon')
+DEMO_CORPUS = os.path.join(ROOT_DIR, 'demo', 'corpus')
+
+
+class test_MentionLevelModel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        targets = os.path.join(LEXICON_DIR, 'targets.tsv')
+        modifiers = os.path.join(LEXICON_DIR, 'modifiers.tsv')
+        cls.model = MentionLevelModel(targets, modifiers)
+        cls.gated_model = MentionLevelModel(targets, modifiers, gate_on_targets=True)
+
+    def _annotation_values(self, document):
+        return [(a.sentence_num, a.span_in_document, a.markup_category, a.modifier_categories,
+                 a.attributes, a.classification) for a in document.annotations['hai_detect']]
+
+    def test_gated_markup_without_targets(self):
+        markup = self.gated_model.markup_sentence('there is no erythema to be seen.')
+        self.assertEqual(len(markup.nodes()), 0)
+
+    def test_gated_markup_with_targets(self):
+        sentence = 'there is no erythema to be seen along the surgical site.'
+        markup = self.model.markup_sentence(sentence)
+        gated_markup = self.gated_model.markup_sentence(sentence)
+        self.assertEqual(sorted((n.getLiteral(), n.getSpan()) for n in markup.nodes()),
+                         sorted((n.getLiteral(), n.getSpan()) for n in gated_markup.nodes()))
+
+    def test_gated_matches_ungated_on_demo_corpus(self):
+        reports = glob.glob(os.path.join(DEMO_CORPUS, '*.txt'))
+        self.assertTrue(len(reports) > 0)
+        for report in reports:
+            document = ClinicalTextDocument(filepath=report)
+            document.annotate(self.model)
+            gated_document = ClinicalTextDocument(filepath=report)
+            gated_document.annotate(self.gated_model)
+            self.assertTrue(len(document.annotations['hai_detect']) > 0)
+            self.assertEqual(self._annotation_values(document), self._annotation_values(gated_document))
+            self.assertEqual(document.sentences_with_annotations, gated_document.sentences_with_annotations)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            targets = os.path.join(tmpdir, 'targets.tsv')
+            modifiers = os.path.join(tmpdir, 'modifiers.tsv')
+            shutil.copy(os.path.join(LEXICON_DIR, 'targets.tsv'), targets)
+            shutil.copy(os.path.join(LEXICON_DIR, 'modifiers.tsv'), modifiers)
+            snapshot = os.path.join(tmpdir, 'model.pickle')
+
+            model = MentionLevelModel.load(snapshot, targets, modifiers)
+            self.assertTrue(os.path.exists(snapshot))
+            loaded_model = MentionLevelModel.load(snapshot)
+            self.assertEqual(loaded_model.source_hash, model.source_hash)
+            self.assertEqual(loaded_model.lexicon_fingerprint, self.model.lexicon_fingerprint)
+            self.assertEqual(loaded_model.matcher.prefix_index, self.model.matcher.prefix_index)
+            sentence = 'there is no erythema to be seen along the surgical site.'
+            self.assertEqual(sorted((n.getLiteral(), n.getSpan()) for n in loaded_model.markup_sentence(sentence)),
+                             sorted((n.getLiteral(), n.getSpan()) for n in self.model.markup_sentence(sentence)))
+
+            # A snapshot of an older lexicon is rebuilt
+            with open(targets, 'a') as f:
+                f.write('\ncellulitis\tSURGICAL SITE\t\tbidirectional\t')
+            rebuilt_model = MentionLevelModel.load(snapshot)
+            self.assertNotEqual(rebuilt_model.source_hash, model.source_hash)
+            self.assertIn('cellulitis', [t.getLiteral() for t in rebuilt_model.targets])
+            self.assertEqual(MentionLevelModel.load(snapshot).source_hash, rebuilt_model.source_hash)
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_MentionLevelModel)
+    unittest.TextTestRunner(verbosity=2).run(suit)
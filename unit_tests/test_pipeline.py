@@ -0,0 +1,70 @@
+import unittest
+import os
+import glob
+import tempfile
+import time
+from unittest import mock
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
+import pipeline
+from pipeline import annotate_stream, AnnotatedDocument
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LEXICON_DIR = os.path.join(ROOT_DIR, 'lexicon')
+DEMO_CORPUS = os.path.join(ROOT_DIR, 'demo', 'corpus')
+
+
+class test_pipeline(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                      os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def test_annotate_texts(self):
+        texts = [('doc1', 'There is an abscess near the abdomen.'),
+                 ('doc2', 'There is abscess.'),
+                 ('doc3', 'The patient has a history of wound infection.')]
+        results = list(annotate_stream(iter(texts), self.model, queue_size=1))
+        self.assertEqual([r.rpt_id for r in results], ['doc1', 'doc2', 'doc3'])
+        self.assertIsInstance(results[0], AnnotatedDocument)
+        self.assertEqual(results[0].annotations[0].classification, 'Positive Evidence of SSI')
+        self.assertEqual(len(results[1].annotations), 0)
+        self.assertEqual(results[2].annotations[0].classification, 'Positive Evidence of SSI - Historical')
+
+    def test_annotate_files(self):
+        reports = glob.glob(os.path.join(DEMO_CORPUS, '*.txt'))
+        with tempfile.TemporaryDirectory() as outdir:
+            results = list(annotate_stream(reports, self.model, outdir=outdir))
+            document = ClinicalTextDocument(filepath=reports[0])
+            document.annotate(self.model)
+            self.assertEqual([a.classification for a in results[0].annotations],
+                             [a.classification for a in document.annotations['hai_detect']])
+            self.assertTrue(os.path.exists(os.path.join(outdir, results[0].rpt_id + '.txt.knowtator.xml')))
+
+    def test_stop_early(self):
+        texts = (('doc{}'.format(i), 'There is an abscess.') for i in range(100))
+        stream = annotate_stream(texts, self.model, queue_size=2)
+        self.assertEqual(next(stream).rpt_id, 'doc0')
+        stream.close()
+
+    def test_slow_reader_exit(self):
+        # The reader has put the end of the stream but hasn't returned yet
+        fill_queue = pipeline._fill_queue
+        def slow_fill_queue(*args):
+            fill_queue(*args)
+            time.sleep(0.5)
+        texts = [('doc{}'.format(i), 'There is an abscess.') for i in range(3)]
+        with mock.patch.object(pipeline, '_fill_queue', slow_fill_queue):
+            results = list(annotate_stream(iter(texts), self.model))
+        self.assertEqual([r.rpt_id for r in results], ['doc0', 'doc1', 'doc2'])
+
+    def test_reader_error(self):
+        with self.assertRaises(FileNotFoundError):
+            list(annotate_stream(['does_not_exist.txt'], self.model))
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_pipeline)
+    unittest.TextTestRunner(verbosity=2).run(suit)
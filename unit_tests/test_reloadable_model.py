@@ -0,0 +1,97 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
+from models.reloadable_model import ReloadableModel
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+TEXT = 'There is an abscess near the wound. The patient has a fistula.'
+
+
+class test_ReloadableModel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.targets = os.path.join(self.tmpdir.name, 'targets.tsv')
+        self.modifiers = os.path.join(self.tmpdir.name, 'modifiers.tsv')
+        shutil.copy(os.path.join(LEXICON_DIR, 'targets.tsv'), self.targets)
+        shutil.copy(os.path.join(LEXICON_DIR, 'modifiers.tsv'), self.modifiers)
+        self.model = ReloadableModel(self.targets, self.modifiers)
+
+    def tearDown(self):
+        self.model.stop()
+        self.tmpdir.cleanup()
+        # Put back the expressions of the original lexicon in pyConText's cache
+        MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'), os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def _add_target(self, line='\nfistula\tPNEUMONIA\t\tbidirectional\t'):
+        with open(self.targets, 'a') as f:
+            f.write(line)
+
+    def _get_classes(self, model):
+        document = ClinicalTextDocument(TEXT, rpt_id='report')
+        document.annotate(model)
+        return [(a.sentence_num, a.annotation_type, a.lexicon_version) for a in document.annotations['hai_detect']]
+
+    def test_reload(self):
+        old_model = self.model.pin()
+        old_version = self.model.lexicon_version
+        self.assertEqual(self._get_classes(self.model), [(0, 'Evidence of SSI', old_version)])
+        self.assertFalse(self.model.reload())
+
+        self._add_target()
+        self.assertTrue(self.model.reload())
+        self.assertIsNot(self.model.pin(), old_model)
+        self.assertNotEqual(self.model.lexicon_version, old_version)
+        new_version = self.model.lexicon_version
+        self.assertEqual(self._get_classes(self.model), [(0, 'Evidence of SSI', new_version),
+                                                         (1, 'Evidence of Pneumonia', new_version)])
+        # A document that started with the old model is finished with it
+        self.assertEqual(self._get_classes(old_model), [(0, 'Evidence of SSI', old_version)])
+        self.assertEqual(self.model.num_reloads, 1)
+
+    def test_old_model_keeps_expressions(self):
+        old_model = self.model.pin()
+        with open(self.targets) as f:
+            lines = f.readlines()
+        # Make the expression of an existing literal match 'fistula'
+        lines = [line.replace('\\b(intra[ -]?)?abd(omen|ominal)?\\b', '\\bfistula\\b') for line in lines]
+        with open(self.targets, 'w') as f:
+            f.writelines(lines)
+        self.assertTrue(self.model.reload())
+        markup = old_model.markup_sentence('the fistula is clean.')
+        self.assertEqual([t.getLiteral() for t in markup.getMarkedTargets()], [])
+        markup = self.model.pin().markup_sentence('the fistula is clean.')
+        self.assertEqual([t.getLiteral() for t in markup.getMarkedTargets()], ['abdomen'])
+
+    def test_invalid_lexicon(self):
+        old_model = self.model.pin()
+        with open(self.targets, 'w') as f:
+            f.write('Lex\tType\tRegex\tDirection\n')
+        with self.assertRaises(ValueError):
+            self.model.reload()
+        self.assertIs(self.model.pin(), old_model)
+        self.model.reload_in_background().join()
+        self.assertIsInstance(self.model.last_error, ValueError)
+        self.assertIs(self.model.pin(), old_model)
+
+    def test_watch(self):
+        old_version = self.model.lexicon_version
+        self.model.watch(interval=0.01)
+        self._add_target()
+        for _ in range(500):
+            if self.model.num_reloads:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.model.num_reloads, 1)
+        self.assertNotEqual(self.model.lexicon_version, old_version)
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_ReloadableModel)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,71 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+
+from lxml import etree
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
+from models.result_cache import ResultCache
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+TEXT = 'There is an abscess near the wound. He has a history of pneumonia. The incision is CDI.'
+
+
+class test_ResultCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                      os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.tmpdir.name, 'cache'), self.model)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _xml(self, document):
+        return etree.tostring(document.to_etree(), encoding='unicode')
+
+    def test_unchanged_document_skips_annotation(self):
+        first = ClinicalTextDocument(TEXT, rpt_id='report')
+        self.assertFalse(self.cache.annotate(first, self.model))
+        self.assertGreater(len(first.annotations['hai_detect']), 0)
+
+        second = ClinicalTextDocument(TEXT, rpt_id='report')
+        with mock.patch.object(ClinicalTextDocument, 'annotate') as annotate:
+            self.assertTrue(self.cache.annotate(second, self.model))
+            annotate.assert_not_called()
+        self.assertEqual(self._xml(first), self._xml(second))
+        self.assertEqual(second.sentences_with_annotations, first.sentences_with_annotations)
+        self.assertIs(second.annotations['hai_detect'][0]._document_text, second.raw_text)
+        self.assertEqual(self.cache.get_stats(), {'hits': 1, 'misses': 1})
+
+    def test_changed_document(self):
+        self.cache.annotate(ClinicalTextDocument(TEXT, rpt_id='report'), self.model)
+        changed = ClinicalTextDocument(TEXT + ' No erythema.', rpt_id='report')
+        self.assertFalse(self.cache.annotate(changed, self.model))
+
+    def test_same_text_different_report(self):
+        self.cache.annotate(ClinicalTextDocument(TEXT, rpt_id='report'), self.model)
+        other = ClinicalTextDocument(TEXT, rpt_id='other')
+        self.assertTrue(self.cache.annotate(other, self.model))
+        self.assertEqual({a.rpt_id for a in other.annotations['hai_detect']}, {'other'})
+
+    def test_changed_lexicon(self):
+        self.cache.annotate(ClinicalTextDocument(TEXT, rpt_id='report'), self.model)
+        self.model.source_hash, source_hash = 'changed', self.model.source_hash
+        try:
+            cache = ResultCache(self.cache.cache_dir, self.model)
+        finally:
+            self.model.source_hash = source_hash
+        self.assertFalse(cache.annotate(ClinicalTextDocument(TEXT, rpt_id='report'), self.model))
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_ResultCache)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,145 @@
+import unittest
+import os
+import tempfile
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
+from models.markup_cache import normalize_sentence
+from models.result_cache import ResultCache
+from models.lexicon_index import LexiconIndex
+from models.sentence_guard import SentenceGuard
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+
+# A flowsheet without any punctuation is split into a single sentence
+FLOWSHEET_ROW = 'bp 120 80 hr 88 rr 16 temp 37 spo2 98 '
+
+
+def get_flowsheet(finding, num_rows=40, row_num=25):
+    rows = [FLOWSHEET_ROW] * num_rows
+    rows[row_num] = FLOWSHEET_ROW + finding + ' '
+    return ''.join(rows)
+
+
+class test_SentenceGuard(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                      os.path.join(LEXICON_DIR, 'modifiers.tsv'), gate_on_targets=True)
+
+    def setUp(self):
+        self.guard = SentenceGuard(max_tokens=50, overlap=10, time_budget=None)
+        self.model.guard = self.guard
+
+    def tearDown(self):
+        self.model.guard = None
+
+    def _get_annotations(self, text):
+        document = ClinicalTextDocument(text, rpt_id='report')
+        document.annotate(self.model)
+        return document, document.annotations['hai_detect']
+
+    def _get_classes(self, annotations):
+        return [(a.sentence_num, a.annotation_type, a.classification) for a in annotations]
+
+    def test_get_windows(self):
+        text = ' '.join(str(i) for i in range(10))
+        windows = self.guard.get_windows(text, 4, 1)
+        self.assertEqual([text[start:end] for start, end in windows], ['0 1 2 3', '3 4 5 6', '6 7 8 9'])
+        self.assertEqual(self.guard.get_windows(text, 10, 1), [(0, len(text))])
+        with self.assertRaises(ValueError):
+            SentenceGuard(max_tokens=10, overlap=10)
+
+    def test_short_sentences(self):
+        text = 'There is an abscess near the wound. No evidence of pneumonia.'
+        expected = self._get_classes(self._get_annotations(text)[1])
+        self.model.guard = None
+        self.assertEqual(self._get_classes(self._get_annotations(text)[1]), expected)
+        self.assertEqual(self.guard.num_windowed, 0)
+
+    def test_long_sentence(self):
+        for finding in ('there is an abscess near the wound', 'no evidence of abscess near the wound'):
+            text = get_flowsheet(finding)
+            self.model.guard = None
+            expected = self._get_classes(self._get_annotations(text)[1])
+            self.assertEqual(len(expected), 1)
+            self.model.guard = self.guard
+            document, annotations = self._get_annotations(text)
+            self.assertEqual(len(document.sentences), 1)
+            self.assertEqual(self._get_classes(annotations), expected)
+            # The span is in the sentence, not in the window
+            start, end = annotations[0].span_in_sentence
+            self.assertIn('abscess', normalize_sentence(document.sentences[0]['text'])[start:end])
+        self.assertEqual(self.guard.num_windowed, 2)
+        self.assertEqual(self.guard.num_degraded, 0)
+
+    def test_finding_at_window_boundary(self):
+        # The finding starts a few tokens before the end of the first window
+        text = FLOWSHEET_ROW * 4 + 'no evidence of abscess near the wound ' + FLOWSHEET_ROW * 8
+        self.model.guard = None
+        expected = self._get_classes(self._get_annotations(text)[1])
+        self.model.guard = self.guard
+        self.assertEqual(self._get_classes(self._get_annotations(text)[1]), expected)
+
+    def test_time_budget(self):
+        self.guard.time_budget = 0
+        self.model.guard = None
+        expected = self._get_classes(self._get_annotations(get_flowsheet('there is an abscess'))[1])
+        self.model.guard = self.guard
+        self.assertEqual(self._get_classes(self._get_annotations(get_flowsheet('there is an abscess'))[1]),
+                         expected)
+        self.assertEqual(self.guard.num_windowed, 1)
+        self.assertEqual(self.guard.num_degraded, 1)
+
+    def test_cached_results(self):
+        # The modifier is too far from the target to be in the same window
+        text = 'history of ' + 'bp 120 hr 80 ' * 40 + 'pneumonia'
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.model.guard = None
+            cache = ResultCache(tmpdir, self.model)
+            document = ClinicalTextDocument(text, rpt_id='report')
+            cache.annotate(document, self.model)
+            unguarded = self._get_classes(document.annotations['hai_detect'])
+
+            self.model.guard = self.guard
+            cache = ResultCache(tmpdir, self.model)
+            document = ClinicalTextDocument(text, rpt_id='report')
+            self.assertFalse(cache.annotate(document, self.model))
+            guarded = self._get_classes(document.annotations['hai_detect'])
+            self.assertNotEqual(guarded, unguarded)
+            self.assertEqual(guarded, self._get_classes(self._get_annotations(text)[1]))
+
+            # Degraded documents aren't cached
+            self.guard.time_budget = 0
+            cache = ResultCache(tmpdir, self.model)
+            document = ClinicalTextDocument(text + ' ', rpt_id='report')
+            self.assertFalse(cache.annotate(document, self.model))
+            self.assertEqual(document.degraded_sentences, {0})
+            document = ClinicalTextDocument(text + ' ', rpt_id='report')
+            self.assertFalse(cache.annotate(document, self.model))
+
+    def test_lexicon_index(self):
+        text = 'history of ' + 'bp 120 hr 80 ' * 40 + 'pneumonia'
+        index = LexiconIndex()
+        self.model.guard = None
+        documents = [ClinicalTextDocument(text, rpt_id='report')]
+        index.annotate_documents(documents, self.model)
+        unguarded = self._get_classes(documents[0].annotations['hai_detect'])
+
+        # Changing the guard annotates every document again
+        self.model.guard = self.guard
+        documents = [ClinicalTextDocument(text, rpt_id='report')]
+        self.assertEqual(index.annotate_documents(documents, self.model), 1)
+        self.assertNotEqual(self._get_classes(documents[0].annotations['hai_detect']), unguarded)
+        self.assertIsNotNone(index.documents['report'][2])
+
+        self.guard.time_budget = 0
+        index = LexiconIndex()
+        index.annotate_documents([ClinicalTextDocument(text, rpt_id='report')], self.model)
+        self.assertIsNone(index.documents['report'][2])
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_SentenceGuard)
+    unittest.TextTestRunner(verbosity=2).run(suit)
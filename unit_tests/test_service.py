@@ -0,0 +1,192 @@
+import unittest
+import os
+import json
+import asyncio
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from annotations.AnnotationExport import get_record
+from models.mention_level_models import MentionLevelModel
+from service import AnnotationService, ServiceBusy, BatchTooLarge
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lexicon')
+TEXT = 'There is an abscess near the wound. He has a history of pneumonia.'
+
+
+def without_ids(annotations):
+    # Every annotation gets a new random id
+    return [{key: value for key, value in row.items() if key != 'id'} for row in annotations]
+
+
+async def request(port, method, path, body=None):
+    """
+    Sends one request and returns (status, headers, dictionary).
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode('utf-8') if body is not None else b''
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+        method, path, len(payload)).encode('latin-1') + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, json.loads(payload.decode('utf-8'))
+
+
+async def send_raw(port, data):
+    """
+    Sends `data` as is and returns the status of the response, or None if there wasn't one.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    if not response:
+        return None
+    return int(response.split(b'\r\n', 1)[0].split()[1])
+
+
+class CrashingModel(object):
+    """
+    Kills any worker process that annotates with it.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.pid = os.getpid()
+
+    @property
+    def lexicon_version(self):
+        return self.model.lexicon_version
+
+    def pin(self):
+        if os.getpid() != self.pid:
+            os._exit(1)
+        return self.model
+
+
+class test_service(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = MentionLevelModel(os.path.join(LEXICON_DIR, 'targets.tsv'),
+                                      os.path.join(LEXICON_DIR, 'modifiers.tsv'))
+        document = ClinicalTextDocument(TEXT, rpt_id='doc0')
+        document.annotate(cls.model)
+        cls.expected = without_ids(get_record(annotation) for annotation in document.annotations['hai_detect'])
+
+    def setUp(self):
+        self.service = AnnotationService({'default': self.model}, workers=0)
+
+    def tearDown(self):
+        self.service.close()
+
+    def run_with_server(self, coroutine):
+        async def run():
+            server = await self.service.start(port=0)
+            async with server:
+                return await coroutine(server.sockets[0].getsockname()[1])
+        return asyncio.run(run())
+
+    def test_annotate(self):
+        async def run(port):
+            return await request(port, 'POST', '/annotate', {'rpt_id': 'doc0', 'text': TEXT})
+        status, headers, response = self.run_with_server(run)
+        self.assertEqual(status, 200)
+        self.assertEqual(response['results'][0]['rpt_id'], 'doc0')
+        self.assertEqual(without_ids(response['results'][0]['annotations']), self.expected)
+
+    def test_batch_knowtator(self):
+        notes = [{'rpt_id': 'doc{}'.format(i), 'text': TEXT} for i in range(3)]
+        async def run(port):
+            return await request(port, 'POST', '/annotate', {'notes': notes, 'format': 'knowtator'})
+        status, headers, response = self.run_with_server(run)
+        self.assertEqual(status, 200)
+        self.assertEqual([result['rpt_id'] for result in response['results']], ['doc0', 'doc1', 'doc2'])
+        self.assertTrue(response['results'][2]['knowtator'].startswith('<annotations textSource="doc2.txt">'))
+
+    def test_errors(self):
+        async def run(port):
+            return [await request(port, 'POST', '/annotate', {'text': TEXT, 'model': 'missing'}),
+                    await request(port, 'POST', '/annotate', {'rpt_id': 'doc0'}),
+                    await request(port, 'GET', '/annotate'),
+                    await request(port, 'GET', '/missing')]
+        statuses = [status for status, headers, response in self.run_with_server(run)]
+        self.assertEqual(statuses, [400, 400, 405, 404])
+
+    def test_malformed_requests(self):
+        async def run(port):
+            return [await send_raw(port, b'GARBAGE\r\n'),
+                    await send_raw(port, b'GET /health HTTP/1.1 extra\r\n\r\n'),
+                    await send_raw(port, b'POST /annotate HTTP/1.1\r\nContent-Length: ten\r\n\r\n'),
+                    await send_raw(port, b'POST /annotate HTTP/1.1\r\nContent-Length: -1\r\n\r\n'),
+                    await send_raw(port, b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')]
+        self.assertEqual(self.run_with_server(run), [400, 400, 400, 400, 200])
+
+    def test_coalescing(self):
+        async def run(port):
+            responses = await asyncio.gather(*[request(port, 'POST', '/annotate', {'rpt_id': 'doc0', 'text': TEXT})
+                                               for _ in range(5)])
+            return responses, (await request(port, 'GET', '/health'))[2]
+        responses, health = self.run_with_server(run)
+        self.assertTrue(all(without_ids(response['results'][0]['annotations']) == self.expected
+                            for status, headers, response in responses))
+        self.assertEqual(health['annotated'] + health['coalesced'], 5)
+        self.assertGreater(health['coalesced'], 0)
+        self.assertEqual(health['pending'], 0)
+        self.assertEqual(health['lexicon_versions'], {'default': self.model.lexicon_version})
+
+    def test_backpressure(self):
+        self.service.max_pending = 2
+        # Notes that are submitted wait until they're flushed
+        self.service.batch_delay = 60
+        notes = [('doc{}'.format(i), TEXT) for i in range(3)]
+        async def run():
+            with self.assertRaises(BatchTooLarge):
+                await self.service.annotate(notes)
+            waiting = [self.service.submit('default', rpt_id, text) for rpt_id, text in notes[:2]]
+            with self.assertRaises(ServiceBusy):
+                await self.service.annotate(notes[2:])
+            self.service._flush('default', 'json')
+            await asyncio.gather(*waiting)
+            self.service.batch_delay = 0.002
+            return await self.service.annotate(notes[:2])
+        results = asyncio.run(run())
+        self.assertEqual([result['rpt_id'] for result in results], ['doc0', 'doc1'])
+
+        async def run_request(port):
+            self.service.batch_delay = 60
+            waiting = [self.service.submit('default', rpt_id, text) for rpt_id, text in notes[:2]]
+            busy = await request(port, 'POST', '/annotate', {'text': TEXT})
+            self.service._flush('default', 'json')
+            await asyncio.gather(*waiting)
+            return busy, await request(port, 'POST', '/annotate', {'notes': [{'text': TEXT}] * 3})
+        busy, too_large = self.run_with_server(run_request)
+        self.assertEqual(busy[0], 503)
+        self.assertEqual(busy[1]['Retry-After'], '1')
+        self.assertEqual(too_large[0], 413)
+        self.assertNotIn('Retry-After', too_large[1])
+
+    def test_worker_dies(self):
+        self.service.close()
+        self.service = AnnotationService({'default': self.model, 'crash': CrashingModel(self.model)}, workers=1)
+        async def run(port):
+            crashed = await request(port, 'POST', '/annotate', {'text': TEXT, 'model': 'crash'})
+            # The pool is replaced, so the next request is annotated as usual
+            annotated = await asyncio.wait_for(request(port, 'POST', '/annotate', {'rpt_id': 'doc0', 'text': TEXT}),
+                                               timeout=60)
+            return crashed, annotated, (await request(port, 'GET', '/health'))[2]
+        crashed, annotated, health = self.run_with_server(run)
+        self.assertEqual(crashed[0], 500)
+        self.assertEqual(annotated[0], 200)
+        self.assertEqual(without_ids(annotated[2]['results'][0]['annotations']), self.expected)
+        self.assertEqual(health['pending'], 0)
+        self.assertEqual(health['restarts'], 1)
+        self.assertEqual(self.service.in_flight, {})
+
+
+if __name__ == '__main__':
+    suit = unittest.TestLoader().loadTestsFromTestCase(test_service)
+    unittest.TextTestRunner(verbosity=2).run(suit)
@@ -0,0 +1,121 @@
+"""
+This script annotates the notes in epic.sqlite directly from the database
+instead of saving every note to a .txt file first.
+Notes are read from `epic_notes` in batches and the annotations are written
+back to a new table `hai_annotations`, one transaction per batch.
+Usage: python -m utils.data_wrangling.annotate_sqlite /path/to/epic.sqlite [--batch-size N]
+"""
+
+import os
+import argparse
+import sqlite3 as sqlite
+
+from annotations.ClinicalTextDocument import ClinicalTextDocument
+from models.mention_level_models import MentionLevelModel
+from utils import helpers
+
+
+ANNOTATION_COLUMNS = ['rpt_id', 'annotation_id', 'sentence_num', 'span_start', 'span_end',
+                      'annotation_type', 'assertion', 'temporality', 'ssi_class', 'classification',
+                      'text', 'creation_date']
+
+
+def create_annotations_table(con, table='hai_annotations'):
+    """
+    Creates the table that annotations are saved to if it doesn't already exist.
+    """
+    con.execute("""CREATE TABLE IF NOT EXISTS {table} (
+                    rpt_id TEXT, annotation_id TEXT, sentence_num INTEGER, span_start INTEGER, span_end INTEGER,
+                    annotation_type TEXT, assertion TEXT, temporality TEXT, ssi_class TEXT, classification TEXT,
+                    text TEXT, creation_date TEXT)""".format(table=table))
+    con.execute("CREATE INDEX IF NOT EXISTS {table}_rpt_id ON {table} (rpt_id)".format(table=table))
+    con.commit()
+
+
+def iter_note_batches(con, batch_size=1000, min_length=100, preprocess=False):
+    """
+    Yields lists of up to `batch_size` (NOTE_ID, NOTE) tuples
+    for every note in epic_notes with at least `min_length` characters.
+    Each batch is a separate query that starts after the last rowid of the previous batch,
+    so no statement is left open while annotations are committed on the same connection
+    and the whole table is never in memory.
+    If `preprocess` is True, new lines are added before headers with `helpers.preprocess_human`.
+    """
+    last_rowid = -1
+    while True:
+        cursor = con.execute("SELECT rowid, NOTE_ID, NOTE FROM epic_notes "
+                             "WHERE rowid > ? AND LENGTH(NOTE) >= ? ORDER BY rowid LIMIT ?",
+                             (last_rowid, min_length, batch_size))
+        rows = cursor.fetchmany(batch_size)
+        cursor.close()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        if preprocess:
+            yield [(str(note_id), helpers.preprocess_human(note)) for (rowid, note_id, note) in rows]
+        else:
+            yield [(str(note_id), note) for (rowid, note_id, note) in rows]
+
+
+def annotation_to_row(annotation):
+    """
+    Returns a tuple of the values in ANNOTATION_COLUMNS for a single Annotation.
+    """
+    return (annotation.rpt_id, annotation.id, annotation.sentence_num,
+            annotation.span_in_document[0], annotation.span_in_document[1],
+            annotation.annotation_type, annotation.attributes.get('assertion'),
+            annotation.attributes.get('temporality'), annotation.attributes.get('ssi_class'),
+            annotation.classification, annotation.text, annotation.datetime)
+
+
+def write_batch(con, note_ids, rows, table='hai_annotations'):
+    """
+    Replaces the annotations for `note_ids` with `rows` in a single transaction.
+    """
+    with con:
+        con.executemany("DELETE FROM {} WHERE rpt_id = ?".format(table), [(note_id,) for note_id in note_ids])
+        con.executemany("INSERT INTO {} ({}) VALUES ({})".format(
+            table, ', '.join(ANNOTATION_COLUMNS), ', '.join(['?'] * len(ANNOTATION_COLUMNS))), rows)
+
+
+def annotate_database(con, model, batch_size=1000, table='hai_annotations', preprocess=False):
+    """
+    Annotates every note in epic_notes with `model`
+    and saves the annotations to `table`, committing once per `batch_size` notes.
+    Returns the number of notes and annotations.
+    """
+    create_annotations_table(con, table)
+    num_notes = 0
+    num_annotations = 0
+    for notes in iter_note_batches(con, batch_size, preprocess=preprocess):
+        rows = []
+        for note_id, note in notes:
+            document = ClinicalTextDocument(note, rpt_id=note_id)
+            document.annotate(model)
+            rows.extend(annotation_to_row(annotation) for annotation in document.annotations['hai_detect'])
+        write_batch(con, [note_id for (note_id, note) in notes], rows, table)
+        num_notes += len(notes)
+        num_annotations += len(rows)
+        print("{} notes, {} annotations".format(num_notes, num_annotations))
+    return num_notes, num_annotations
+
+
+def main():
+    con = sqlite.connect(args.db)
+    targets = os.path.abspath('lexicon/targets.tsv')
+    modifiers = os.path.abspath('lexicon/modifiers.tsv')
+    model = MentionLevelModel(targets, modifiers, gate_on_targets=True)
+    num_notes, num_annotations = annotate_database(con, model, args.batch_size, preprocess=args.preprocess)
+    print("Saved {} annotations from {} notes".format(num_annotations, num_notes))
+    con.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('db', help="the path to epic.sqlite")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="the number of notes to read and save in each transaction")
+    parser.add_argument('--preprocess', action='store_true',
+                        help="add new lines before headers like the notes saved by save_notes_to_files.py")
+    args = parser.parse_args()
+    main()
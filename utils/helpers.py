@@ -5,18 +5,21 @@ for text processing
 import sys
 import re
 
+# Headers that `preprocess_human` puts on new lines
+HEADER_PATTERNS = [r'Review of Systems:',  r'Physical Exam(ination)?:', r'(Patient )?(Active )?Problem List',
+                   r'Risks and benefits:', r'Time out:', r'Chief Complaint:', r'Marital Status:', 'Attending Physician:',
+                   'Events of last 24 hours:', 'Current Medications:', 'Years of Education:', 'Current Unit:',
+                   'Cardio Rate:',  'Assessment (and|&) Plan:', 'Plan:','Patient Instructions:', 'Patient Education:',
+                   'General:',
+                   ]
+
 def preprocess_human(text):
     """
     Adds new lines before all headers
     in order to make the text more readable
     """
     text = re.sub('\n', '', text) # Get rid of the old new lines that I'd put in
-    header_patterns = [r'Review of Systems:',  r'Physical Exam(ination)?:', r'(Patient )?(Active )?Problem List',
-                       r'Risks and benefits:', r'Time out:', r'Chief Complaint:', r'Marital Status:', 'Attending Physician:',
-                       'Events of last 24 hours:', 'Current Medications:', 'Years of Education:', 'Current Unit:',
-                       'Cardio Rate:',  'Assessment (and|&) Plan:', 'Plan:','Patient Instructions:', 'Patient Education:',
-                       'General:',
-                       ]
+    header_patterns = list(HEADER_PATTERNS)
     default_header = r'([\s]{2,}([a-z ]*){1,2}:)' #  Simple default header pattern that will grab words followed by colons
     header_patterns.append(default_header)
     #header = re.compile(default_header, flags=re.IGNORECASE)